@@ -0,0 +1,99 @@
+"""
+batch_score_benchmark.py
+Measures the rows per second of the offline batch scoring job as worker
+processes are added.
+
+The input is synthetic hour.csv-shaped data (src/synthetic_data.py) and the
+model a decision tree fitted on hour.csv, saved in the memory-mapped format.
+Each worker count scores the whole file into a fresh output directory.
+
+Usage:
+    python benchmarks/batch_score_benchmark.py [--years 10 --stations 20]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import pandas as pd
+from sklearn.tree import DecisionTreeRegressor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(ROOT, "src"))
+
+# pylint: disable=wrong-import-position
+from batch_score import resolve_model, score_file
+from features import DEFAULT_TRANSFORMER
+from model_format import MODEL_EXTENSION, save_model
+from synthetic_data import write_synthetic
+
+DATA_PATH = os.path.join(ROOT, "data", "hour.csv")
+
+
+def worker_counts(limit):
+    counts, count = [], 1
+    while count < limit:
+        counts.append(count)
+        count *= 2
+    return counts + [limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--stations", type=int, default=20)
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--format", choices=["csv", "parquet"], default="parquet", help="Input format"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, f"hour.{args.format}")
+        rows = write_synthetic(source, years=args.years, stations=args.stations)
+
+        df = pd.read_csv(DATA_PATH)
+        model = DecisionTreeRegressor(random_state=0).fit(
+            DEFAULT_TRANSFORMER.transform(df), df["cnt"]
+        )
+        model_path = os.path.join(tmp_dir, f"DecisionTreeRegressor{MODEL_EXTENSION}")
+        save_model(model, model_path)
+        model_source = resolve_model(model_path)
+
+        results = []
+        for workers in worker_counts(args.max_workers):
+            stats = score_file(
+                source,
+                os.path.join(tmp_dir, f"predictions-{workers}"),
+                model_source,
+                workers=workers,
+                chunk_rows=args.chunk_rows,
+            )
+            results.append(
+                {
+                    "workers": workers,
+                    "seconds": round(stats["seconds"], 3),
+                    "rows_per_second": round(stats["rows_per_second"]),
+                    "speedup": round(
+                        (
+                            stats["rows_per_second"] / results[0]["rows_per_second"]
+                            if results
+                            else 1.0
+                        ),
+                        2,
+                    ),
+                }
+            )
+
+    print(
+        json.dumps(
+            {"rows": rows, "cpu_count": os.cpu_count(), "runs": results}, indent=2
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+drift_engine_benchmark.py
+Times the native drift engine against the Evidently report on the daily
+windows of hour.csv, as the monitoring backfill computes them, and checks
+that both produce the same window metrics.
+
+Predictions come from a decision tree fitted on hour.csv so the prediction
+column looks like the one the monitoring job scores. Evidently is optional;
+without it only the native engine is timed.
+
+With ``--sampled-years`` the sampled engine is also compared with the native
+one on the seasonal windows of that many years of synthetic data from
+``--stations`` stations, windows large enough to be sampled.
+
+Usage:
+    python benchmarks/drift_engine_benchmark.py [--windows 100]
+    python benchmarks/drift_engine_benchmark.py --sampled-years 2 --stations 100
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+import pandas as pd
+from sklearn.tree import DecisionTreeRegressor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(ROOT, "src"))
+sys.path.append(os.path.join(ROOT, "monitoring"))
+
+# pylint: disable=wrong-import-position
+from drift_engine import DriftEngine
+from reference_profile import load_or_build_profile
+from sampled_drift import SampledDriftEngine
+
+from features import FEATURES
+from synthetic_data import fit_profile, generate_chunks
+
+DATA_PATH = os.path.join(ROOT, "data", "hour.csv")
+REFERENCE_PATH = os.path.join(ROOT, "data", "reference.csv")
+
+
+def load_windows(limit):
+    df = pd.read_csv(DATA_PATH)
+    model = DecisionTreeRegressor(max_depth=10, random_state=0)
+    model.fit(df[FEATURES], df["cnt"])
+    df["prediction"] = model.predict(df[FEATURES])
+    windows = [rows for _, rows in df.groupby("dteday", sort=True)]
+    step = max(1, len(windows) // limit)
+    return windows[::step][:limit]
+
+
+def time_native(windows):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        profile = load_or_build_profile(
+            REFERENCE_PATH, FEATURES + ["prediction"], cache_dir
+        )
+        engine = DriftEngine(profile)
+        setup = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows = [engine.window_metrics(window) for window in windows]
+        elapsed = time.perf_counter() - start
+    return setup, elapsed, rows
+
+
+def time_sampled(years, stations):
+    """Time exact and sampled scoring of seasonal synthetic windows."""
+    df = pd.concat(
+        generate_chunks(fit_profile(DATA_PATH), years=years, stations=stations),
+        ignore_index=True,
+    )
+    model = DecisionTreeRegressor(max_depth=10, random_state=0)
+    model.fit(df[FEATURES], df["cnt"])
+    df["prediction"] = model.predict(df[FEATURES])
+    windows = [rows for _, rows in df.groupby(["yr", "season"], sort=True)]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        engine = DriftEngine(
+            load_or_build_profile(REFERENCE_PATH, FEATURES + ["prediction"], cache_dir)
+        )
+        sampled = SampledDriftEngine(engine)
+        results = {"windows": len(windows), "rows_per_window": len(df) // len(windows)}
+        for name, scorer in (("native", engine), ("sampled", sampled)):
+            start = time.perf_counter()
+            results[name] = [scorer.compute(window) for window in windows]
+            results[f"{name}_per_window_ms"] = (
+                (time.perf_counter() - start) / len(windows) * 1000
+            )
+    exact, approximate = results.pop("native"), results.pop("sampled")
+    results["speedup"] = (
+        results["native_per_window_ms"] / results["sampled_per_window_ms"]
+    )
+    results["mean_sample_rows"] = sum(r["sample_rows"] for r in approximate) / len(
+        approximate
+    )
+    results["verdict_mismatches"] = int(
+        sum((a["drifted"] != b["drifted"]).sum() for a, b in zip(exact, approximate))
+    )
+    results["undecided_columns"] = int(sum(r["undecided"].sum() for r in approximate))
+    results["max_score_diff"] = float(
+        max(abs(a["score"] - b["score"]).max() for a, b in zip(exact, approximate))
+    )
+    return results
+
+
+def time_evidently(windows):
+    # pylint: disable=import-outside-toplevel
+    start = time.perf_counter()
+    from evidently import ColumnMapping
+    from evidently.metrics import (
+        ColumnDriftMetric,
+        DatasetDriftMetric,
+        DatasetMissingValuesMetric,
+    )
+    from evidently.report import Report
+
+    reference = pd.read_csv(REFERENCE_PATH)
+    mapping = ColumnMapping(
+        prediction="prediction", numerical_features=FEATURES, target=None
+    )
+    setup = time.perf_counter() - start
+
+    rows = []
+    start = time.perf_counter()
+    for window in windows:
+        report = Report(
+            metrics=[
+                ColumnDriftMetric(column_name="prediction"),
+                DatasetDriftMetric(),
+                DatasetMissingValuesMetric(),
+            ]
+        )
+        report.run(
+            reference_data=reference, current_data=window, column_mapping=mapping
+        )
+        result = report.as_dict()["metrics"]
+        rows.append(
+            (
+                result[0]["result"]["drift_score"],
+                result[1]["result"]["number_of_drifted_columns"],
+                result[2]["result"]["current"]["share_of_missing_values"],
+            )
+        )
+    elapsed = time.perf_counter() - start
+    return setup, elapsed, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--windows", type=int, default=100)
+    parser.add_argument("--sampled-years", type=int, default=None)
+    parser.add_argument("--stations", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.sampled_years:
+        print(json.dumps(time_sampled(args.sampled_years, args.stations), indent=2))
+        return
+
+    windows = load_windows(args.windows)
+    results = {"windows": len(windows)}
+
+    setup, elapsed, native = time_native(windows)
+    results["native"] = {
+        "setup_s": setup,
+        "per_window_ms": elapsed / len(windows) * 1000,
+    }
+
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            setup, elapsed, reference = time_evidently(windows)
+    except ImportError:
+        print("evidently is not installed; timing the native engine only")
+    else:
+        results["evidently"] = {
+            "setup_s": setup,
+            "per_window_ms": elapsed / len(windows) * 1000,
+        }
+        results["speedup"] = (
+            results["evidently"]["per_window_ms"] / results["native"]["per_window_ms"]
+        )
+        results["max_prediction_drift_diff"] = max(
+            abs(a[0] - b[0]) for a, b in zip(native, reference)
+        )
+        results["drifted_columns_mismatches"] = sum(
+            a[1] != b[1] for a, b in zip(native, reference)
+        )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
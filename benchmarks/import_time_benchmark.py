@@ -0,0 +1,136 @@
+"""
+import_time_benchmark.py
+Measures how long importing each project module takes and checks it against
+a per-module budget.
+
+Every module is imported in a fresh interpreter with ``python -X importtime``;
+the cumulative time of the module itself is kept, best of ``--repeat`` runs.
+An import must also leave MLflow, Evidently and scikit-learn unloaded: they
+are imported by the functions that use them, never at module level.
+
+With ``--check`` the script exits with status 1 when a module is over its
+budget, loads one of those libraries or fails to import; CI runs it that way.
+
+Usage:
+    python benchmarks/import_time_benchmark.py [--repeat 3] [--check]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SEARCH_PATH = [
+    ROOT,
+    os.path.join(ROOT, "src"),
+    os.path.join(ROOT, "monitoring"),
+    os.path.join(ROOT, "web_service"),
+]
+
+# Cumulative import time budgets in milliseconds, with headroom for slower
+# CI machines. prefect alone accounts for most of the flow modules' time.
+BUDGETS_MS = {
+    "features": 300,
+    "artifact_cache": 100,
+    "model_format": 300,
+    "dataset_partitions": 800,
+    "synthetic_data": 800,
+    "batch_score": 800,
+    "trainers": 300,
+    "leaderboard": 100,
+    "promotion": 1000,
+    "experiment_tracking": 1000,
+    "model_registry": 1000,
+    "ml_pipeline": 4000,
+    "drift_engine": 600,
+    "sampled_drift": 600,
+    "reference_profile": 300,
+    "metrics_schema": 100,
+    "online_drift": 700,
+    "retraining_flow": 4000,
+    "snapshot_store": 800,
+    "evidently_metrics_calculations": 4000,
+    "deploy": 600,
+}
+LAZY_LIBRARIES = ("mlflow", "evidently", "sklearn")
+
+PROBE = """
+import json, sys
+import {module}
+print(json.dumps(sorted(m for m in {lazy!r} if m in sys.modules)))
+"""
+
+
+def import_time(module):
+    """Import ``module`` in a new interpreter.
+
+    Returns:
+        (cumulative import time in ms, heavy libraries it loaded)
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(SEARCH_PATH))
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            PROBE.format(module=module, lazy=LAZY_LIBRARIES),
+        ],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+    # Lines look like "import time:  self [us] |  cumulative | imported package"
+    cumulative_us = None
+    for line in result.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            cumulative_us = int(fields[1])
+    if cumulative_us is None:
+        # e.g. the module was already imported by sitecustomize or a .pth file
+        raise ImportError(f"-X importtime reported no import of {module}")
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return cumulative_us / 1000, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--check", action="store_true", help="Exit with status 1 on a failure"
+    )
+    parser.add_argument("modules", nargs="*", default=sorted(BUDGETS_MS))
+    args = parser.parse_args()
+
+    results, failed = {}, False
+    for module in args.modules:
+        try:
+            runs = [import_time(module) for _ in range(args.repeat)]
+        except ImportError as e:
+            results[module] = {"error": str(e)}
+            failed = True
+            continue
+        ms = min(elapsed for elapsed, _ in runs)
+        loaded = runs[0][1]
+        ok = ms <= BUDGETS_MS[module] and not loaded
+        results[module] = {
+            "ms": round(ms, 1),
+            "budget_ms": BUDGETS_MS[module],
+            "loaded": loaded,
+            "ok": ok,
+        }
+        failed |= not ok
+
+    print(json.dumps(results, indent=2))
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
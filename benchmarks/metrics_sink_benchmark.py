@@ -0,0 +1,100 @@
+"""
+metrics_sink_benchmark.py
+Measures how fast a multi-year hourly backfill can be written to the metrics
+table: one INSERT and commit per row, as the monitoring job used to do,
+against the batched sinks of monitoring/metrics_sink.py.
+
+SQLite is always measured. Pass ``--dsn`` to also measure a PostgreSQL
+database (e.g. the docker-compose one) with executemany and COPY.
+
+Usage:
+    python benchmarks/metrics_sink_benchmark.py [--years 5] [--dsn "host=..."]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(ROOT, "monitoring"))
+
+# pylint: disable=wrong-import-position
+from metrics_sink import COLUMNS, TABLE, PostgresSink, SQLiteSink
+
+
+def hourly_rows(years):
+    start = datetime.datetime(2011, 1, 1)
+    hours = int(years * 365.25 * 24)
+    return [
+        (start + datetime.timedelta(hours=i), (i % 97) / 97, i % 12, 0.0)
+        for i in range(hours)
+    ]
+
+
+class RowByRowSink(SQLiteSink):
+    """One INSERT and commit per row, the pre-sink behaviour."""
+
+    def _write_batch(self, rows):
+        for row in rows:
+            super()._write_batch([row])
+
+
+def measure(sink, rows):
+    sink.prepare()
+    start = time.perf_counter()
+    sink.write_many(rows)
+    sink.close()
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "rows_per_s": len(rows) / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dsn", default=None, help="PostgreSQL to measure too")
+    args = parser.parse_args()
+
+    rows = hourly_rows(args.years)
+    results = {"rows": len(rows), "batch_size": args.batch_size}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results["sqlite_row_by_row"] = measure(
+            RowByRowSink(os.path.join(tmp_dir, "row.db"), batch_size=1), rows
+        )
+        results["sqlite_batched"] = measure(
+            SQLiteSink(os.path.join(tmp_dir, "batch.db"), batch_size=args.batch_size),
+            rows,
+        )
+
+    if args.dsn:
+        table = f"{TABLE}_benchmark"
+        create = f"DROP TABLE IF EXISTS {table}; CREATE TABLE {table} (LIKE {TABLE})"
+        for name, use_copy in (
+            ("postgres_executemany", False),
+            ("postgres_copy", True),
+        ):
+            sink = PostgresSink(
+                args.dsn,
+                use_copy=use_copy,
+                table=table,
+                columns=COLUMNS,
+                batch_size=args.batch_size,
+            )
+            sink.prepare()  # the regular table must exist for LIKE
+            with sink.pool.connection() as conn:
+                conn.execute(create)
+            start = time.perf_counter()
+            sink.write_many(rows)
+            sink.close()
+            elapsed = time.perf_counter() - start
+            results[name] = {"seconds": elapsed, "rows_per_s": len(rows) / elapsed}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
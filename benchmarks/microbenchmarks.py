@@ -0,0 +1,389 @@
+"""
+microbenchmarks.py
+Times the hot paths of training, serving and monitoring and compares them
+with a stored baseline.
+
+Benchmarks:
+    ml_pipeline.read_data, preprocess_data, train_model, evaluate_model
+        the Prefect task functions of src/ml_pipeline.py, without Prefect;
+        train_model.hist_gradient_boosting trains the boosting backend
+    deploy.predict_single, deploy.predict_batch
+        POST /predict with one record and with ``--batch`` records, through
+        the Flask test client
+    model_service.lambda_handler
+        ModelService.lambda_handler over a Kinesis event of ``--batch`` records
+    monitoring.write_window_metrics
+        one window report written to a SQLite metrics sink
+
+The input is synthetic data with the schema of hour.csv from
+src/synthetic_data.py, ``--years`` years of ``--stations`` stations
+(by default the size of hour.csv). The model is a tree fitted on it, the
+monitoring reference is its first year and the monitored window its last day.
+
+Each benchmark is calibrated to run at least ``--min-time`` seconds per
+round; the median and minimum time per call over ``--rounds`` rounds are
+reported. Results are written as JSON with the machine's metadata. Given a
+baseline (``make bench-baseline`` saves one; benchmarks/baseline.json is
+committed), a benchmark whose median is more than ``--threshold`` slower than
+its baseline fails the run, and so does a baseline that does not exist.
+
+Usage:
+    python benchmarks/microbenchmarks.py [--baseline benchmarks/baseline.json]
+"""
+
+import argparse
+import base64
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.tree import DecisionTreeRegressor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(ROOT, "src"))
+sys.path.append(os.path.join(ROOT, "monitoring"))
+sys.path.append(os.path.join(ROOT, "web_service"))
+sys.path.append(os.path.join(ROOT, "tests", "unit-tests"))
+
+# pylint: disable=wrong-import-position
+from features import DEFAULT_TRANSFORMER, FEATURES
+from synthetic_data import write_synthetic
+
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results", "latest.json")
+THRESHOLD = 0.2
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a setup function returning the callable to time."""
+
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+_fixtures = {}
+
+
+def fixture(name, build):
+    """Build shared inputs (data, trained model) once per run."""
+    if name not in _fixtures:
+        _fixtures[name] = build()
+    return _fixtures[name]
+
+
+def data_dir():
+    return fixture("data_dir", tempfile.mkdtemp)
+
+
+def dataset_path(args):
+    def build():
+        path = os.path.join(data_dir(), "hour.csv")
+        write_synthetic(path, years=args.years, stations=args.stations)
+        return path
+
+    return fixture("dataset", build)
+
+
+def hours(args):
+    return fixture("hours", lambda: pd.read_csv(dataset_path(args)))
+
+
+def trained_model(args):
+    def build():
+        df = hours(args)
+        return DecisionTreeRegressor(random_state=0).fit(
+            DEFAULT_TRANSFORMER.transform(df), df["cnt"]
+        )
+
+    return fixture("model", build)
+
+
+def records(args, count):
+    return hours(args)[FEATURES].head(count).to_dict("records")
+
+
+def task_function(prefect_task):
+    """The plain function under @task and @profile_task."""
+    return prefect_task.fn.__wrapped__
+
+
+@benchmark("ml_pipeline.read_data")
+def bench_read_data(args):
+    import ml_pipeline  # pylint: disable=import-outside-toplevel
+
+    read_data = task_function(ml_pipeline.read_data)
+    path = dataset_path(args)
+    return lambda: read_data(path)
+
+
+@benchmark("ml_pipeline.preprocess_data")
+def bench_preprocess_data(args):
+    import ml_pipeline  # pylint: disable=import-outside-toplevel
+
+    preprocess_data = task_function(ml_pipeline.preprocess_data)
+    df = hours(args)
+    return lambda: preprocess_data(df, DEFAULT_TRANSFORMER)
+
+
+@benchmark("ml_pipeline.train_model")
+def bench_train_model(args):
+    import ml_pipeline  # pylint: disable=import-outside-toplevel
+
+    x_train, _, y_train, _ = task_function(ml_pipeline.preprocess_data)(
+        hours(args), DEFAULT_TRANSFORMER
+    )
+    train_model = task_function(ml_pipeline.train_model)
+    return lambda: train_model(x_train, y_train, "decision_tree")
+
+
+@benchmark("ml_pipeline.train_model.hist_gradient_boosting")
+def bench_train_boosting(args):
+    import ml_pipeline  # pylint: disable=import-outside-toplevel
+
+    x_train, _, y_train, _ = task_function(ml_pipeline.preprocess_data)(
+        hours(args), DEFAULT_TRANSFORMER
+    )
+    train_model = task_function(ml_pipeline.train_model)
+    return lambda: train_model(x_train, y_train, "hist_gradient_boosting")
+
+
+@benchmark("ml_pipeline.evaluate_model")
+def bench_evaluate_model(args):
+    import ml_pipeline  # pylint: disable=import-outside-toplevel
+
+    x_train, x_test, y_train, y_test = task_function(ml_pipeline.preprocess_data)(
+        hours(args), DEFAULT_TRANSFORMER
+    )
+    model, _ = task_function(ml_pipeline.train_model)(x_train, y_train, "decision_tree")
+    evaluate_model = task_function(ml_pipeline.evaluate_model)
+    return lambda: evaluate_model(model, x_test, y_test)
+
+
+def predict_client(args):
+    import deploy  # pylint: disable=import-outside-toplevel
+
+    # Serve the locally trained tree instead of loading one from MLflow
+    deploy.model = trained_model(args)
+    deploy.transformer = DEFAULT_TRANSFORMER
+    return deploy.app.test_client()
+
+
+def post_predict(client, payload):
+    response = client.post("/predict", json=payload)
+    assert response.status_code == 200, response.get_json()
+
+
+@benchmark("deploy.predict_single")
+def bench_predict_single(args):
+    client, payload = predict_client(args), records(args, 1)[0]
+    return lambda: post_predict(client, payload)
+
+
+@benchmark("deploy.predict_batch")
+def bench_predict_batch(args):
+    client, payload = predict_client(args), records(args, args.batch)
+    return lambda: post_predict(client, payload)
+
+
+@benchmark("model_service.lambda_handler")
+def bench_lambda_handler(args):
+    import model as model_service  # pylint: disable=import-outside-toplevel
+
+    service = model_service.ModelService(trained_model(args), version="benchmark")
+    event = {
+        "Records": [
+            {
+                "kinesis": {
+                    "data": base64.b64encode(json.dumps(record).encode()).decode()
+                }
+            }
+            for record in records(args, args.batch)
+        ]
+    }
+    return lambda: service.lambda_handler(event)
+
+
+@benchmark("monitoring.write_window_metrics")
+def bench_calculate_metrics(args):
+    # Keep the reference profile of the synthetic data out of the user's cache
+    os.environ.setdefault("REFERENCE_PROFILE_DIR", data_dir())
+    # pylint: disable=import-outside-toplevel
+    import evidently_metrics_calculations as monitoring
+    from metrics_schema import get_drift_sink
+
+    df = hours(args)
+    df = df.assign(
+        prediction=trained_model(args).predict(DEFAULT_TRANSFORMER.transform(df))
+    )
+    monitoring.REFERENCE_PATH = os.path.join(data_dir(), "reference.csv")
+    df[df["yr"] == 0].to_csv(monitoring.REFERENCE_PATH, index=False)
+    monitoring.get_drift_engine()  # the reference profile is built once
+    window = df[df["dteday"] == df["dteday"].max()]
+    sink = get_drift_sink(f"sqlite:///{os.path.join(data_dir(), 'metrics.db')}")
+    sink.prepare()
+    calculate = task_function(monitoring.write_window_metrics)
+    timestamp = datetime.datetime.fromisoformat(window["dteday"].iloc[0])
+
+    def run():
+        written = sink.rows_written
+        calculate(sink, window, timestamp, "native")
+        assert sink.rows_written == written + 1, "the report was not written"
+
+    return run
+
+
+def time_callable(func, rounds, min_time):
+    """Return per-call times of ``rounds`` rounds, each at least min_time long."""
+    func()  # warm up caches and lazy imports
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+    times = [elapsed / number]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return times, number
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine_metadata():
+    return {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return the names of the benchmarks that regressed beyond threshold."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if not before or "median_s" not in result:
+            continue
+        result["baseline_median_s"] = before["median_s"]
+        result["change"] = result["median_s"] / before["median_s"] - 1
+        if result["change"] > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--batch", type=int, default=100, help="Records per batch")
+    parser.add_argument("--years", type=int, default=2, help="Synthetic data years")
+    parser.add_argument("--stations", type=int, default=1)
+    parser.add_argument("--filter", default="", help="Run benchmarks containing this")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=None, help="Baseline JSON to compare")
+    parser.add_argument(
+        "--save-baseline", default=None, help="Also save the results as baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="Allowed slowdown of the median, e.g. 0.2 for 20%%",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.baseline and not os.path.exists(args.baseline):
+        # A missing baseline would silently turn the regression check off
+        sys.exit(
+            f"Baseline {args.baseline} does not exist; record one with "
+            "`make bench-baseline`."
+        )
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                func = setup(args)
+                times, number = time_callable(func, args.rounds, args.min_time)
+        except ImportError as e:
+            results[name] = {"skipped": str(e)}
+            continue
+        results[name] = {
+            "median_s": statistics.median(times),
+            "min_s": min(times),
+            "calls_per_round": number,
+            "rounds": args.rounds,
+        }
+        print(f"{name}: {results[name]['median_s'] * 1000:.3f} ms", file=sys.stderr)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if baseline.get("machine", {}).get("processor") != platform.processor():
+            print("The baseline was recorded on another machine.", file=sys.stderr)
+
+    report = {
+        "machine": machine_metadata(),
+        "threshold": args.threshold,
+        "data": {"years": args.years, "stations": args.stations},
+        "benchmarks": results,
+        "regressions": regressions,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    print(json.dumps(report, indent=2))
+    if regressions:
+        print(f"Regressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+model_format_benchmark.py
+Compares load time and resident memory of the decision tree trained on
+hour.csv when stored with pickle, joblib and the memory-mappable format.
+
+Every measurement runs in a fresh interpreter so that allocations from one
+format do not hide those of another.
+
+Usage:
+    python benchmarks/model_format_benchmark.py [--repeats 5]
+"""
+
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+
+import joblib
+import pandas as pd
+from sklearn.tree import DecisionTreeRegressor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(ROOT, "src"))
+
+# pylint: disable=wrong-import-position
+from constants import FEATURES
+from model_format import save_model
+
+DATA_PATH = os.path.join(ROOT, "data", "hour.csv")
+
+# Runs inside the child interpreter; prints one JSON line.
+_CHILD = r"""
+import json, sys, time
+sys.path.append({src!r})
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+import numpy as np
+import pandas as pd
+import sklearn.tree
+import model_format
+X = pd.read_csv({data!r}, usecols={features!r})[{features!r}].to_numpy()
+
+fmt, path = {fmt!r}, {path!r}
+before = rss_kb()
+start = time.perf_counter()
+if fmt == "pickle":
+    import pickle
+    with open(path, "rb") as f:
+        model = pickle.load(f)
+elif fmt == "joblib":
+    import joblib
+    model = joblib.load(path)
+else:
+    model = model_format.load_model(path)
+load_s = time.perf_counter() - start
+after_load = rss_kb()
+model.predict(X)
+after_predict = rss_kb()
+print(json.dumps({{
+    "load_ms": load_s * 1000,
+    "rss_load_kb": after_load - before,
+    "rss_predict_kb": after_predict - before,
+}}))
+"""
+
+
+def measure(fmt, path, repeats):
+    code = _CHILD.format(
+        src=os.path.join(ROOT, "src"),
+        data=DATA_PATH,
+        features=FEATURES,
+        fmt=fmt,
+        path=path,
+    )
+    runs = []
+    for _ in range(repeats):
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda r: r["load_ms"])
+    best["size_kb"] = os.path.getsize(path) / 1024
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    df = pd.read_csv(DATA_PATH)
+    model = DecisionTreeRegressor(random_state=42).fit(
+        df[FEATURES].to_numpy(), df["cnt"]
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {
+            "pickle": os.path.join(tmp, "model.pkl"),
+            "joblib": os.path.join(tmp, "model.joblib"),
+            "mmap": os.path.join(tmp, "model.bkm"),
+        }
+        with open(paths["pickle"], "wb") as f:
+            pickle.dump(model, f)
+        joblib.dump(model, paths["joblib"])
+        save_model(model, paths["mmap"])
+
+        print(
+            f"DecisionTreeRegressor: {model.tree_.node_count} nodes, depth {model.get_depth()}"
+        )
+        print(
+            f"{'format':<8}{'size KB':>10}{'load ms':>10}{'RSS load KB':>14}{'RSS predict KB':>16}"
+        )
+        for fmt, path in paths.items():
+            r = measure(fmt, path, args.repeats)
+            print(
+                f"{fmt:<8}{r['size_kb']:>10.0f}{r['load_ms']:>10.3f}"
+                f"{r['rss_load_kb']:>14}{r['rss_predict_kb']:>16}"
+            )
+
+
+if __name__ == "__main__":
+    main()
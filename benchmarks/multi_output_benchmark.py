@@ -0,0 +1,127 @@
+"""
+multi_output_benchmark.py
+Compares one multi-output decision tree for cnt, casual and registered with
+three single-output trees, one per target.
+
+Both are trained on the same 80% of the data (hour.csv, or synthetic data
+with ``--years``) and evaluated per target on the rest. Throughput is the
+number of rows scored per second for all three targets, in batches and one
+row at a time, with the scikit-learn models and with their memory-mapped
+copies, the ones the web service serves.
+
+Usage:
+    python benchmarks/multi_output_benchmark.py [--years 10]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from sklearn.metrics import r2_score
+from sklearn.model_selection import train_test_split
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(ROOT, "src"))
+
+# pylint: disable=wrong-import-position
+from features import DEFAULT_TRANSFORMER, TARGETS
+from model_format import MODEL_EXTENSION, load_model, save_model
+from promotion import BATCH_REPEATS, SINGLE_ROW_REPEATS
+from synthetic_data import write_synthetic
+from trainers import train
+
+DATA_PATH = os.path.join(ROOT, "data", "hour.csv")
+
+
+def throughput(models, X):
+    """Rows per second for all targets, in one batch and row by row."""
+    for model in models:
+        model.predict(X[:1])
+    batch = []
+    for _ in range(BATCH_REPEATS):
+        start = time.perf_counter()
+        for model in models:
+            model.predict(X)
+        batch.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(SINGLE_ROW_REPEATS):
+        row = X[i % len(X) : i % len(X) + 1]
+        for model in models:
+            model.predict(row)
+    single = time.perf_counter() - start
+    return {
+        "batch_rows_per_s": round(len(X) / min(batch)),
+        "single_row_per_s": round(SINGLE_ROW_REPEATS / single),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--years", type=int, default=None, help="Synthetic years")
+    parser.add_argument("--stations", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = DATA_PATH
+        if args.years:
+            path = os.path.join(tmp_dir, "hour.csv")
+            write_synthetic(path, years=args.years, stations=args.stations)
+        df = pd.read_csv(path)
+        X = DEFAULT_TRANSFORMER.transform(df)
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, df[TARGETS], test_size=0.2, random_state=42
+        )
+
+        multi, _ = train(X_train, y_train, "decision_tree")
+        single = [train(X_train, y_train[t], "decision_tree")[0] for t in TARGETS]
+        multi_path = os.path.join(tmp_dir, f"multi{MODEL_EXTENSION}")
+        mapped_multi = [load_model(save_model(multi, multi_path, TARGETS))]
+        mapped_single = [
+            load_model(
+                save_model(model, os.path.join(tmp_dir, f"{t}{MODEL_EXTENSION}"), [t])
+            )
+            for t, model in zip(TARGETS, single)
+        ]
+
+        predictions = multi.predict(X_test)
+        results = {"rows": len(df), "test_rows": len(X_test)}
+        for name, models, mapped, scores in (
+            ("multi_output", [multi], mapped_multi, predictions.T),
+            (
+                "single_output",
+                single,
+                mapped_single,
+                [m.predict(X_test) for m in single],
+            ),
+        ):
+            results[name] = {
+                **{
+                    f"r2_{t}": round(r2_score(y_test[t], s), 4)
+                    for t, s in zip(TARGETS, scores)
+                },
+                "nodes": int(sum(m.tree_.node_count for m in models)),
+                "sklearn": throughput(models, X_test),
+                "mapped": throughput(mapped, X_test),
+            }
+        for flavour in ("sklearn", "mapped"):
+            results[f"{flavour}_batch_speedup"] = round(
+                results["multi_output"][flavour]["batch_rows_per_s"]
+                / results["single_output"][flavour]["batch_rows_per_s"],
+                2,
+            )
+            results[f"{flavour}_single_row_speedup"] = round(
+                results["multi_output"][flavour]["single_row_per_s"]
+                / results["single_output"][flavour]["single_row_per_s"],
+                2,
+            )
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
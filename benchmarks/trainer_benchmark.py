@@ -0,0 +1,123 @@
+"""
+trainer_benchmark.py
+Compares the trainer backends: training time per core count, accuracy and
+accuracy per millisecond of inference.
+
+Every backend is trained on the same 80% of the data (hour.csv, or
+synthetic data with ``--years``) once per thread count, and evaluated on
+the rest. Inference is measured with promotion.benchmark_model, as the
+promotion gate does, and on the model's memory-mapped copy, the one the web
+service loads.
+
+Usage:
+    python benchmarks/trainer_benchmark.py [--years 10 --max-threads 8]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import train_test_split
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(ROOT, "src"))
+
+# pylint: disable=wrong-import-position
+from batch_score_benchmark import worker_counts
+from features import DEFAULT_TRANSFORMER
+from model_format import MODEL_EXTENSION, load_model, save_model
+from promotion import (
+    BENCHMARK_SAMPLE_SIZE,
+    BENCHMARK_SEED,
+    SINGLE_ROW_REPEATS,
+    benchmark_model,
+)
+from synthetic_data import write_synthetic
+from trainers import TRAINERS, train
+
+DATA_PATH = os.path.join(ROOT, "data", "hour.csv")
+
+
+def single_row_p50_ms(model, X):
+    """Median latency of single-row predictions over the rows of X."""
+    model.predict(X[:1])
+    latencies = np.empty(SINGLE_ROW_REPEATS)
+    for i in range(SINGLE_ROW_REPEATS):
+        row = X[i % len(X) : i % len(X) + 1]
+        start = time.perf_counter()
+        model.predict(row)
+        latencies[i] = time.perf_counter() - start
+    return float(np.median(latencies) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--years", type=int, default=None, help="Synthetic years")
+    parser.add_argument("--stations", type=int, default=1)
+    parser.add_argument("--max-threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--trainer", nargs="*", default=sorted(TRAINERS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = DATA_PATH
+        if args.years:
+            path = os.path.join(tmp_dir, "hour.csv")
+            write_synthetic(path, years=args.years, stations=args.stations)
+        df = pd.read_csv(path)
+        X = DEFAULT_TRANSFORMER.transform(df)
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, df["cnt"], test_size=0.2, random_state=42
+        )
+        sample = df.sample(
+            n=min(BENCHMARK_SAMPLE_SIZE, len(df)), random_state=BENCHMARK_SEED
+        )
+
+        runs = []
+        for trainer in args.trainer:
+            # The decision tree is single-threaded
+            threads = (
+                [1] if trainer == "decision_tree" else worker_counts(args.max_threads)
+            )
+            for count in threads:
+                model, stats = train(X_train, y_train, trainer, count)
+                predictions = model.predict(X_test)
+                mapped = load_model(
+                    save_model(
+                        model, os.path.join(tmp_dir, f"{trainer}{MODEL_EXTENSION}")
+                    )
+                )
+                latency = benchmark_model(model, sample)
+                served_ms = single_row_p50_ms(
+                    mapped, DEFAULT_TRANSFORMER.transform(sample)
+                )
+                r2 = r2_score(y_test, predictions)
+                runs.append(
+                    {
+                        **stats,
+                        "train_seconds": round(stats["train_seconds"], 3),
+                        "mae": round(mean_absolute_error(y_test, predictions), 3),
+                        "r2": round(r2, 4),
+                        "latency_p50_ms": round(latency["latency_p50_ms"], 4),
+                        "batch_latency_ms": round(latency["batch_latency_ms"], 3),
+                        "model_size_mb": round(latency["model_size_mb"], 3),
+                        "r2_per_ms": round(r2 / latency["latency_p50_ms"], 1),
+                        "served_latency_p50_ms": round(served_ms, 4),
+                        "r2_per_served_ms": round(r2 / served_ms, 1),
+                    }
+                )
+
+    print(
+        json.dumps(
+            {"rows": len(df), "cpu_count": os.cpu_count(), "runs": runs}, indent=2
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
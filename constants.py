@@ -1,5 +1,7 @@
 # src/constants.py
 
+# A copy of FEATURES in src/features.py for code run without src/ on the
+# path; keep the two lists in sync.
 FEATURES = [
     "season",
     "holiday",
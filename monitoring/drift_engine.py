@@ -0,0 +1,224 @@
+"""
+drift_engine.py
+NumPy drift engine: the values the monitoring job stores for every window
+(prediction drift, number of drifted columns, share of missing values)
+without running an Evidently report.
+
+All columns are scored together. The reference profile and the current
+window are flattened into (column, value) pairs and merged with a single
+lexsort; the step CDFs of both sides are then evaluated on the merged grid,
+which gives for every column at once:
+
+    ks            Kolmogorov-Smirnov statistic and its asymptotic p-value
+    wasserstein   Wasserstein distance divided by the reference std
+    jensenshannon Jensen-Shannon distance of the value frequencies
+    psi           Population Stability Index over the reference histogram
+
+A column is judged the way Evidently judges it by default for references of
+more than 1000 rows: Jensen-Shannon when reference and window together hold
+at most 5 distinct values, normed Wasserstein otherwise, threshold 0.1.
+Smaller references fall back to the KS p-value.
+"""
+
+import numpy as np
+from scipy import special
+
+# Evidently's default drift tests and thresholds
+CATEGORICAL_MAX_VALUES = 5
+DRIFT_THRESHOLD = 0.1
+WASSERSTEIN_MIN_STD = 0.001
+# Evidently switches from statistical tests to distances above this size
+LARGE_REFERENCE_ROWS = 1000
+KS_P_VALUE = 0.05
+# Empty histogram bins are replaced by this share before taking logarithms
+PSI_EMPTY_BIN = 0.0001
+
+
+def share_of_missing_values(df, missing_values=("", np.inf, -np.inf)):
+    """Share of missing cells over all columns, as Evidently counts them."""
+    if len(df) == 0:
+        return 0.0
+    missing = int(df.isnull().to_numpy().sum())
+    for value in missing_values:
+        missing += int((df == value).to_numpy().sum())
+    return missing / (df.shape[0] * df.shape[1])
+
+
+class DriftEngine:  # pylint: disable=too-many-instance-attributes
+    """Scores current windows against a ReferenceProfile.
+
+    The reference arrays are laid out once per engine so that scoring a window
+    does no per-column Python work; each of them is an attribute.
+    """
+
+    def __init__(self, profile, columns=None, threshold=DRIFT_THRESHOLD):
+        """
+        Args:
+            profile: ReferenceProfile of the reference data.
+            columns: Columns to score; defaults to every profiled column.
+            threshold: Distance at or above which a column has drifted.
+        """
+        self.columns = list(columns or profile.columns)
+        self.threshold = threshold
+        k = len(self.columns)
+
+        supports = [np.asarray(profile.arrays[c]["support"]) for c in self.columns]
+        self._ref_col = np.repeat(np.arange(k), [len(s) for s in supports])
+        self._ref_val = np.concatenate(supports)
+        self._ref_cdf = np.concatenate(
+            [np.asarray(profile.arrays[c]["cdf"]) for c in self.columns]
+        )
+        self._ref_rows = np.array([profile.meta[c]["rows"] for c in self.columns])
+        self._ref_std = np.maximum(
+            [profile.meta[c]["std"] for c in self.columns], WASSERSTEIN_MIN_STD
+        )
+        self._large_reference = self._ref_rows > LARGE_REFERENCE_ROWS
+
+        # Histogram edges padded with +inf so every column has the same bins
+        edges = [np.asarray(profile.arrays[c]["hist_edges"]) for c in self.columns]
+        n_bins = max(len(e) - 1 for e in edges)
+        self._inner_edges = np.full((k, max(n_bins - 1, 0)), np.inf)
+        self._ref_hist = np.zeros((k, n_bins))
+        for i, column in enumerate(self.columns):
+            self._inner_edges[i, : len(edges[i]) - 2] = edges[i][1:-1]
+            counts = np.asarray(profile.arrays[column]["hist_counts"])
+            self._ref_hist[i, : len(counts)] = counts / max(counts.sum(), 1)
+        self._has_bin = np.zeros((k, n_bins), dtype=bool)
+        for i, e in enumerate(edges):
+            self._has_bin[i, : len(e) - 1] = True
+
+    def _psi(self, cur_col, cur_val, cur_weight, cur_rows):
+        k, n_bins = self._ref_hist.shape
+        bins = (cur_val[:, None] >= self._inner_edges[cur_col]).sum(axis=1)
+        counts = np.bincount(
+            cur_col * n_bins + bins, cur_weight, minlength=k * n_bins
+        ).reshape(k, n_bins)
+        cur = counts / np.maximum(cur_rows, 1)[:, None]
+        ref = np.where(self._ref_hist > 0, self._ref_hist, PSI_EMPTY_BIN)
+        cur = np.where(cur > 0, cur, PSI_EMPTY_BIN)
+        return np.where(self._has_bin, (cur - ref) * np.log(cur / ref), 0.0).sum(1)
+
+    def compute(self, current):
+        """Score every column of a current window in one pass.
+
+        Args:
+            current: DataFrame (or array with ``columns`` order) of the window.
+
+        Returns:
+            Dict of per-column arrays: ks, ks_p_value, wasserstein,
+            jensenshannon, psi, distinct, stattest, score and drifted.
+        """
+        if hasattr(current, "columns"):
+            current = current[self.columns].to_numpy(dtype="float64")
+        values = np.asarray(current, dtype="float64").reshape(-1, len(self.columns))
+        finite = np.isfinite(values)
+        cur_col = np.broadcast_to(np.arange(len(self.columns)), values.shape)[finite]
+        return self._score(cur_col, values[finite], np.ones(len(cur_col)))
+
+    def compute_weighted(self, distributions):
+        """Score columns given as weighted values instead of rows.
+
+        Args:
+            distributions: One (values, weights) pair per column, in
+                ``columns`` order, e.g. the contents of a sketch.
+
+        Returns:
+            The same dict as ``compute``.
+        """
+        sizes = [len(values) for values, _ in distributions]
+        cur_col = np.repeat(np.arange(len(self.columns)), sizes)
+        cur_val = np.concatenate([np.asarray(v, "float64") for v, _ in distributions])
+        cur_weight = np.concatenate(
+            [np.asarray(w, "float64") for _, w in distributions]
+        )
+        keep = np.isfinite(cur_val) & (cur_weight > 0)
+        return self._score(cur_col[keep], cur_val[keep], cur_weight[keep])
+
+    def _score(self, cur_col, cur_val, cur_weight):
+        k = len(self.columns)
+        cur_rows = np.bincount(cur_col, cur_weight, minlength=k)
+
+        # Merge reference support and current values, ordered by column then value
+        col = np.concatenate([self._ref_col, cur_col])
+        val = np.concatenate([self._ref_val, cur_val])
+        is_ref = np.concatenate(
+            [np.ones(len(self._ref_col), bool), np.zeros(len(cur_col), bool)]
+        )
+        order = np.lexsort((val, col))
+        col, val, is_ref = col[order], val[order], is_ref[order]
+        ref_cdf = np.concatenate([self._ref_cdf, np.zeros(len(cur_col))])[order]
+        weight = np.concatenate([np.zeros(len(self._ref_col)), cur_weight])[order]
+
+        # Reference CDF: the last reference step seen within the column
+        col_offset = 2.0 * col
+        steps = np.where(is_ref, col_offset + ref_cdf, -np.inf)
+        f_ref = np.maximum.accumulate(steps) - col_offset
+        f_ref = np.where(f_ref >= 0, f_ref, 0.0)
+        # Current CDF: running share of the column's current weight
+        cur_seen = np.cumsum(weight)
+        col_start = np.searchsorted(col, np.arange(k))
+        before = np.concatenate([[0.0], cur_seen])[col_start]
+        f_cur = (cur_seen - before[col]) / np.maximum(cur_rows, 1e-300)[col]
+
+        # Keep the last entry of every (column, value): right-continuous CDFs
+        last = np.ones(len(col), bool)
+        last[:-1] = (col[1:] != col[:-1]) | (val[1:] != val[:-1])
+        col, val, f_ref, f_cur = col[last], val[last], f_ref[last], f_cur[last]
+        gap = np.abs(f_ref - f_cur)
+        starts = np.searchsorted(col, np.arange(k))
+
+        ks = np.maximum.reduceat(gap, starts)
+        same = col[1:] == col[:-1]
+        area = np.where(same, gap[:-1] * np.diff(val), 0.0)
+        wasserstein = np.bincount(col[:-1], area, minlength=k) / self._ref_std
+
+        first = np.ones(len(col), bool)
+        first[1:] = ~same
+        p = np.where(first, f_ref, np.diff(f_ref, prepend=0.0))
+        q = np.where(first, f_cur, np.diff(f_cur, prepend=0.0))
+        m = (p + q) / 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            terms = np.where(p > 0, p * np.log(p / m), 0.0) + np.where(
+                q > 0, q * np.log(q / m), 0.0
+            )
+        jensenshannon = np.sqrt(np.maximum(np.bincount(col, terms, k) / 2, 0.0))
+        distinct = np.bincount(col, minlength=k)
+
+        n_eff = self._ref_rows * cur_rows / np.maximum(self._ref_rows + cur_rows, 1)
+        # Asymptotic KS distribution, as scipy.stats.kstwobign.sf, without the
+        # second it takes to import scipy.stats. kolmogorov is a compiled
+        # ufunc that pylint cannot see.
+        ks_p_value = special.kolmogorov(  # pylint: disable=no-member
+            np.sqrt(n_eff) * ks
+        )
+
+        use_js = distinct <= CATEGORICAL_MAX_VALUES
+        score = np.where(use_js, jensenshannon, wasserstein)
+        drifted = score >= self.threshold
+        stattest = np.where(use_js, "jensenshannon", "wasserstein").astype(object)
+        small = ~self._large_reference
+        score = np.where(small, ks_p_value, score)
+        drifted = np.where(small, ks_p_value < KS_P_VALUE, drifted)
+        stattest[small] = "ks"
+        drifted &= cur_rows > 0
+
+        return {
+            "ks": ks,
+            "ks_p_value": ks_p_value,
+            "wasserstein": wasserstein,
+            "jensenshannon": jensenshannon,
+            "psi": self._psi(cur_col, cur_val, cur_weight, cur_rows),
+            "distinct": distinct,
+            "stattest": stattest,
+            "score": score,
+            "drifted": drifted,
+        }
+
+    def window_metrics(self, current, prediction="prediction"):
+        """Return (prediction drift, number of drifted columns, missing share)."""
+        result = self.compute(current)
+        return (
+            float(result["score"][self.columns.index(prediction)]),
+            int(result["drifted"].sum()),
+            share_of_missing_values(current),
+        )
@@ -1,153 +1,451 @@
+"""
+evidently_metrics_calculations.py
+Backfills drift metrics for every window of hour.csv.
+
+Importing this module reads no data and loads no model: the model, the
+datasets and Evidently are loaded on first use by get_model(),
+load_raw_data() and get_evidently_report().
+"""
+
+import argparse
+import collections
 import datetime
 import logging
+import os
 import random
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 
-import joblib
 import pandas as pd
-import psycopg
-from evidently import ColumnMapping
-from evidently.metrics import (
-    ColumnDriftMetric,
-    DatasetDriftMetric,
-    DatasetMissingValuesMetric,
-)
-from evidently.report import Report
 from prefect import flow, task
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+# pylint: disable=wrong-import-position
+from drift_engine import DriftEngine, share_of_missing_values
+from metrics_schema import WindowMetrics, feature_drift, get_drift_sink
+from prediction_store import PredictionStore
+from reference_profile import load_or_build_profile
+from sampled_drift import SampledDriftEngine
+
+from artifact_cache import fetch_artifact, file_digest
+from dataset_partitions import DATE_COLUMN, has_partitions, read_partitions
+from features import (
+    DEFAULT_TRANSFORMER,
+    FEATURE_SPEC_FILENAME,
+    FEATURES,
+    FeatureTransformer,
+)
+from task_profiling import (
+    clear_task_profiles,
+    log_task_profiles,
+    pop_task_profiles,
+    profile_task,
+    record_task_profiles,
+)
+
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s [%(levelname)s]: %(message)s"
 )
 
 SEND_TIMEOUT = 10
+WINDOW_FREQUENCIES = {"day": "D", "hour": "h"}
+# "native" scores windows with the NumPy engine against the precomputed
+# reference profile, "sampled" scores large windows with the same engine from
+# stratified samples (see sampled_drift.py), "evidently" runs the full
+# Evidently report
+DRIFT_ENGINES = ("native", "sampled", "evidently")
+DRIFT_ENGINE = os.environ.get("DRIFT_ENGINE", "native")
+# Evidently's stattest display names, stored under the native engine's names
+EVIDENTLY_STATTESTS = {
+    "K-S p_value": "ks",
+    "Jensen-Shannon distance": "jensenshannon",
+    "Wasserstein distance (normed)": "wasserstein",
+}
 rand = random.Random()
 
-create_table_statement = """
-CREATE TABLE IF NOT EXISTS dummy_metrics (
-    timestamp TIMESTAMP,
-    prediction_drift FLOAT,
-    num_drifted_columns INTEGER,
-    share_missing_values FLOAT
-)
-"""
-
 # Update the file path to the new location
-reference_data = pd.read_csv("../project-mlops/data/reference.csv")
-with open("../project-mlops/models/DecisionTreeRegressor.pkl", "rb") as f_in:
-    model = joblib.load(f_in)
-
-raw_data = pd.read_csv("../project-mlops/data/hour.csv")
-
-features = [
-    "season",
-    "holiday",
-    "workingday",
-    "weathersit",
-    "temp",
-    "atemp",
-    "hum",
-    "windspeed",
-    "hr",
-    "mnth",
-    "yr",
-]
-column_mapping = ColumnMapping(
-    prediction="prediction", numerical_features=features, target=None
+REFERENCE_PATH = "../project-mlops/data/reference.csv"
+DATA_PATH = "../project-mlops/data/hour.csv"
+# Written by create_monitoring_datasets.py; read instead of DATA_PATH if present
+DATASET_DIR = os.environ.get(
+    "MONITORING_DATASET_DIR", "../project-mlops/data/partitioned"
 )
 
-report = Report(
-    metrics=[
-        ColumnDriftMetric(column_name="prediction"),
-        DatasetDriftMetric(),
-        DatasetMissingValuesMetric(),
-    ]
+# With MODEL_RUN_ID set, the model and its feature spec come from the shared
+# artifact cache; otherwise from the local models directory
+model_run_id = os.environ.get("MODEL_RUN_ID")
+
+MonitoredModel = collections.namedtuple(
+    "MonitoredModel", ["model", "digest", "version", "transformer"]
 )
 
+_monitored_model = None
+_evidently_report = None
 
-@task
-def prep_db():
-    try:
-        with psycopg.connect(
-            "host=localhost port=5432 user=postgres password=example", autocommit=True
-        ) as conn:
-            # Check if the database exists
-            res = conn.execute("SELECT 1 FROM pg_database WHERE datname='test'")
-            if not res.fetchall():
-                logging.info("Database 'test' not found. Creating database.")
-                conn.execute("CREATE DATABASE test;")
-            else:
-                logging.info("Database 'test' already exists.")
-
-            # Connect to the database and create the table
-            with psycopg.connect(
-                "host=localhost port=5432 dbname=test user=postgres password=example"
-            ) as conn:
-                conn.execute(create_table_statement)
-                logging.info("Table 'dummy_metrics' is ready.")
-    except psycopg.OperationalError as e:
-        logging.error("OperationalError: %s", str(e))
-    except Exception as e:
-        logging.error("Error preparing the database: %s", str(e))
+
+def get_model():
+    """Load the monitored model, its SHA-256 and feature transformer once."""
+    global _monitored_model  # pylint: disable=global-statement
+    if _monitored_model is None:
+        import joblib  # pylint: disable=import-outside-toplevel
+
+        if model_run_id:
+            model_path = fetch_artifact(
+                model_run_id, "models/DecisionTreeRegressor.pkl"
+            )
+            spec_path = fetch_artifact(model_run_id, f"models/{FEATURE_SPEC_FILENAME}")
+        else:
+            model_path = "../project-mlops/models/DecisionTreeRegressor.pkl"
+            spec_path = f"../project-mlops/models/{FEATURE_SPEC_FILENAME}"
+
+        with open(model_path, "rb") as f_in:
+            model = joblib.load(f_in)
+        digest = file_digest(model_path)
+        # Use the feature transformer saved next to the model, if there is one
+        transformer = (
+            FeatureTransformer.load(spec_path)
+            if os.path.exists(spec_path)
+            else DEFAULT_TRANSFORMER
+        )
+        # The version is stored with every metrics row so dashboards can tell
+        # model versions apart
+        _monitored_model = MonitoredModel(
+            model, digest, model_run_id or digest[:12], transformer
+        )
+    return _monitored_model
+
+
+def load_raw_data(start=None, end=None):
+    """Return the rows dated from ``start`` up to, not including, ``end``.
+
+    From the partitioned dataset, only the partitions of that range are read.
+    """
+    if has_partitions(DATASET_DIR):
+        return read_partitions(DATASET_DIR, start=start, end=end)
+    df = pd.read_csv(DATA_PATH)
+    if start is not None:
+        df = df[df[DATE_COLUMN] >= str(start)]
+    if end is not None:
+        df = df[df[DATE_COLUMN] < str(end)]
+    return df
+
+
+def get_evidently_report():
+    """Return (reference data, column mapping, report) of the Evidently engine."""
+    global _evidently_report  # pylint: disable=global-statement
+    if _evidently_report is None:
+        # pylint: disable=import-outside-toplevel
+        from evidently import ColumnMapping
+        from evidently.metrics import (
+            ColumnDriftMetric,
+            DataDriftTable,
+            DatasetDriftMetric,
+            DatasetMissingValuesMetric,
+        )
+        from evidently.report import Report
+
+        column_mapping = ColumnMapping(
+            prediction="prediction", numerical_features=FEATURES, target=None
+        )
+        report = Report(
+            metrics=[
+                ColumnDriftMetric(column_name="prediction"),
+                DatasetDriftMetric(),
+                DatasetMissingValuesMetric(),
+                DataDriftTable(),
+            ]
+        )
+        _evidently_report = (pd.read_csv(REFERENCE_PATH), column_mapping, report)
+    return _evidently_report
 
 
 @task
-def calculate_metrics_postgresql(curr):
-    try:
-        current_data = raw_data.copy()
-        current_data["prediction"] = model.predict(current_data[features])
+@profile_task
+def prep_db(sink):
+    sink.prepare()
+
+
+def window_timestamps(df):
+    """Return the hour each row refers to, built from ``dteday`` and ``hr``."""
+    return pd.to_datetime(df["dteday"]) + pd.to_timedelta(df["hr"], unit="h")
+
+
+def split_windows(df, window="day"):
+    """Split data into consecutive daily or hourly windows.
+
+    Args:
+        df: Data with ``dteday`` and ``hr`` columns.
+        window: "day" or "hour".
+
+    Returns:
+        List of (window start, rows of that window), ordered by time.
+    """
+    starts = window_timestamps(df).dt.floor(WINDOW_FREQUENCIES[window])
+    return [
+        (start.to_pydatetime(), rows) for start, rows in df.groupby(starts, sort=True)
+    ]
 
-        report.run(
-            reference_data=reference_data,
-            current_data=current_data,
-            column_mapping=column_mapping,
+
+_drift_engine = None
+
+
+def get_drift_engine():
+    """Return the native engine; its reference profile is cached on disk."""
+    global _drift_engine  # pylint: disable=global-statement
+    if _drift_engine is None:
+        _drift_engine = DriftEngine(
+            load_or_build_profile(REFERENCE_PATH, FEATURES + ["prediction"])
+        )
+    return _drift_engine
+
+
+def predict_rows(df):
+    """Return the model's predictions for df, reusing stored ones by instant."""
+    monitored = get_model()
+    return PredictionStore().predict(
+        monitored.model, monitored.digest, df, monitored.transformer.transform
+    )
+
+
+def compute_window_metrics(timestamp, current_data, engine=DRIFT_ENGINE):
+    """Run the drift report for one window and return its WindowMetrics."""
+    if "prediction" not in current_data.columns:
+        current_data = current_data.assign(prediction=predict_rows(current_data))
+
+    if engine in ("native", "sampled"):
+        drift_engine = get_drift_engine()
+        if engine == "sampled":
+            result = SampledDriftEngine(drift_engine).compute(current_data)
+            if result["undecided"].any():
+                logging.warning(
+                    "Window %s: drift of %d columns undecided after %d rows.",
+                    timestamp,
+                    int(result["undecided"].sum()),
+                    result["sample_rows"],
+                )
+        else:
+            result = drift_engine.compute(current_data)
+        return WindowMetrics(
+            timestamp,
+            float(result["score"][drift_engine.columns.index("prediction")]),
+            int(result["drifted"].sum()),
+            share_of_missing_values(current_data),
+            feature_drift(drift_engine.columns, result),
+        )
+
+    reference_data, column_mapping, report = get_evidently_report()
+    report.run(
+        reference_data=reference_data,
+        current_data=current_data,
+        column_mapping=column_mapping,
+    )
+
+    result = report.as_dict()
+
+    prediction_drift = result["metrics"][0]["result"]["drift_score"]
+    num_drifted_columns = result["metrics"][1]["result"]["number_of_drifted_columns"]
+    share_missing_values = result["metrics"][2]["result"]["current"][
+        "share_of_missing_values"
+    ]
+    features = {
+        column: (
+            EVIDENTLY_STATTESTS.get(scores["stattest_name"], scores["stattest_name"]),
+            scores["drift_score"],
+            scores["drift_detected"],
         )
+        for column, scores in result["metrics"][3]["result"]["drift_by_columns"].items()
+    }
+    return WindowMetrics(
+        timestamp,
+        prediction_drift,
+        num_drifted_columns,
+        share_missing_values,
+        features,
+    )
+
+
+@task
+@profile_task
+def write_window_metrics(sink, current_data=None, timestamp=None, engine=DRIFT_ENGINE):
+    """Compute the metrics of one window and write them to the sink.
+
+    Args:
+        sink: Sink of the metrics schema (metrics_schema.get_drift_sink).
+        current_data: Rows of the window; the whole dataset by default.
+        timestamp: Start of the window; now by default.
+        engine: "native", "sampled" or "evidently".
+    """
+    row = compute_window_metrics(
+        timestamp or datetime.datetime.now(),
+        load_raw_data() if current_data is None else current_data,
+        engine,
+    )
+    sink.write(row)
+    sink.flush()
+    logging.info("Metrics inserted into database.")
 
-        result = report.as_dict()
 
-        prediction_drift = result["metrics"][0]["result"]["drift_score"]
-        num_drifted_columns = result["metrics"][1]["result"][
-            "number_of_drifted_columns"
-        ]
-        share_missing_values = result["metrics"][2]["result"]["current"][
-            "share_of_missing_values"
-        ]
+@task
+def calculate_metrics_postgresql(curr):
+    """Report drift of the whole dataset into dummy_metrics through a cursor.
 
+    Kept for callers of the original job; the backfill writes per-window
+    metrics with write_window_metrics.
+    """
+    try:
+        row = compute_window_metrics(datetime.datetime.now(), load_raw_data())
         curr.execute(
-            "INSERT INTO dummy_metrics(timestamp, prediction_drift, num_drifted_columns, share_missing_values) VALUES (%s, %s, %s, %s)",
-            (
-                datetime.datetime.now(),
-                prediction_drift,
-                num_drifted_columns,
-                share_missing_values,
-            ),
+            "INSERT INTO dummy_metrics(timestamp, prediction_drift, "
+            "num_drifted_columns, share_missing_values) VALUES (%s, %s, %s, %s)",
+            row[:4],
         )
         logging.info("Metrics inserted into database.")
     except Exception as e:
         logging.error("Error calculating metrics: %s", str(e))
 
 
-@flow
-def batch_monitoring_backfill():
-    prep_db()
+def compute_window_metrics_profiled(timestamp, current_data, engine=DRIFT_ENGINE):
+    """compute_window_metrics in a pool worker, with its task profile.
+
+    Records collected in a worker stay in that process, so they are returned
+    with the metrics for the parent to record.
+    """
+    clear_task_profiles()  # a forked worker starts with the parent's records
+    metrics = profile_task(compute_window_metrics)(timestamp, current_data, engine)
+    return metrics, pop_task_profiles()
+
+
+@task
+@profile_task
+def compute_windows_parallel(windows, workers=None, engine=DRIFT_ENGINE):
+    """Compute the metrics of every window across a process pool."""
+    timestamps = [start for start, _ in windows]
+    frames = [rows for _, rows in windows]
+    engines = [engine] * len(windows)
+    chunksize = max(1, len(windows) // ((workers or os.cpu_count() or 1) * 4))
+    if engine in ("native", "sampled"):
+        get_drift_engine()  # build the profile once before the workers start
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(
+            pool.map(
+                compute_window_metrics_profiled,
+                timestamps,
+                frames,
+                engines,
+                chunksize=chunksize,
+            )
+        )
+    record_task_profiles([record for _, records in results for record in records])
+    return [metrics for metrics, _ in results]
+
+
+@task
+@profile_task
+def insert_metrics(sink, rows):
+    sink.write_many(rows)
+    sink.flush()
+    logging.info("Inserted metrics for %d windows.", len(rows))
+
+
+def send_realtime(sink, windows, engine=DRIFT_ENGINE):
+    """Replay windows one report per SEND_TIMEOUT seconds, as a live job would."""
     last_send = datetime.datetime.now() - datetime.timedelta(seconds=10)
+    for timestamp, rows in windows:
+        write_window_metrics(sink, rows, timestamp, engine)
+
+        new_send = datetime.datetime.now()
+        seconds_elapsed = (new_send - last_send).total_seconds()
+        if seconds_elapsed < SEND_TIMEOUT:
+            time.sleep(SEND_TIMEOUT - seconds_elapsed)
+        last_send += datetime.timedelta(seconds=10)
+        logging.info("Data sent. Waiting for the next iteration.")
+
+
+@flow
+def batch_monitoring_backfill(
+    window="day",
+    *,
+    workers=None,
+    realtime=False,
+    engine=DRIFT_ENGINE,
+    db=None,
+    start=None,
+    end=None,
+):
+    """Compute one drift report per time window of hour.csv.
+
+    Args:
+        window: Window size, "day" or "hour".
+        workers: Processes for the backfill; defaults to the CPU count.
+        realtime: Pace the windows SEND_TIMEOUT seconds apart instead of
+            computing them in parallel.
+        engine: "native", "sampled" or "evidently".
+        db: Metrics database, a libpq connection string or
+            "sqlite:///path"; defaults to the METRICS_DB environment variable.
+        start: First date to backfill, e.g. "2012-06-01"; defaults to the
+            first date of the data.
+        end: Date to stop before; defaults to after the last date.
+    """
+    sink = get_drift_sink(db, get_model().version)
+    try:
+        prep_db(sink)
+    except Exception:
+        sink.close()
+        raise
+    # Score every row once up front; the windows then carry their predictions
+    raw_data = load_raw_data(start, end)
+    scored = raw_data.assign(prediction=predict_rows(raw_data))
+    windows = split_windows(scored, window)
+    logging.info("Backfilling %d %s windows.", len(windows), window)
     try:
-        with psycopg.connect(
-            "host=localhost port=5432 dbname=test user=postgres password=example",
-            autocommit=True,
-        ) as conn:
-            for _ in range(27):
-                with conn.cursor() as curr:
-                    calculate_metrics_postgresql(curr)
-
-                new_send = datetime.datetime.now()
-                seconds_elapsed = (new_send - last_send).total_seconds()
-                if seconds_elapsed < SEND_TIMEOUT:
-                    time.sleep(SEND_TIMEOUT - seconds_elapsed)
-                last_send += datetime.timedelta(seconds=10)
-                logging.info("Data sent. Waiting for the next iteration.")
+        if realtime:
+            send_realtime(sink, windows, engine)
+        else:
+            insert_metrics(sink, compute_windows_parallel(windows, workers, engine))
     except Exception as e:
+        # A partial backfill must not look like a successful one
         logging.error("Error in batch monitoring: %s", str(e))
+        raise
+    finally:
+        sink.close()
+        log_task_profiles(experiment_name="Batch Monitoring")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backfill drift metrics per window.")
+    parser.add_argument("--window", choices=sorted(WINDOW_FREQUENCIES), default="day")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--db",
+        default=None,
+        help="Metrics database: libpq connection string or sqlite:///path",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=DRIFT_ENGINES,
+        default=DRIFT_ENGINE,
+        help="Drift computation: native NumPy engine, its sampled approximation or full Evidently report",
+    )
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        help=f"Send one window every {SEND_TIMEOUT} seconds instead of backfilling",
+    )
+    parser.add_argument("--start", default=None, help="First date, e.g. 2012-06-01")
+    parser.add_argument("--end", default=None, help="Date to stop before")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    batch_monitoring_backfill()
+    args = parse_args()
+    batch_monitoring_backfill(
+        args.window,
+        workers=args.workers,
+        realtime=args.realtime,
+        engine=args.engine,
+        db=args.db,
+        start=args.start,
+        end=args.end,
+    )
@@ -0,0 +1,389 @@
+"""
+metrics_schema.py
+Schema of the drift metrics database and the sink writer that fills it.
+
+Every scored window becomes one row of ``drift_metrics`` and one row per
+column of ``feature_drift``, both tagged with the model version:
+
+    drift_metrics   (timestamp, model_version, prediction_drift,
+                     num_drifted_columns, share_missing_values)
+    feature_drift   (timestamp, model_version, feature, stattest,
+                     drift_score, drifted)
+
+``retraining_events`` records every retraining started by
+retraining_flow.py, which reads the most recent windows to decide on the
+next one.
+
+On PostgreSQL both tables are partitioned by month on ``timestamp``; the
+writer creates the partitions a batch needs before inserting it. Both have
+a timestamp index, so a time-filtered query only reads the partitions and
+rows of its range. A window is stored once per model version: both tables
+are unique on (timestamp, model_version[, feature]), and the writer skips the
+windows already stored, so backfilling a range again changes nothing.
+
+The same transaction folds the new windows into hourly and daily rollups
+(``drift_metrics_hourly``, ``drift_metrics_daily``, ``feature_drift_hourly``
+and ``feature_drift_daily``). A rollup row holds the number of windows and
+the sums and maxima of their metrics for one bucket and model version, so
+it is updated with an upsert instead of being recomputed, and averages are
+``sum / windows``. Dashboards over weeks or years read the rollups.
+"""
+
+import collections
+import datetime
+
+from metrics_sink import get_sink
+
+DRIFT_TABLE = "drift_metrics"
+FEATURE_TABLE = "feature_drift"
+RETRAINING_TABLE = "retraining_events"
+ROLLUPS = ("hourly", "daily")
+
+DRIFT_COLUMNS = (
+    "timestamp",
+    "model_version",
+    "prediction_drift",
+    "num_drifted_columns",
+    "share_missing_values",
+)
+FEATURE_COLUMNS = (
+    "timestamp",
+    "model_version",
+    "feature",
+    "stattest",
+    "drift_score",
+    "drifted",
+)
+DRIFT_KEYS = ("timestamp", "model_version")
+FEATURE_KEYS = ("timestamp", "model_version", "feature")
+RETRAINING_COLUMNS = (
+    "triggered_at",
+    "drift_timestamp",
+    "model_version",
+    "status",
+    "run_id",
+    "registered_version",
+    "reason",
+)
+# Rollup column -> how a new batch is merged into an existing row
+DRIFT_ROLLUP_MERGE = {
+    "windows": "sum",
+    "prediction_drift_sum": "sum",
+    "prediction_drift_max": "max",
+    "drifted_columns_sum": "sum",
+    "drifted_columns_max": "max",
+    "share_missing_values_sum": "sum",
+}
+FEATURE_ROLLUP_MERGE = {
+    "windows": "sum",
+    "drift_score_sum": "sum",
+    "drift_score_max": "max",
+    "drifted_windows": "sum",
+}
+
+WindowMetrics = collections.namedtuple(
+    "WindowMetrics",
+    [
+        "timestamp",
+        "prediction_drift",
+        "num_drifted_columns",
+        "share_missing_values",
+        "features",
+    ],
+)
+WindowMetrics.__doc__ = """Drift metrics of one window.
+
+``features`` maps every column to (stattest, drift score, drifted).
+"""
+
+
+def feature_drift(columns, result):
+    """Per-column (stattest, score, drifted) of a DriftEngine result."""
+    return {
+        column: (
+            str(result["stattest"][i]),
+            float(result["score"][i]),
+            bool(result["drifted"][i]),
+        )
+        for i, column in enumerate(columns)
+    }
+
+
+def bucket_start(timestamp, rollup):
+    """Start of the hour or day ``timestamp`` falls into."""
+    timestamp = timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0) if rollup == "daily" else timestamp
+
+
+def month_start(timestamp):
+    return datetime.datetime(timestamp.year, timestamp.month, 1)
+
+
+def next_month(start):
+    return datetime.datetime(
+        start.year + start.month // 12, start.month % 12 + 1, start.day
+    )
+
+
+def create_statements(dialect):
+    """DDL of the metrics tables, their indexes and rollups."""
+    partition = " PARTITION BY RANGE (timestamp)" if dialect == "postgres" else ""
+    statements = [
+        f"""
+        CREATE TABLE IF NOT EXISTS {DRIFT_TABLE} (
+            timestamp TIMESTAMP NOT NULL,
+            model_version TEXT NOT NULL,
+            prediction_drift FLOAT,
+            num_drifted_columns INTEGER,
+            share_missing_values FLOAT
+        ){partition}
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS {FEATURE_TABLE} (
+            timestamp TIMESTAMP NOT NULL,
+            model_version TEXT NOT NULL,
+            feature TEXT NOT NULL,
+            stattest TEXT,
+            drift_score FLOAT,
+            drifted BOOLEAN
+        ){partition}
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS {RETRAINING_TABLE} (
+            triggered_at TIMESTAMP NOT NULL,
+            drift_timestamp TIMESTAMP,
+            model_version TEXT,
+            status TEXT NOT NULL,
+            run_id TEXT,
+            registered_version TEXT,
+            reason TEXT
+        )
+        """,
+        f"CREATE INDEX IF NOT EXISTS {DRIFT_TABLE}_timestamp_idx "
+        f"ON {DRIFT_TABLE} (timestamp)",
+        f"CREATE INDEX IF NOT EXISTS {FEATURE_TABLE}_timestamp_idx "
+        f"ON {FEATURE_TABLE} (timestamp, feature)",
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {DRIFT_TABLE}_window_idx "
+        f"ON {DRIFT_TABLE} ({', '.join(DRIFT_KEYS)})",
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {FEATURE_TABLE}_window_idx "
+        f"ON {FEATURE_TABLE} ({', '.join(FEATURE_KEYS)})",
+    ]
+    for rollup in ROLLUPS:
+        statements += [
+            f"""
+            CREATE TABLE IF NOT EXISTS {DRIFT_TABLE}_{rollup} (
+                bucket TIMESTAMP NOT NULL,
+                model_version TEXT NOT NULL,
+                windows INTEGER NOT NULL,
+                prediction_drift_sum FLOAT,
+                prediction_drift_max FLOAT,
+                drifted_columns_sum INTEGER,
+                drifted_columns_max INTEGER,
+                share_missing_values_sum FLOAT,
+                PRIMARY KEY (bucket, model_version)
+            )
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS {FEATURE_TABLE}_{rollup} (
+                bucket TIMESTAMP NOT NULL,
+                model_version TEXT NOT NULL,
+                feature TEXT NOT NULL,
+                windows INTEGER NOT NULL,
+                drift_score_sum FLOAT,
+                drift_score_max FLOAT,
+                drifted_windows INTEGER,
+                PRIMARY KEY (bucket, model_version, feature)
+            )
+            """,
+        ]
+    return statements
+
+
+class DriftMetricsWriter:
+    """Sink writer spreading WindowMetrics rows over the metrics tables."""
+
+    def __init__(self, model_version):
+        """
+        Args:
+            model_version: Tag stored with every row, e.g. the MLflow run ID.
+        """
+        self.model_version = model_version
+
+    def statements(self, dialect):
+        return create_statements(dialect)
+
+    def _create_partitions(self, sink, conn, timestamps):
+        # Not cached across batches: a rolled back batch drops its partitions
+        for start in sorted({month_start(t) for t in timestamps}):
+            for table in (DRIFT_TABLE, FEATURE_TABLE):
+                sink.execute(
+                    conn,
+                    f"CREATE TABLE IF NOT EXISTS "
+                    f"{table}_y{start.year}m{start.month:02d} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{start:%Y-%m-%d}') "
+                    f"TO ('{next_month(start):%Y-%m-%d}')",
+                )
+
+    def _new_rows(self, sink, conn, rows):
+        """The rows whose window is not stored yet, each window once."""
+        stored = {
+            _as_datetime(timestamp)
+            for (timestamp,) in sink.query(
+                conn,
+                f"SELECT timestamp FROM {DRIFT_TABLE} WHERE model_version = "
+                f"{sink.placeholder} AND timestamp BETWEEN {sink.placeholder} "
+                f"AND {sink.placeholder}",
+                (
+                    self.model_version,
+                    min(row.timestamp for row in rows),
+                    max(row.timestamp for row in rows),
+                ),
+            )
+        }
+        new = {}
+        for row in rows:
+            if row.timestamp not in stored:
+                new.setdefault(row.timestamp, row)
+        return list(new.values())
+
+    def write(self, sink, conn, rows):
+        """Insert the new windows of a batch and fold them into the rollups.
+
+        Windows already stored for the model version are skipped, so the
+        rollups only count every window once.
+        """
+        rows = [WindowMetrics(*row) for row in rows]
+        if sink.dialect == "postgres":
+            self._create_partitions(sink, conn, [row.timestamp for row in rows])
+        rows = self._new_rows(sink, conn, rows)
+        if not rows:
+            return
+
+        version = self.model_version
+        sink.upsert(
+            conn,
+            DRIFT_TABLE,
+            DRIFT_KEYS,
+            DRIFT_COLUMNS,
+            [(row.timestamp, version, *row[1:4]) for row in rows],
+        )
+        sink.upsert(
+            conn,
+            FEATURE_TABLE,
+            FEATURE_KEYS,
+            FEATURE_COLUMNS,
+            [
+                (row.timestamp, version, feature, *scores)
+                for row in rows
+                for feature, scores in row.features.items()
+            ],
+        )
+        for rollup in ROLLUPS:
+            self._write_rollup(sink, conn, rollup, rows)
+
+    def _write_rollup(self, sink, conn, rollup, rows):
+        # Aggregate the batch first: one upsert per bucket, not per window
+        windows, features = {}, {}
+        for row in rows:
+            bucket = bucket_start(row.timestamp, rollup)
+            old = windows.get(bucket, (0, 0.0, float("-inf"), 0, 0, 0.0))
+            windows[bucket] = (
+                old[0] + 1,
+                old[1] + row.prediction_drift,
+                max(old[2], row.prediction_drift),
+                old[3] + row.num_drifted_columns,
+                max(old[4], row.num_drifted_columns),
+                old[5] + row.share_missing_values,
+            )
+            for feature, (_, score, drifted) in row.features.items():
+                old = features.get((bucket, feature), (0, 0.0, float("-inf"), 0))
+                features[(bucket, feature)] = (
+                    old[0] + 1,
+                    old[1] + score,
+                    max(old[2], score),
+                    old[3] + int(drifted),
+                )
+
+        keys = ("bucket", "model_version")
+        sink.upsert(
+            conn,
+            f"{DRIFT_TABLE}_{rollup}",
+            keys,
+            keys + tuple(DRIFT_ROLLUP_MERGE),
+            [
+                (bucket, self.model_version, *values)
+                for bucket, values in windows.items()
+            ],
+            merge=DRIFT_ROLLUP_MERGE,
+        )
+        keys = ("bucket", "model_version", "feature")
+        sink.upsert(
+            conn,
+            f"{FEATURE_TABLE}_{rollup}",
+            keys,
+            keys + tuple(FEATURE_ROLLUP_MERGE),
+            [
+                (bucket, self.model_version, feature, *values)
+                for (bucket, feature), values in features.items()
+            ],
+            merge=FEATURE_ROLLUP_MERGE,
+        )
+
+
+def get_drift_sink(url=None, model_version="local", **kwargs):
+    """Return a sink writing WindowMetrics rows to the metrics schema."""
+    return get_sink(url, writer=DriftMetricsWriter(model_version), **kwargs)
+
+
+def _as_datetime(value):
+    # SQLite returns timestamps as the ISO strings they were stored as
+    if isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+def latest_windows(sink, count, model_version=None):
+    """The ``count`` most recent drift_metrics rows, newest first.
+
+    Returns:
+        List of (timestamp, model_version, prediction_drift,
+        num_drifted_columns) tuples.
+    """
+    where, params = "", ()
+    if model_version is not None:
+        where, params = f"WHERE model_version = {sink.placeholder} ", (model_version,)
+    with sink.transaction() as conn:
+        rows = sink.query(
+            conn,
+            f"SELECT timestamp, model_version, prediction_drift, num_drifted_columns "
+            f"FROM {DRIFT_TABLE} {where}ORDER BY timestamp DESC LIMIT {int(count)}",
+            params,
+        )
+    return [(_as_datetime(row[0]), *row[1:]) for row in rows]
+
+
+def last_retraining(sink):
+    """The most recent retraining_events row as a dict, or None."""
+    with sink.transaction() as conn:
+        rows = sink.query(
+            conn,
+            f"SELECT {', '.join(RETRAINING_COLUMNS)} FROM {RETRAINING_TABLE} "
+            f"ORDER BY triggered_at DESC LIMIT 1",
+        )
+    if not rows:
+        return None
+    event = dict(zip(RETRAINING_COLUMNS, rows[0]))
+    for column in ("triggered_at", "drift_timestamp"):
+        event[column] = _as_datetime(event[column])
+    return event
+
+
+def record_retraining(sink, **event):
+    """Insert one retraining_events row; missing columns are NULL."""
+    with sink.transaction() as conn:
+        sink.insert(
+            conn,
+            RETRAINING_TABLE,
+            RETRAINING_COLUMNS,
+            [tuple(event.get(column) for column in RETRAINING_COLUMNS)],
+        )
@@ -0,0 +1,377 @@
+"""
+metrics_sink.py
+Buffered writers for the monitoring metrics tables.
+
+A sink collects metric rows in memory and writes them in batches of
+``batch_size``: with ``COPY`` (or multi-row ``executemany``) through a
+connection pool on PostgreSQL, or with ``executemany`` on SQLite, which
+stands in for the database when the backfill or the tests run without the
+docker-compose stack. Failed batches are retried with exponential backoff
+and stay buffered until they are written.
+
+Without a writer a sink inserts into a single table (``dummy_metrics``); a
+writer such as metrics_schema.DriftMetricsWriter spreads each batch over
+several tables and upserts within one transaction.
+
+    with get_sink() as sink:
+        sink.prepare()
+        sink.write_many(rows)
+
+``get_sink`` reads METRICS_DB, either a libpq connection string or
+``sqlite:///path/to/metrics.db``.
+"""
+
+import abc
+import contextlib
+import datetime
+import logging
+import os
+import sqlite3
+import time
+
+# Connection string used to create the database; None derives it from the
+# metrics DSN, so the database is created on the server that DSN points at.
+POSTGRES_ADMIN_DSN = os.environ.get("METRICS_DB_ADMIN")
+POSTGRES_DSN = os.environ.get(
+    "METRICS_DB",
+    "host=localhost port=5432 dbname=test user=postgres password=example",
+)
+SQLITE_PREFIX = "sqlite:///"
+
+TABLE = "dummy_metrics"
+COLUMNS = (
+    "timestamp",
+    "prediction_drift",
+    "num_drifted_columns",
+    "share_missing_values",
+)
+CREATE_TABLE_STATEMENT = f"""
+CREATE TABLE IF NOT EXISTS {TABLE} (
+    timestamp TIMESTAMP,
+    prediction_drift FLOAT,
+    num_drifted_columns INTEGER,
+    share_missing_values FLOAT
+)
+"""
+
+BATCH_SIZE = 1000
+MAX_RETRIES = 3
+RETRY_DELAY = 0.5
+
+
+# The batching and retry settings are plain attributes so subclasses and
+# writers can read them.
+class MetricsSink(abc.ABC):  # pylint: disable=too-many-instance-attributes
+    """Buffers rows and writes them in batches, retrying failed batches."""
+
+    retry_errors = ()
+    dialect = None
+    placeholder = None
+    greatest = None
+
+    def __init__(
+        self,
+        *,
+        table=TABLE,
+        columns=COLUMNS,
+        batch_size=BATCH_SIZE,
+        max_retries=MAX_RETRIES,
+        retry_delay=RETRY_DELAY,
+        writer=None,
+    ):
+        """
+        Args:
+            table: Table the rows are inserted into.
+            columns: Column names, in the order of the row tuples.
+            batch_size: Rows per write; reaching it triggers a flush.
+            max_retries: Attempts after the first failed write of a batch.
+            retry_delay: Seconds before the first retry, doubled each time.
+            writer: Optional object spreading rows over several tables, with
+                ``statements(dialect)`` returning its DDL and
+                ``write(sink, conn, rows)`` writing one batch.
+        """
+        self.table = table
+        self.columns = tuple(columns)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.writer = writer
+        self.rows_written = 0
+        self._buffer = []
+
+    def _create_statements(self):
+        if self.writer:
+            return self.writer.statements(self.dialect)
+        return [CREATE_TABLE_STATEMENT]
+
+    def prepare(self):
+        """Create the database objects the sink writes to."""
+        with self.transaction() as conn:
+            for statement in self._create_statements():
+                self.execute(conn, statement)
+
+    @abc.abstractmethod
+    def transaction(self):
+        """Context manager yielding a connection; commits on success."""
+
+    @abc.abstractmethod
+    def execute(self, conn, statement):
+        """Run one statement without parameters."""
+
+    @abc.abstractmethod
+    def query(self, conn, statement, params=()):
+        """Return every row of a SELECT; ``placeholder`` marks parameters."""
+
+    @abc.abstractmethod
+    def insert(self, conn, table, columns, rows):
+        """Insert rows into a table."""
+
+    def upsert(self, conn, table, keys, columns, rows, *, merge=None):
+        """Insert rows, combining them with existing rows of the same key.
+
+        Args:
+            merge: Dict of column -> "sum" or "max" for the non-key columns;
+                without it, rows whose key exists are not inserted.
+        """
+        action = "DO NOTHING"
+        if merge:
+            action = "DO UPDATE SET " + ", ".join(
+                (
+                    f"{c} = {table}.{c} + excluded.{c}"
+                    if how == "sum"
+                    else f"{c} = {self.greatest}({table}.{c}, excluded.{c})"
+                )
+                for c, how in merge.items()
+            )
+        placeholders = ", ".join([self.placeholder] * len(columns))
+        self._executemany(
+            conn,
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) "
+            f"ON CONFLICT ({', '.join(keys)}) {action}",
+            rows,
+        )
+
+    @abc.abstractmethod
+    def _executemany(self, conn, statement, rows):
+        """Run one parameterized statement for every row."""
+
+    def _write_batch(self, rows):
+        with self.transaction() as conn:
+            if self.writer:
+                self.writer.write(self, conn, rows)
+            else:
+                self.insert(conn, self.table, self.columns, rows)
+
+    def write(self, row):
+        self._buffer.append(tuple(row))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        """Write every buffered row."""
+        while self._buffer:
+            batch = self._buffer[: self.batch_size]
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self._write_batch(batch)
+                    break
+                except self.retry_errors as e:
+                    if attempt == self.max_retries:
+                        raise
+                    delay = self.retry_delay * 2**attempt
+                    logging.warning(
+                        "Writing %d rows failed (%s); retrying in %.1fs.",
+                        len(batch),
+                        e,
+                        delay,
+                    )
+                    time.sleep(delay)
+            del self._buffer[: len(batch)]
+            self.rows_written += len(batch)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _sqlite_value(value):
+    return value.isoformat(sep=" ") if isinstance(value, datetime.datetime) else value
+
+
+class SQLiteSink(MetricsSink):
+    """Local stand-in for the metrics database."""
+
+    retry_errors = (sqlite3.OperationalError,)
+    dialect = "sqlite"
+    placeholder = "?"
+    greatest = "MAX"
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        try:
+            yield self.conn
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def execute(self, conn, statement):
+        conn.execute(statement)
+
+    def query(self, conn, statement, params=()):
+        return conn.execute(
+            statement, tuple(_sqlite_value(v) for v in params)
+        ).fetchall()
+
+    def _executemany(self, conn, statement, rows):
+        conn.executemany(
+            statement, [tuple(_sqlite_value(v) for v in row) for row in rows]
+        )
+
+    def insert(self, conn, table, columns, rows):
+        placeholders = ", ".join("?" * len(columns))
+        self._executemany(
+            conn,
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+            rows,
+        )
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.conn.close()
+
+
+class PostgresSink(MetricsSink):
+    """Writes through a psycopg connection pool with COPY or executemany."""
+
+    dialect = "postgres"
+    placeholder = "%s"
+    greatest = "GREATEST"
+
+    def __init__(
+        self,
+        dsn=POSTGRES_DSN,
+        *,
+        admin_dsn=POSTGRES_ADMIN_DSN,
+        use_copy=True,
+        pool_size=4,
+        pool=None,
+        **kwargs,
+    ):
+        """
+        Args:
+            dsn: libpq connection string of the metrics database.
+            admin_dsn: Connection string ``prepare`` uses to create the
+                database; None connects to ``dsn`` with dbname=postgres.
+            use_copy: Write batches with COPY instead of executemany.
+            pool_size: Largest number of pooled connections.
+            pool: Existing psycopg_pool.ConnectionPool to share.
+        """
+        import psycopg  # pylint: disable=import-outside-toplevel
+
+        super().__init__(**kwargs)
+        self.retry_errors = (psycopg.OperationalError,)
+        self.dsn = dsn
+        self.admin_dsn = admin_dsn
+        self.use_copy = use_copy
+        self.pool_size = pool_size
+        self._own_pool = pool is None
+        self._pool = pool
+
+    @property
+    def pool(self):
+        """The connection pool, opened on first use (after ``prepare``)."""
+        if self._pool is None:
+            from psycopg_pool import (  # pylint: disable=import-outside-toplevel
+                ConnectionPool,
+            )
+
+            self._pool = ConnectionPool(
+                self.dsn, min_size=1, max_size=self.pool_size, open=True
+            )
+        return self._pool
+
+    def prepare(self):
+        """Create the database and the metrics tables if they do not exist."""
+        import psycopg  # pylint: disable=import-outside-toplevel
+
+        dbname = psycopg.conninfo.conninfo_to_dict(self.dsn).get("dbname")
+        if dbname:
+            admin_dsn = self.admin_dsn or psycopg.conninfo.make_conninfo(
+                self.dsn, dbname="postgres"
+            )
+            with psycopg.connect(admin_dsn, autocommit=True) as conn:
+                res = conn.execute(
+                    "SELECT 1 FROM pg_database WHERE datname = %s", (dbname,)
+                )
+                if not res.fetchall():
+                    logging.info("Database '%s' not found. Creating it.", dbname)
+                    conn.execute(
+                        psycopg.sql.SQL("CREATE DATABASE {}").format(
+                            psycopg.sql.Identifier(dbname)
+                        )
+                    )
+        super().prepare()
+        logging.info("Metrics tables are ready.")
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.pool.connection() as conn:
+            yield conn
+
+    def execute(self, conn, statement):
+        conn.execute(statement)
+
+    def query(self, conn, statement, params=()):
+        return conn.execute(statement, params).fetchall()
+
+    def _executemany(self, conn, statement, rows):
+        with conn.cursor() as cur:
+            cur.executemany(statement, rows)
+
+    def insert(self, conn, table, columns, rows):
+        if self.use_copy:
+            with conn.cursor() as cur:
+                with cur.copy(
+                    f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+                ) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+        else:
+            placeholders = ", ".join(["%s"] * len(columns))
+            self._executemany(
+                conn,
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                rows,
+            )
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if self._own_pool and self._pool is not None:
+                self._pool.close()
+
+
+def get_sink(url=None, **kwargs):
+    """Return the sink for METRICS_DB (or ``url``): SQLite or PostgreSQL."""
+    url = url or POSTGRES_DSN
+    if url.startswith(SQLITE_PREFIX):
+        return SQLiteSink(url[len(SQLITE_PREFIX) :], **kwargs)
+    return PostgresSink(url, **kwargs)
@@ -0,0 +1,364 @@
+"""
+online_drift.py
+Streaming drift monitor for served predictions.
+
+Records (features, prediction and a timestamp) are folded into one
+ColumnSketch per column as they arrive. A sketch keeps exact value counts
+while a column has few distinct values and otherwise collapses into a
+log-bucketed quantile sketch with bounded relative error, so its size never
+exceeds ``max_bins`` whatever the traffic. Sketches are plain JSON once
+serialized and merge without further loss, so several service workers can each sketch
+their own traffic and a single monitor can combine them.
+
+Time is cut into panes of ``step``; a sliding window of ``window`` is the
+merge of its panes. Whenever a pane closes, the window ending with it is
+scored by the drift engine against the reference profile and one
+WindowMetrics row is emitted:
+
+    (window end, prediction_drift, num_drifted_columns, share_missing_values,
+     {feature: (stattest, drift score, drifted)})
+
+Memory is bounded by (window / step) panes x columns x max_bins.
+
+Usage:
+    python monitoring/online_drift.py --log predictions.jsonl --window 24h --step 1h
+"""
+
+import argparse
+import datetime
+import json
+import math
+import numbers
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+# pylint: disable=wrong-import-position
+from drift_engine import DriftEngine
+from metrics_schema import WindowMetrics, feature_drift, get_drift_sink
+from reference_profile import load_or_build_profile
+
+from features import FEATURES
+
+REFERENCE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "data", "reference.csv"
+)
+MAX_BINS = 1024
+RELATIVE_ACCURACY = 0.01
+DURATION_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_duration(text):
+    """Parse "15m", "1h" or "7d" into a timedelta."""
+    return datetime.timedelta(**{DURATION_UNITS[text[-1]]: float(text[:-1])})
+
+
+class ColumnSketch:
+    """Mergeable summary of one column's values in bounded memory."""
+
+    def __init__(self, max_bins=MAX_BINS, relative_accuracy=RELATIVE_ACCURACY):
+        """
+        Args:
+            max_bins: Largest number of (value, count) pairs kept.
+            relative_accuracy: Relative error of values once the sketch has
+                collapsed into log buckets. Every further collapse squares
+                gamma, the ratio between the bounds of a bucket, so the
+                buckets get twice as wide on a log scale.
+        """
+        self.max_bins = max_bins
+        self.gamma = None  # None while the counts are exact
+        self._initial_gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.values = np.empty(0)
+        self.counts = np.empty(0)
+
+    @property
+    def exact(self):
+        return self.gamma is None
+
+    @property
+    def count(self):
+        return float(self.counts.sum())
+
+    def _bucket(self, values, gamma):
+        """Map values to the representative value of their log bucket."""
+        magnitude = np.abs(values)
+        with np.errstate(divide="ignore"):
+            index = np.ceil(np.log(magnitude) / math.log(gamma))
+        representative = 2 * gamma**index / (gamma + 1)
+        return np.where(magnitude > 0, np.sign(values) * representative, 0.0)
+
+    def _add(self, values, counts):
+        keys, inverse = np.unique(
+            np.concatenate([self.values, values]), return_inverse=True
+        )
+        self.values = keys
+        self.counts = np.bincount(
+            inverse, np.concatenate([self.counts, counts]), len(keys)
+        )
+        while len(self.values) > self.max_bins:
+            self._collapse(self._initial_gamma if self.exact else self.gamma**2)
+
+    def _collapse(self, gamma):
+        """Re-bucket the kept values with a coarser gamma."""
+        self.gamma = gamma
+        keys, inverse = np.unique(self._bucket(self.values, gamma), return_inverse=True)
+        self.values, self.counts = keys, np.bincount(inverse, self.counts, len(keys))
+
+    def update(self, values):
+        """Add a batch of finite values."""
+        values = np.asarray(values, dtype="float64")
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        if not self.exact:
+            values = self._bucket(values, self.gamma)
+        keys, counts = np.unique(values, return_counts=True)
+        self._add(keys, counts.astype("float64"))
+
+    def merge(self, other):
+        """Fold another sketch of the same column into this one."""
+        values, counts = other.values, other.counts
+        if not other.exact and (self.exact or other.gamma > self.gamma):
+            self._collapse(other.gamma)
+        if not self.exact:
+            values = self._bucket(values, self.gamma)
+        self._add(values, counts)
+        return self
+
+    def to_dict(self):
+        return {
+            "max_bins": self.max_bins,
+            "gamma": self.gamma,
+            "values": self.values.tolist(),
+            "counts": self.counts.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(max_bins=data["max_bins"])
+        sketch.gamma = data["gamma"]
+        sketch.values = np.asarray(data["values"], dtype="float64")
+        sketch.counts = np.asarray(data["counts"], dtype="float64")
+        return sketch
+
+
+class PaneSketch:
+    """Sketches of every column for the records of one time pane."""
+
+    def __init__(self, columns, max_bins=MAX_BINS):
+        self.columns = list(columns)
+        self.sketches = {c: ColumnSketch(max_bins) for c in self.columns}
+        self.cells = 0
+        self.missing_cells = 0
+
+    def update(self, records):
+        """Add a list of record dicts."""
+        for column in self.columns:
+            raw = [record.get(column) for record in records]
+            values = np.array(
+                [v if isinstance(v, numbers.Real) else np.nan for v in raw], "float64"
+            )
+            self.missing_cells += int((~np.isfinite(values)).sum())
+            self.sketches[column].update(values)
+        self.cells += len(records) * len(self.columns)
+
+    def merge(self, other):
+        for column in self.columns:
+            self.sketches[column].merge(other.sketches[column])
+        self.cells += other.cells
+        self.missing_cells += other.missing_cells
+        return self
+
+    def to_dict(self):
+        return {
+            "columns": self.columns,
+            "cells": self.cells,
+            "missing_cells": self.missing_cells,
+            "sketches": {c: s.to_dict() for c, s in self.sketches.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        pane = cls(data["columns"])
+        pane.cells = data["cells"]
+        pane.missing_cells = data["missing_cells"]
+        pane.sketches = {
+            c: ColumnSketch.from_dict(s) for c, s in data["sketches"].items()
+        }
+        return pane
+
+
+class OnlineDriftMonitor:
+    """Scores sliding windows of a record stream against the reference."""
+
+    def __init__(
+        self,
+        engine,
+        window=datetime.timedelta(hours=24),
+        step=datetime.timedelta(hours=1),
+        emit=None,
+        max_bins=MAX_BINS,
+    ):
+        """
+        Args:
+            engine: DriftEngine over the features and "prediction".
+            window: Length of the scored window; a multiple of ``step``.
+            step: Pane length, i.e. how often a window closes.
+            emit: Callable receiving each metrics row; rows are also returned
+                by ``update``.
+            max_bins: Size bound of every column sketch.
+        """
+        if window % step:
+            raise ValueError("The window must be a multiple of the step.")
+        self.engine = engine
+        self.window = window
+        self.step = step
+        self.emit = emit
+        self.max_bins = max_bins
+        self.panes = {}
+        self._open_until = None
+
+    def _pane_start(self, timestamp):
+        epoch = datetime.datetime(1970, 1, 1, tzinfo=timestamp.tzinfo)
+        return timestamp - (timestamp - epoch) % self.step
+
+    def window_metrics(self, end):
+        """Score the window ending at ``end`` from the panes it covers."""
+        merged = PaneSketch(self.engine.columns, self.max_bins)
+        for start, pane in self.panes.items():
+            if end - self.window <= start < end:
+                merged.merge(pane)
+        result = self.engine.compute_weighted(
+            [
+                (merged.sketches[c].values, merged.sketches[c].counts)
+                for c in self.engine.columns
+            ]
+        )
+        return WindowMetrics(
+            end,
+            float(result["score"][self.engine.columns.index("prediction")]),
+            int(result["drifted"].sum()),
+            merged.missing_cells / merged.cells if merged.cells else 0.0,
+            feature_drift(self.engine.columns, result),
+        )
+
+    def _close_until(self, timestamp):
+        rows = []
+        while self._open_until is not None and timestamp >= self._open_until:
+            rows.append(self.window_metrics(self._open_until))
+            self._open_until += self.step
+            oldest = self._open_until - self.window
+            for start in [s for s in self.panes if s < oldest]:
+                del self.panes[start]
+        return rows
+
+    def update(self, records, timestamp_key="timestamp"):
+        """Add records and return the rows of the windows they closed.
+
+        Records must arrive in time order; a record older than the open pane
+        only counts towards windows that have not closed yet.
+        """
+        rows, batch, batch_start = [], [], None
+        for record in records:
+            timestamp = record[timestamp_key]
+            if isinstance(timestamp, str):
+                timestamp = datetime.datetime.fromisoformat(timestamp)
+            start = self._pane_start(timestamp)
+            if start != batch_start:
+                self._add(batch_start, batch)
+                batch, batch_start = [], start
+                if self._open_until is None:
+                    self._open_until = start + self.step
+                rows += self._close_until(timestamp)
+            batch.append(record)
+        self._add(batch_start, batch)
+        if self.emit:
+            for row in rows:
+                self.emit(row)
+        return rows
+
+    def _add(self, start, batch):
+        if not batch:
+            return
+        pane = self.panes.get(start)
+        if pane is None:
+            pane = self.panes[start] = PaneSketch(self.engine.columns, self.max_bins)
+        pane.update(batch)
+
+    def flush(self):
+        """Close the current pane and return its window row."""
+        if self._open_until is None:
+            return []
+        rows = self._close_until(self._open_until)
+        if self.emit:
+            for row in rows:
+                self.emit(row)
+        return rows
+
+
+def follow(path, poll_interval=1.0):
+    """Yield lines of a file as they are appended, like ``tail -f``."""
+    with open(path, "rt", encoding="utf-8") as f:
+        while True:
+            line = f.readline()
+            if line:
+                yield line
+            else:
+                time.sleep(poll_interval)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stream drift metrics.")
+    parser.add_argument("--log", required=True, help="JSON lines of served records")
+    parser.add_argument("--window", type=parse_duration, default="24h")
+    parser.add_argument("--step", type=parse_duration, default="1h")
+    parser.add_argument("--follow", action="store_true", help="Wait for new lines")
+    parser.add_argument(
+        "--db",
+        default=None,
+        help="Also write the rows to the metrics tables of this database "
+        "(libpq connection string or sqlite:///path)",
+    )
+    parser.add_argument(
+        "--model-version",
+        default=os.environ.get("MODEL_RUN_ID", "online"),
+        help="Model version stored with the rows; defaults to MODEL_RUN_ID",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    engine = DriftEngine(
+        load_or_build_profile(REFERENCE_PATH, FEATURES + ["prediction"])
+    )
+    sink = get_drift_sink(args.db, args.model_version) if args.db else None
+    if sink:
+        sink.prepare()
+
+    def emit(row):
+        print(json.dumps([row[0].isoformat(), *row[1:]]))
+        if sink:
+            sink.write(row)
+            sink.flush()
+
+    monitor = OnlineDriftMonitor(engine, args.window, args.step, emit)
+    try:
+        if args.follow:
+            for line in follow(args.log):
+                monitor.update([json.loads(line)])
+        else:
+            with open(args.log, "rt", encoding="utf-8") as f:
+                monitor.update(json.loads(line) for line in f if line.strip())
+            monitor.flush()
+    finally:
+        if sink:
+            sink.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+prediction_store.py
+On-disk memo of model predictions for the monitoring job.
+
+Predictions are kept per model file, in one sorted structured array per
+SHA-256 of the model:
+
+    <root>/<model digest>.npy   [("instant", int64), ("prediction", float64)]
+
+Rows are identified by their ``instant`` column. Asking the store for the
+predictions of a frame looks every instant up with one ``searchsorted``,
+runs the model only on the rows it has not seen for that model, and appends
+them. The file is replaced atomically, so a reader never sees a partial
+write, and it is memory-mapped when read.
+"""
+
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+DEFAULT_STORE_DIR = os.environ.get(
+    "PREDICTION_STORE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "project-mlops", "predictions"),
+)
+RECORD_DTYPE = np.dtype([("instant", "<i8"), ("prediction", "<f8")])
+
+
+class PredictionStore:
+    """Predictions of each model version, keyed by row instant."""
+
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, model_digest):
+        return os.path.join(self.root, f"{model_digest}.npy")
+
+    def load(self, model_digest):
+        """Return the stored records of a model, sorted by instant."""
+        try:
+            return np.load(self.path(model_digest), mmap_mode="r")
+        except FileNotFoundError:
+            return np.empty(0, dtype=RECORD_DTYPE)
+
+    def update(self, model_digest, instants, predictions):
+        """Add predictions of new instants and rewrite the file atomically."""
+        new = np.empty(len(instants), dtype=RECORD_DTYPE)
+        new["instant"] = instants
+        new["prediction"] = predictions
+        records = np.concatenate([np.asarray(self.load(model_digest)), new])
+        # Keep the first prediction stored for an instant
+        _, first = np.unique(records["instant"], return_index=True)
+        records = records[first]
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, records)
+        os.replace(tmp_path, self.path(model_digest))
+
+    def predict(self, model, model_digest, data, transform, id_column="instant"):
+        """Return predictions for every row of ``data``, scoring only new rows.
+
+        Args:
+            model: Fitted model exposing ``predict``.
+            model_digest: SHA-256 of the model file.
+            data: DataFrame with the features and ``id_column``.
+            transform: Callable turning rows of ``data`` into the model input.
+            id_column: Column that identifies a row.
+
+        Returns:
+            Array of predictions aligned with ``data``.
+        """
+        ids = data[id_column].to_numpy(dtype="int64")
+        stored = self.load(model_digest)
+        position = np.minimum(
+            np.searchsorted(stored["instant"], ids), max(len(stored) - 1, 0)
+        )
+        known = (
+            stored["instant"][position] == ids
+            if len(stored)
+            else np.zeros(len(ids), bool)
+        )
+
+        predictions = np.empty(len(ids))
+        predictions[known] = stored["prediction"][position[known]]
+        if not known.all():
+            scored = model.predict(transform(data[~known]))
+            if scored.ndim > 1:
+                scored = scored[:, 0]  # a multi-output model's first target, cnt
+            predictions[~known] = scored
+            self.update(model_digest, ids[~known], scored)
+        logging.info(
+            "Predicted %d new rows, reused %d stored predictions.",
+            (~known).sum(),
+            known.sum(),
+        )
+        return predictions
@@ -0,0 +1,172 @@
+"""
+reference_profile.py
+Precomputed statistics of the monitoring reference data.
+
+The reference data never changes between drift reports, so its statistics are
+computed once and stored next to each other as ``.npy`` files:
+
+    <cache_dir>/<key>/meta.json          row counts, std, column order
+    <cache_dir>/<key>/<column>.support.npy   sorted distinct values
+    <cache_dir>/<key>/<column>.cdf.npy       cumulative share at each value
+    <cache_dir>/<key>/<column>.hist_edges.npy / .hist_counts.npy
+    <cache_dir>/<key>/quantiles.npy          (n_columns, len(QUANTILES))
+
+The key is derived from the SHA-256 of the reference file and the profiled
+columns, and the arrays are memory-mapped when loaded, so every worker of a
+backfill shares the same pages and the cost of a drift check depends only on
+the size of the current window.
+
+Windows are scored against the profile by drift_engine.DriftEngine.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from artifact_cache import file_digest
+
+PROFILE_VERSION = 1
+DEFAULT_PROFILE_DIR = os.environ.get(
+    "REFERENCE_PROFILE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "project-mlops", "profiles"),
+)
+
+# Columns with more distinct values keep a quantile grid instead of every value
+MAX_SUPPORT = 4096
+QUANTILES = np.linspace(0.0, 1.0, 101)
+
+_ARRAYS = ("support", "cdf", "hist_edges", "hist_counts")
+
+
+def _clean(values):
+    """Return the finite values of a column as a float array."""
+    values = np.asarray(values, dtype="float64")
+    return values[np.isfinite(values)]
+
+
+class ReferenceProfile:
+    """Per-column distributions of the reference data."""
+
+    def __init__(self, columns, meta, arrays, quantiles):
+        """
+        Args:
+            columns: Profiled column names, in order.
+            meta: Dict of per-column scalars (rows, std, distinct values).
+            arrays: Dict of column -> dict of the _ARRAYS.
+            quantiles: (n_columns, len(QUANTILES)) array.
+        """
+        self.columns = list(columns)
+        self.meta = meta
+        self.arrays = arrays
+        self.quantiles = quantiles
+
+    @classmethod
+    def build(cls, reference, columns):
+        """Profile the given columns of a reference DataFrame."""
+        meta, arrays = {}, {}
+        quantiles = np.full((len(columns), len(QUANTILES)), np.nan)
+        for i, column in enumerate(columns):
+            values = _clean(reference[column])
+            support, counts = np.unique(values, return_counts=True)
+            meta[column] = {
+                "rows": int(len(values)),
+                "distinct": int(len(support)),
+                "std": float(np.std(values)) if len(values) else 0.0,
+                "exact": bool(len(support) <= MAX_SUPPORT),
+            }
+            cdf = np.cumsum(counts) / max(len(values), 1)
+            if len(support) > MAX_SUPPORT:
+                # Keep the quantile function on an even grid instead
+                probs = np.arange(1, MAX_SUPPORT + 1) / MAX_SUPPORT
+                support = np.quantile(values, probs, method="inverted_cdf")
+                cdf = probs
+            edges = np.histogram_bin_edges(values, bins="sturges")
+            arrays[column] = {
+                "support": support,
+                "cdf": cdf,
+                "hist_edges": edges,
+                "hist_counts": np.histogram(values, edges)[0],
+            }
+            if len(values):
+                quantiles[i] = np.quantile(values, QUANTILES)
+        return cls(columns, meta, arrays, quantiles)
+
+    def save(self, directory):
+        """Write the profile into ``directory`` atomically and return it."""
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, suffix=".tmp")
+        for column, arrays in self.arrays.items():
+            for name in _ARRAYS:
+                np.save(os.path.join(tmp_dir, f"{column}.{name}.npy"), arrays[name])
+        np.save(os.path.join(tmp_dir, "quantiles.npy"), self.quantiles)
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": PROFILE_VERSION,
+                    "columns": self.columns,
+                    "quantiles": QUANTILES.tolist(),
+                    "stats": self.meta,
+                },
+                f,
+                indent=2,
+            )
+        try:
+            os.rename(tmp_dir, directory)
+        except OSError:
+            # Another process saved the same profile first
+            for name in os.listdir(tmp_dir):
+                os.remove(os.path.join(tmp_dir, name))
+            os.rmdir(tmp_dir)
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """Load a saved profile, memory-mapping its arrays by default."""
+        with open(os.path.join(directory, "meta.json"), "rt", encoding="utf-8") as f:
+            spec = json.load(f)
+        if spec.get("version") != PROFILE_VERSION:
+            raise ValueError(f"Unsupported profile version: {spec.get('version')}")
+        arrays = {
+            column: {
+                name: np.load(
+                    os.path.join(directory, f"{column}.{name}.npy"),
+                    mmap_mode=mmap_mode,
+                )
+                for name in _ARRAYS
+            }
+            for column in spec["columns"]
+        }
+        quantiles = np.load(
+            os.path.join(directory, "quantiles.npy"), mmap_mode=mmap_mode
+        )
+        return cls(spec["columns"], spec["stats"], arrays, quantiles)
+
+
+def profile_key(reference_path, columns):
+    """Cache key of the profile of some columns of a reference file."""
+    spec = json.dumps(
+        {"file": file_digest(reference_path), "columns": list(columns)},
+        sort_keys=True,
+    )
+    return f"v{PROFILE_VERSION}-" + hashlib.sha256(spec.encode()).hexdigest()[:32]
+
+
+def load_or_build_profile(reference_path, columns, cache_dir=DEFAULT_PROFILE_DIR):
+    """Return the memory-mapped profile of a reference file, building it once.
+
+    Args:
+        reference_path: CSV file with the reference data.
+        columns: Columns to profile (features and prediction).
+        cache_dir: Directory holding one subdirectory per profile.
+    """
+    directory = os.path.join(cache_dir, profile_key(reference_path, columns))
+    if not os.path.exists(os.path.join(directory, "meta.json")):
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+
+        reference = pd.read_csv(reference_path, usecols=list(columns))
+        ReferenceProfile.build(reference, columns).save(directory)
+    return ReferenceProfile.load(directory)
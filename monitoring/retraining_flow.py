@@ -0,0 +1,272 @@
+"""
+retraining_flow.py
+Retrains and promotes the model when the monitored drift passes a threshold.
+
+The flow reads the ``windows`` most recent rows of ``drift_metrics`` and
+retrains when their mean prediction drift or mean number of drifted columns
+reaches its threshold. The new run is registered and goes through the
+promotion gate of src/promotion.py like any other: it only replaces the
+Production version if it is at least as accurate and fast.
+
+Every retraining is recorded in ``retraining_events`` with the newest
+window it acted on and its outcome ("promoted", "rejected" or "failed").
+A new retraining needs windows written after that one and waits
+``cooldown`` after the previous retraining, so a drift that persists while
+the retrained model is rolled out does not trigger a retraining every run.
+
+Usage:
+    python monitoring/retraining_flow.py --db sqlite:///metrics.db
+    python monitoring/retraining_flow.py --serve --interval 3600
+"""
+
+import argparse
+import collections
+import datetime
+import logging
+import os
+import sys
+
+from prefect import flow, task
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+# pylint: disable=wrong-import-position
+from metrics_schema import (
+    get_drift_sink,
+    last_retraining,
+    latest_windows,
+    record_retraining,
+)
+
+MODEL_NAME = "DecisionTreeRegressor"
+PREDICTION_DRIFT_THRESHOLD = float(os.environ.get("RETRAIN_PREDICTION_DRIFT", 0.5))
+DRIFTED_COLUMNS_THRESHOLD = float(os.environ.get("RETRAIN_DRIFTED_COLUMNS", 6))
+WINDOWS = int(os.environ.get("RETRAIN_WINDOWS", 3))
+COOLDOWN = datetime.timedelta(
+    minutes=float(os.environ.get("RETRAIN_COOLDOWN_MINUTES", 360))
+)
+
+RetrainPolicy = collections.namedtuple(
+    "RetrainPolicy",
+    ["prediction_drift", "drifted_columns", "windows", "cooldown"],
+    defaults=[
+        PREDICTION_DRIFT_THRESHOLD,
+        DRIFTED_COLUMNS_THRESHOLD,
+        WINDOWS,
+        COOLDOWN,
+    ],
+)
+Decision = collections.namedtuple(
+    "Decision", ["retrain", "reason", "drift_timestamp", "model_version"]
+)
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return sum(values) / len(values) if values else 0.0
+
+
+def evaluate_drift(sink, policy=RetrainPolicy(), model_version=None, now=None):
+    """Decide whether the latest drift metrics call for a retraining.
+
+    Args:
+        sink: Drift metrics sink, prepared.
+        policy: Thresholds, number of windows and cooldown.
+        model_version: Only consider the windows of this model version.
+        now: Current time, for the cooldown; defaults to now.
+
+    Returns:
+        Decision with the reason of the verdict and the newest window read.
+    """
+    now = now or datetime.datetime.now()
+    windows = latest_windows(sink, policy.windows, model_version)
+    if not windows:
+        return Decision(False, "no drift metrics", None, model_version)
+    drift_timestamp, version = windows[0][0], windows[0][1]
+
+    last = last_retraining(sink)
+    if last is not None and last["drift_timestamp"] is not None:
+        if drift_timestamp <= last["drift_timestamp"]:
+            return Decision(
+                False,
+                f"no windows after {last['drift_timestamp']}, "
+                "the newest one retrained on",
+                drift_timestamp,
+                version,
+            )
+
+    prediction_drift = _mean(row[2] for row in windows)
+    drifted_columns = _mean(row[3] for row in windows)
+    exceeded = []
+    if prediction_drift >= policy.prediction_drift:
+        exceeded.append(
+            f"prediction drift {prediction_drift:.3f} >= {policy.prediction_drift}"
+        )
+    if drifted_columns >= policy.drifted_columns:
+        exceeded.append(
+            f"drifted columns {drifted_columns:.1f} >= {policy.drifted_columns}"
+        )
+    summary = f"over the last {len(windows)} windows"
+    if not exceeded:
+        return Decision(
+            False,
+            f"prediction drift {prediction_drift:.3f} and drifted columns "
+            f"{drifted_columns:.1f} {summary} are below the thresholds",
+            drift_timestamp,
+            version,
+        )
+
+    if last is not None and now - last["triggered_at"] < policy.cooldown:
+        return Decision(
+            False,
+            f"{', '.join(exceeded)} {summary}, but in cooldown until "
+            f"{last['triggered_at'] + policy.cooldown}",
+            drift_timestamp,
+            version,
+        )
+    return Decision(True, f"{', '.join(exceeded)} {summary}", drift_timestamp, version)
+
+
+@task
+def check_drift(sink, policy, model_version=None):
+    decision = evaluate_drift(sink, policy, model_version)
+    logging.info("Retrain: %s (%s).", decision.retrain, decision.reason)
+    return decision
+
+
+@task
+def register_and_promote(run_id, model_name=MODEL_NAME):
+    """Register the run and pass it through the promotion gate.
+
+    Returns:
+        (registered version, "promoted" or "rejected").
+    """
+    # pylint: disable=import-outside-toplevel
+    from model_registry import init_tracking, register_model
+
+    name, version = register_model(run_id, model_name)
+    tags = init_tracking().MlflowClient().get_model_version(name, version).tags
+    return str(version), "promoted" if tags.get("promotion") == "passed" else "rejected"
+
+
+@flow(log_prints=True)
+def drift_retraining(
+    db=None,
+    *,
+    prediction_drift=PREDICTION_DRIFT_THRESHOLD,
+    drifted_columns=DRIFTED_COLUMNS_THRESHOLD,
+    windows=WINDOWS,
+    cooldown_minutes=COOLDOWN.total_seconds() / 60,
+    model_version=None,
+    dry_run=False,
+):
+    """Retrain, register and promote the model if drift calls for it.
+
+    Args:
+        db: Metrics database, a libpq connection string or
+            "sqlite:///path"; defaults to the METRICS_DB environment variable.
+        prediction_drift: Mean prediction drift that triggers a retraining.
+        drifted_columns: Mean number of drifted columns that triggers one.
+        windows: Most recent windows averaged.
+        cooldown_minutes: Minimum time between two retrainings.
+        model_version: Only consider the windows of this model version.
+        dry_run: Report the decision without retraining.
+
+    Returns:
+        The Decision.
+    """
+    policy = RetrainPolicy(
+        prediction_drift,
+        drifted_columns,
+        windows,
+        datetime.timedelta(minutes=cooldown_minutes),
+    )
+    sink = get_drift_sink(db)
+    try:
+        sink.prepare()
+        decision = check_drift(sink, policy, model_version)
+        if not decision.retrain or dry_run:
+            return decision
+
+        event = {
+            "triggered_at": datetime.datetime.now(),
+            "drift_timestamp": decision.drift_timestamp,
+            "model_version": decision.model_version,
+            "reason": decision.reason,
+        }
+        try:
+            from ml_pipeline import (  # pylint: disable=import-outside-toplevel
+                ml_pipeline,
+            )
+
+            event["run_id"] = ml_pipeline()
+            event["registered_version"], event["status"] = register_and_promote(
+                event["run_id"]
+            )
+        except Exception:
+            record_retraining(sink, **dict(event, status="failed"))
+            raise
+        record_retraining(sink, **event)
+        logging.info(
+            "Retrained run %s: version %s %s.",
+            event["run_id"],
+            event["registered_version"],
+            event["status"],
+        )
+        return decision
+    finally:
+        sink.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument(
+        "--db",
+        default=None,
+        help="Metrics database: libpq connection string or sqlite:///path",
+    )
+    parser.add_argument(
+        "--prediction-drift", type=float, default=PREDICTION_DRIFT_THRESHOLD
+    )
+    parser.add_argument(
+        "--drifted-columns", type=float, default=DRIFTED_COLUMNS_THRESHOLD
+    )
+    parser.add_argument("--windows", type=int, default=WINDOWS)
+    parser.add_argument(
+        "--cooldown-minutes", type=float, default=COOLDOWN.total_seconds() / 60
+    )
+    parser.add_argument("--model-version", default=None)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Report the decision only"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Serve the flow as a deployment checking every --interval seconds",
+    )
+    parser.add_argument("--interval", type=int, default=3600)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    parameters = {
+        "db": args.db,
+        "prediction_drift": args.prediction_drift,
+        "drifted_columns": args.drifted_columns,
+        "windows": args.windows,
+        "cooldown_minutes": args.cooldown_minutes,
+        "model_version": args.model_version,
+        "dry_run": args.dry_run,
+    }
+    if args.serve:
+        drift_retraining.serve(
+            name="drift-retraining", interval=args.interval, parameters=parameters
+        )
+    else:
+        decision = drift_retraining(**parameters)
+        print(f"Retrain: {decision.retrain} ({decision.reason})")
+
+
+if __name__ == "__main__":
+    main()
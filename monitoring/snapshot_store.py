@@ -0,0 +1,352 @@
+"""
+snapshot_store.py
+Compact store of the metric results of Evidently workspace snapshots.
+
+An Evidently snapshot is a JSON file holding the report's configuration,
+data definition and every metric result, histograms included; the
+Evidently UI parses all of them to draw a dashboard. ingest() keeps only
+the numeric scalars of the results, one row per value, in zstd-compressed
+Parquet files:
+
+    <store>/<project id>/month=2024-08/part-<first snapshot id>.parquet
+        timestamp, snapshot_id, metric_id, column_name, field_path, value
+    <store>/_index.json
+        every ingested snapshot, and the time range of every part file
+
+``metric_id`` and ``field_path`` are those of the Evidently dashboard
+panels, e.g. ("DatasetSummaryMetric", "current.number_of_rows").
+query_metrics() reads the index and opens only the part files whose time
+range overlaps the query. compact() merges the part files of each month
+into one.
+
+Once a snapshot is ingested its JSON file is only kept under the retention
+policy: the ``keep_last`` newest snapshots of each project, and any snapshot
+younger than ``keep_days``. HTML reports in ``--reports`` directories follow
+the same policy by modification time.
+
+Usage:
+    python monitoring/snapshot_store.py ingest monitoring/workspace \
+        notebooks/workspace --keep-days 30 --keep-last 5
+    python monitoring/snapshot_store.py query --start 2024-08-01 \
+        --metric DatasetSummaryMetric --field current.number_of_rows
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import math
+import numbers
+import os
+
+import pandas as pd
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshot_store")
+INDEX_FILE = "_index.json"
+COLUMNS = ("timestamp", "snapshot_id", "metric_id", "column_name", "field_path")
+COMPRESSION = "zstd"
+KEEP_DAYS = 30
+KEEP_LAST = 5
+# Keys holding class names and the data behind the report's plots
+SKIPPED_KEYS = ("type", "plot_data")
+
+
+def _metric_id(metric):
+    """Evidently's dashboard id of a metric: the name of its class."""
+    return metric["type"].rsplit(".", 1)[-1]
+
+
+def _scalars(value, path=""):
+    """Yield (dotted path, float) for every numeric leaf of a result.
+
+    NaNs and booleans (verdicts such as ``drift_detected``) are skipped.
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key not in SKIPPED_KEYS:
+                yield from _scalars(item, f"{path}.{key}" if path else str(key))
+    elif (
+        isinstance(value, numbers.Real)
+        and not isinstance(value, bool)
+        and not math.isnan(value)
+    ):
+        yield path, float(value)
+
+
+def flatten_snapshot(snapshot):
+    """One row per numeric value of a snapshot's metric results.
+
+    Lists and plot data (histograms, value counts) are skipped: the
+    dashboards only plot scalars.
+    """
+    suite = snapshot["suite"]
+    timestamp = pd.Timestamp(snapshot["timestamp"])
+    rows = []
+    for metric, result in zip(suite["metrics"], suite["metric_results"]):
+        column = metric.get("column_name")
+        column = column.get("name") if isinstance(column, dict) else column
+        for field_path, value in _scalars(result):
+            rows.append(
+                (
+                    timestamp,
+                    snapshot["id"],
+                    _metric_id(metric),
+                    column,
+                    field_path,
+                    value,
+                )
+            )
+    return pd.DataFrame(rows, columns=[*COLUMNS, "value"])
+
+
+def _atomic_json(path, value):
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(value, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_index(store=STORE_DIR):
+    path = os.path.join(store, INDEX_FILE)
+    if not os.path.exists(path):
+        return {"snapshots": {}, "parts": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_part(store, project_id, month, frame, index):
+    directory = os.path.join(store, project_id, f"month={month}")
+    os.makedirs(directory, exist_ok=True)
+    frame = frame.sort_values(["metric_id", "field_path", "timestamp"])
+    path = os.path.join(directory, f"part-{frame['snapshot_id'].iloc[0]}.parquet")
+    frame.to_parquet(f"{path}.tmp", index=False, compression=COMPRESSION)
+    os.replace(f"{path}.tmp", path)
+    index["parts"].append(
+        {
+            "path": os.path.relpath(path, store),
+            "project_id": project_id,
+            "start": frame["timestamp"].min().isoformat(),
+            "end": frame["timestamp"].max().isoformat(),
+            "rows": len(frame),
+        }
+    )
+
+
+def snapshot_files(workspace):
+    """Yield (project id, snapshot path) for every snapshot of a workspace."""
+    pattern = os.path.join(workspace, "*", "snapshots", "*.json")
+    for path in sorted(glob.glob(pattern)):
+        yield os.path.basename(os.path.dirname(os.path.dirname(path))), path
+
+
+def ingest(workspaces, store=STORE_DIR):
+    """Add the snapshots of ``workspaces`` not yet in the store.
+
+    Returns:
+        Number of snapshots ingested.
+    """
+    os.makedirs(store, exist_ok=True)
+    index = load_index(store)
+    frames = {}
+    for workspace in workspaces:
+        for project_id, path in snapshot_files(workspace):
+            snapshot_id = os.path.splitext(os.path.basename(path))[0]
+            if snapshot_id in index["snapshots"]:
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            frame = flatten_snapshot(snapshot)
+            month = snapshot["timestamp"][:7]
+            frames.setdefault((project_id, month), []).append(frame)
+            index["snapshots"][snapshot_id] = {
+                "project_id": project_id,
+                "timestamp": snapshot["timestamp"],
+                "path": os.path.abspath(path),
+            }
+    for (project_id, month), parts in frames.items():
+        _write_part(store, project_id, month, pd.concat(parts), index)
+    # The index is written last: an interrupted ingest is simply repeated
+    _atomic_json(os.path.join(store, INDEX_FILE), index)
+    return sum(len(parts) for parts in frames.values())
+
+
+def compact(store=STORE_DIR):
+    """Merge the part files of every project and month into one."""
+    index = load_index(store)
+    groups = {}
+    for part in index["parts"]:
+        groups.setdefault(os.path.dirname(part["path"]), []).append(part)
+    parts = []
+    for directory, group in groups.items():
+        if len(group) == 1:
+            parts += group
+            continue
+        frame = pd.concat(
+            pd.read_parquet(os.path.join(store, part["path"])) for part in group
+        )
+        merged = {"parts": []}
+        project_id, month = os.path.split(directory)
+        _write_part(store, project_id, month.split("=", 1)[1], frame, merged)
+        parts += merged["parts"]
+        for part in group:
+            if part["path"] != merged["parts"][0]["path"]:
+                os.remove(os.path.join(store, part["path"]))
+    index["parts"] = parts
+    _atomic_json(os.path.join(store, INDEX_FILE), index)
+
+
+def query_metrics(
+    store=STORE_DIR,
+    start=None,
+    end=None,
+    *,
+    metric_id=None,
+    field_path=None,
+    project_id=None,
+):
+    """Read stored values in [start, end), opening only the overlapping files.
+
+    Args:
+        store: Directory written by ingest().
+        start: First timestamp to include, e.g. "2024-08-01".
+        end: Timestamp to stop before.
+        metric_id: Metric class name, e.g. "DatasetSummaryMetric".
+        field_path: Dotted path of the value, e.g. "current.number_of_rows".
+        project_id: Evidently project id.
+
+    Returns:
+        DataFrame of (timestamp, snapshot_id, metric_id, column_name,
+        field_path, value), sorted by timestamp.
+    """
+    import pyarrow.dataset as ds  # pylint: disable=import-outside-toplevel
+
+    start = None if start is None else pd.Timestamp(start)
+    end = None if end is None else pd.Timestamp(end)
+    paths = [
+        os.path.join(store, part["path"])
+        for part in load_index(store)["parts"]
+        if (project_id is None or part["project_id"] == project_id)
+        and (start is None or pd.Timestamp(part["end"]) >= start)
+        and (end is None or pd.Timestamp(part["start"]) < end)
+    ]
+    if not paths:
+        return pd.DataFrame(columns=[*COLUMNS, "value"])
+
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("timestamp") >= start.to_pydatetime())
+    if end is not None:
+        conditions.append(ds.field("timestamp") < end.to_pydatetime())
+    if metric_id is not None:
+        conditions.append(ds.field("metric_id") == metric_id)
+    if field_path is not None:
+        conditions.append(ds.field("field_path") == field_path)
+    condition = None
+    for item in conditions:
+        condition = item if condition is None else condition & item
+    table = ds.dataset(paths, format="parquet").to_table(filter=condition)
+    return (
+        table.to_pandas()
+        .sort_values(["timestamp", "metric_id", "field_path"])
+        .reset_index(drop=True)
+    )
+
+
+def _expired(timestamps, keep_days, keep_last, now):
+    """Indexes of the entries outside the retention policy."""
+    cutoff = now - datetime.timedelta(days=keep_days)
+    newest_first = sorted(range(len(timestamps)), key=lambda i: timestamps[i])[::-1]
+    return [i for i in newest_first[keep_last:] if timestamps[i] < cutoff]
+
+
+def apply_retention(
+    store=STORE_DIR, keep_days=KEEP_DAYS, keep_last=KEEP_LAST, now=None
+):
+    """Delete the ingested snapshot files outside the retention policy.
+
+    Returns:
+        Paths of the deleted files.
+    """
+    now = now or datetime.datetime.now()
+    index = load_index(store)
+    by_project = {}
+    for snapshot in index["snapshots"].values():
+        if snapshot.get("path"):
+            by_project.setdefault(snapshot["project_id"], []).append(snapshot)
+    deleted = []
+    for snapshots in by_project.values():
+        timestamps = [
+            datetime.datetime.fromisoformat(snapshot["timestamp"])
+            for snapshot in snapshots
+        ]
+        for i in _expired(timestamps, keep_days, keep_last, now):
+            if os.path.exists(snapshots[i]["path"]):
+                os.remove(snapshots[i]["path"])
+                deleted.append(snapshots[i]["path"])
+            snapshots[i]["path"] = None
+    _atomic_json(os.path.join(store, INDEX_FILE), index)
+    return deleted
+
+
+def prune_reports(directory, keep_days=KEEP_DAYS, keep_last=KEEP_LAST, now=None):
+    """Delete the HTML reports of ``directory`` outside the retention policy."""
+    now = now or datetime.datetime.now()
+    paths = sorted(glob.glob(os.path.join(directory, "*.html")))
+    timestamps = [
+        datetime.datetime.fromtimestamp(os.path.getmtime(path)) for path in paths
+    ]
+    deleted = [paths[i] for i in _expired(timestamps, keep_days, keep_last, now)]
+    for path in deleted:
+        os.remove(path)
+    return deleted
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--store", default=STORE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="Ingest and apply retention")
+    ingest_parser.add_argument("workspaces", nargs="+")
+    ingest_parser.add_argument("--keep-days", type=float, default=KEEP_DAYS)
+    ingest_parser.add_argument("--keep-last", type=int, default=KEEP_LAST)
+    ingest_parser.add_argument(
+        "--reports", nargs="*", default=[], help="Directories of HTML reports"
+    )
+    ingest_parser.add_argument("--compact", action="store_true")
+
+    query_parser = commands.add_parser("query", help="Print values as CSV")
+    query_parser.add_argument("--start", default=None)
+    query_parser.add_argument("--end", default=None)
+    query_parser.add_argument("--metric", default=None)
+    query_parser.add_argument("--field", default=None)
+    query_parser.add_argument("--project", default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "query":
+        print(
+            query_metrics(
+                args.store,
+                args.start,
+                args.end,
+                metric_id=args.metric,
+                field_path=args.field,
+                project_id=args.project,
+            ).to_csv(index=False),
+            end="",
+        )
+        return
+
+    ingested = ingest(args.workspaces, args.store)
+    if args.compact:
+        compact(args.store)
+    deleted = apply_retention(args.store, args.keep_days, args.keep_last)
+    for directory in args.reports:
+        deleted += prune_reports(directory, args.keep_days, args.keep_last)
+    print(f"Ingested {ingested} snapshots into {args.store}; deleted {len(deleted)}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+artifact_cache.py
+Local, content-addressed cache for MLflow run artifacts.
+
+Artifacts are looked up by (run ID, artifact path). The file itself is stored
+once under its SHA-256 digest, so identical artifacts logged by different runs
+share a blob:
+
+    <root>/blobs/<digest[:2]>/<digest>
+    <root>/index.json   {"<run_id>/<artifact_path>": {"digest", "size", "last_used"}}
+
+Writes go to a temporary file that is renamed into place, and the index is
+updated under a file lock, so several processes (registry script, web
+service, monitoring) can share one cache directory. When the blobs exceed
+``max_bytes`` the least recently used entries are evicted.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "ARTIFACT_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "project-mlops", "artifacts"),
+)
+DEFAULT_MAX_BYTES = int(os.environ.get("ARTIFACT_CACHE_MAX_BYTES", 2 * 1024**3))
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ArtifactCache:
+    """Content-addressed artifact cache with size-bounded LRU eviction."""
+
+    def __init__(
+        self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, verify=True
+    ):
+        """
+        Args:
+            root: Cache directory.
+            max_bytes: Upper bound on the total size of cached blobs.
+            verify: Re-hash blobs on every hit and drop corrupted entries.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.verify = verify
+        self._blob_dir = os.path.join(root, "blobs")
+        self._index_path = os.path.join(root, "index.json")
+        os.makedirs(self._blob_dir, exist_ok=True)
+
+    @staticmethod
+    def key(run_id, artifact_path):
+        return f"{run_id}/{artifact_path.strip('/')}"
+
+    def _blob_path(self, digest):
+        return os.path.join(self._blob_dir, digest[:2], digest)
+
+    @contextlib.contextmanager
+    def _locked_index(self):
+        """Yield the index for modification and write it back atomically."""
+        with open(os.path.join(self.root, ".lock"), "a+", encoding="utf-8") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                index = self._read_index()
+                yield index
+                self._atomic_write_json(self._index_path, index)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        try:
+            with open(self._index_path, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _atomic_write_json(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def get(self, run_id, artifact_path):
+        """Return the cached file for an artifact, or None on a miss."""
+        key = self.key(run_id, artifact_path)
+        entry = self._read_index().get(key)
+        if entry is None:
+            return None
+
+        blob = self._blob_path(entry["digest"])
+        valid = os.path.exists(blob) and os.path.getsize(blob) == entry["size"]
+        if valid and self.verify:
+            valid = file_digest(blob) == entry["digest"]
+
+        with self._locked_index() as index:
+            if not valid:
+                index.pop(key, None)
+                return None
+            if key in index:
+                index[key]["last_used"] = time.time()
+        return blob
+
+    def put(self, run_id, artifact_path, source_path):
+        """Copy a downloaded file into the cache and return the cached path."""
+        digest = file_digest(source_path)
+        blob = self._blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(blob), suffix=".tmp")
+            os.close(fd)
+            try:
+                shutil.copyfile(source_path, tmp_path)
+                os.replace(tmp_path, blob)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        with self._locked_index() as index:
+            index[self.key(run_id, artifact_path)] = {
+                "digest": digest,
+                "size": os.path.getsize(blob),
+                "last_used": time.time(),
+            }
+            self._evict(index, keep=digest)
+        return blob
+
+    def fetch(self, run_id, artifact_path, download=None):
+        """Return a local path for an artifact, downloading it only on a miss.
+
+        Args:
+            run_id: MLflow run ID.
+            artifact_path: Artifact path inside the run, e.g. "models/x.pkl".
+            download: Optional callable(run_id, artifact_path, dst_dir) -> path.
+                Defaults to MlflowClient.download_artifacts.
+
+        Returns:
+            Path of the cached file. Treat it as read-only.
+        """
+        cached = self.get(run_id, artifact_path)
+        if cached is not None:
+            return cached
+
+        download = download or _mlflow_download
+        with tempfile.TemporaryDirectory(dir=self.root) as tmp_dir:
+            local_path = download(run_id, artifact_path, tmp_dir)
+            return self.put(run_id, artifact_path, local_path)
+
+    def _evict(self, index, keep=None):
+        """Drop least recently used entries until the blobs fit in max_bytes."""
+        sizes = {entry["digest"]: entry["size"] for entry in index.values()}
+        total = sum(sizes.values())
+        for key in sorted(index, key=lambda k: index[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            digest = index[key]["digest"]
+            if digest == keep:
+                continue
+            del index[key]
+            if all(entry["digest"] != digest for entry in index.values()):
+                total -= sizes[digest]
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self._blob_path(digest))
+
+    def total_bytes(self):
+        return sum(
+            {e["digest"]: e["size"] for e in self._read_index().values()}.values()
+        )
+
+
+def _mlflow_download(run_id, artifact_path, dst_dir):
+    from mlflow import MlflowClient  # pylint: disable=import-outside-toplevel
+
+    return MlflowClient().download_artifacts(run_id, artifact_path, dst_dir)
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """Return the process-wide cache configured from the environment."""
+    global _default_cache  # pylint: disable=global-statement
+    if _default_cache is None:
+        _default_cache = ArtifactCache()
+    return _default_cache
+
+
+def fetch_artifact(run_id, artifact_path):
+    """Shortcut for ``get_default_cache().fetch(run_id, artifact_path)``."""
+    return get_default_cache().fetch(run_id, artifact_path)
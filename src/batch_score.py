@@ -0,0 +1,285 @@
+"""
+batch_score.py
+Scores a large hour.csv-shaped file offline with a pool of processes.
+
+The input (CSV or Parquet) is read ``chunk_rows`` rows at a time and the
+chunks are fanned out to the workers; at most two chunks per worker are in
+flight, so memory does not grow with the input. Every worker loads the model
+once: a ``.bkm`` model is memory-mapped, so the workers share its pages.
+
+Predictions are written with the model version, one Parquet file per chunk
+named after the chunk's position, so reading the directory in name order
+gives the rows in input order:
+
+    <output>/part-00000.parquet   instant, dteday, hr, prediction, model_version
+    <output>/_progress.json       chunks completed in order, source and model
+
+``prediction`` is the model's first target (cnt); a multi-output model also
+writes a ``prediction_<target>`` column for each of its other targets.
+
+After a crash, running the same command again resumes after the last chunk
+completed in order; chunks already written past it are scored again.
+
+The model is, in order of preference, ``--model`` (a local ``.bkm`` or
+``.pkl`` file), the artifacts of ``--run-id`` (or MODEL_RUN_ID) or the
+Production version of the registered model.
+
+Usage:
+    python src/batch_score.py data/hour.csv --output predictions --workers 8
+"""
+
+import argparse
+import collections
+import json
+import os
+import pickle
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from artifact_cache import fetch_artifact, file_digest
+from features import DEFAULT_TRANSFORMER, FEATURE_SPEC_FILENAME, FeatureTransformer
+from model_format import MODEL_EXTENSION, load_model, split_outputs
+
+MODEL_NAME = "DecisionTreeRegressor"
+CHUNK_ROWS = 100_000
+KEEP_COLUMNS = ("instant", "dteday", "hr")
+PROGRESS_FILE = "_progress.json"
+# Chunks submitted per worker ahead of the one being written
+IN_FLIGHT_PER_WORKER = 2
+
+ModelSource = collections.namedtuple("ModelSource", ["path", "spec_path", "version"])
+
+_worker_model = None
+
+
+def resolve_model(model_path=None, run_id=None, model_name=MODEL_NAME):
+    """Locate the model file, its feature spec and its version.
+
+    Artifacts are fetched here, once, through the local artifact cache, so
+    the workers only open local files.
+    """
+    if model_path:
+        spec_path = os.path.join(os.path.dirname(model_path), FEATURE_SPEC_FILENAME)
+        return ModelSource(model_path, spec_path, file_digest(model_path)[:12])
+
+    import mlflow  # pylint: disable=import-outside-toplevel
+
+    run_id = run_id or os.environ.get("MODEL_RUN_ID")
+    version = run_id
+    if not run_id:
+        production = mlflow.tracking.MlflowClient().get_latest_versions(
+            f"{model_name}_registered", stages=["Production"]
+        )[0]
+        run_id, version = production.run_id, f"{model_name}/{production.version}"
+
+    # Prefer the memory-mapped format, as the web service does
+    try:
+        path = fetch_artifact(run_id, f"models/{model_name}{MODEL_EXTENSION}")
+    except (mlflow.exceptions.MlflowException, OSError):
+        path = fetch_artifact(run_id, f"models/{model_name}.pkl")
+    try:
+        spec_path = fetch_artifact(run_id, f"models/{FEATURE_SPEC_FILENAME}")
+    except (mlflow.exceptions.MlflowException, OSError):
+        spec_path = None
+    return ModelSource(path, spec_path, version)
+
+
+def load_scoring_model(source):
+    """Return (model, transformer) for a ModelSource."""
+    if source.path.endswith(MODEL_EXTENSION):
+        model = load_model(source.path)
+    else:
+        with open(source.path, "rb") as f:
+            model = pickle.load(f)
+    transformer = (
+        FeatureTransformer.load(source.spec_path)
+        if source.spec_path and os.path.exists(source.spec_path)
+        else DEFAULT_TRANSFORMER
+    )
+    return model, transformer
+
+
+def _init_worker(source):
+    global _worker_model  # pylint: disable=global-statement
+    _worker_model = load_scoring_model(source)
+
+
+def _part_path(output_dir, index):
+    return os.path.join(output_dir, f"part-{index:05d}.parquet")
+
+
+def score_chunk(index, chunk, output_dir, version, keep_columns=KEEP_COLUMNS):
+    """Predict one chunk and write its part file; return the number of rows."""
+    model, transformer = _worker_model
+    scored = chunk[[column for column in keep_columns if column in chunk]].copy()
+    outputs = split_outputs(model, model.predict(transformer.transform(chunk)))
+    for i, (target, values) in enumerate(outputs.items()):
+        scored["prediction" if i == 0 else f"prediction_{target}"] = values
+    scored["model_version"] = version
+    path = _part_path(output_dir, index)
+    scored.to_parquet(f"{path}.tmp", index=False)
+    os.replace(f"{path}.tmp", path)
+    return len(scored)
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS, skip_chunks=0):
+    """Yield (index, DataFrame) chunks of a CSV or Parquet file."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+        batches = pq.ParquetFile(path).iter_batches(batch_size=chunk_rows)
+        for index, batch in enumerate(batches):
+            if index >= skip_chunks:
+                yield index, batch.to_pandas()
+        return
+    chunks = pd.read_csv(
+        path, chunksize=chunk_rows, skiprows=range(1, skip_chunks * chunk_rows + 1)
+    )
+    for index, chunk in enumerate(chunks, start=skip_chunks):
+        yield index, chunk
+
+
+def _source_id(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _load_progress(output_dir, expected):
+    """Return the chunks completed in a previous run of the same job."""
+    path = os.path.join(output_dir, PROGRESS_FILE)
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        progress = json.load(f)
+    job = {key: progress.get(key) for key in expected}
+    if job != expected:
+        raise ValueError(
+            f"{output_dir} holds the output of another job ({job}); "
+            "use another output directory or --restart."
+        )
+    return progress["completed"]
+
+
+def _save_progress(output_dir, job, completed, rows, done=False):
+    path = os.path.join(output_dir, PROGRESS_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(dict(job, completed=completed, rows=rows, done=done), f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def score_file(
+    source_path,
+    output_dir,
+    model_source,
+    *,
+    workers=None,
+    chunk_rows=CHUNK_ROWS,
+    restart=False,
+):
+    """Score ``source_path`` into Parquet part files under ``output_dir``.
+
+    Args:
+        source_path: CSV or Parquet file with the columns of hour.csv.
+        output_dir: Directory of the part files and the progress file.
+        model_source: ModelSource from resolve_model.
+        workers: Worker processes; 1 scores in this process. Defaults to the
+            number of CPUs.
+        chunk_rows: Rows per chunk and per part file.
+        restart: Discard the output of a previous run instead of resuming.
+
+    Returns:
+        Dict with the rows and chunks scored by this run, the chunks resumed
+        from, the elapsed seconds and rows per second.
+    """
+    workers = workers or os.cpu_count() or 1
+    if restart and os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    job = {
+        "source": _source_id(source_path),
+        "chunk_rows": chunk_rows,
+        "model_version": model_source.version,
+    }
+    resumed = _load_progress(output_dir, job)
+    completed, rows = resumed, 0
+    chunks = read_chunks(source_path, chunk_rows, skip_chunks=resumed)
+
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(model_source)
+        for index, chunk in chunks:
+            rows += score_chunk(index, chunk, output_dir, model_source.version)
+            completed = index + 1
+            _save_progress(output_dir, job, completed, rows)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(model_source,)
+        ) as pool:
+            pending = collections.deque()
+            for index, chunk in chunks:
+                pending.append(
+                    pool.submit(
+                        score_chunk, index, chunk, output_dir, model_source.version
+                    )
+                )
+                # Record progress in input order, keeping the queue bounded
+                while len(pending) >= workers * IN_FLIGHT_PER_WORKER or (
+                    pending and pending[0].done()
+                ):
+                    rows += pending.popleft().result()
+                    completed += 1
+                    _save_progress(output_dir, job, completed, rows)
+            while pending:
+                rows += pending.popleft().result()
+                completed += 1
+                _save_progress(output_dir, job, completed, rows)
+    elapsed = time.perf_counter() - start
+
+    _save_progress(output_dir, job, completed, rows, done=True)
+    return {
+        "rows": rows,
+        "chunks": completed - resumed,
+        "resumed_from_chunk": resumed,
+        "workers": workers,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed else 0.0,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("source", help="CSV or Parquet file with hour.csv columns")
+    parser.add_argument("--output", default="predictions")
+    parser.add_argument("--model", default=None, help="Local .bkm or .pkl model")
+    parser.add_argument("--run-id", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument(
+        "--restart", action="store_true", help="Discard a previous run's output"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    model_source = resolve_model(args.model, args.run_id)
+    stats = score_file(
+        args.source,
+        args.output,
+        model_source,
+        workers=args.workers,
+        chunk_rows=args.chunk_rows,
+        restart=args.restart,
+    )
+    print(
+        f"Scored {stats['rows']} rows in {stats['chunks']} chunks with "
+        f"{stats['workers']} workers: {stats['rows_per_second']:.0f} rows/s "
+        f"(model {model_source.version}, output {args.output})."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,7 @@
 # src/constants.py
 
-FEATURES = [
-    "season",
-    "holiday",
-    "workingday",
-    "weathersit",
-    "temp",
-    "atemp",
-    "hum",
-    "windspeed",
-    "hr",
-    "mnth",
-    "yr",
-]
+# The feature list lives in src/features.py together with the transformer
+# that is saved with every model; this module keeps the old import working.
+from features import FEATURES
+
+__all__ = ["FEATURES"]
@@ -1,15 +1,12 @@
-import pandas as pd
-from sklearn.model_selection import train_test_split
+"""
+create_monitoring_datasets.py
+Splits hour.csv into reference (older) and production (newer) data by date,
+written as month-partitioned Parquet under data/partitioned.
 
-# Load the original dataset
-df = pd.read_csv("../project-mlops/data/hour.csv")
+See dataset_partitions.py for the options and the layout.
+"""
 
+from dataset_partitions import main
 
-# Split the data into reference (older data) and production (newer data)
-reference_data, production_data = train_test_split(df, test_size=0.3, shuffle=False)
-
-# Save the datasets
-reference_data.to_csv("reference_data.csv", index=False)
-production_data.to_csv("production_data.csv", index=False)
-
-print("Reference and production datasets created successfully.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+dataset_partitions.py
+Splits hour.csv into reference and production data by date, stored as
+date-partitioned Parquet files.
+
+The source is streamed in chunks of ``chunk_rows`` rows, so peak memory
+depends on the chunk size and not on the size of the source. Every row goes
+to the split whose date range contains it and to the partition of its month
+(or day):
+
+    <root>/_dataset.json
+    <root>/reference/month=2011-01/part-00000.parquet
+    <root>/production/month=2012-06/part-00001.parquet
+
+Each chunk adds one part file to each partition it touches. The dataset is
+written to a temporary directory that replaces ``root`` once complete.
+
+read_partitions() opens only the partitions that overlap the requested date
+range, so a job that needs one month reads one month.
+
+Usage:
+    python src/create_monitoring_datasets.py [--boundaries 2012-05-27]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+SOURCE_PATH = os.path.join(DATA_DIR, "hour.csv")
+DATASET_DIR = os.path.join(DATA_DIR, "partitioned")
+
+# Production starts on the day the old 70/30 row split fell on
+DEFAULT_BOUNDARIES = ("2012-05-27",)
+DEFAULT_NAMES = ("reference", "production")
+DATE_COLUMN = "dteday"
+# Partition key -> length of its prefix of the ISO date
+PARTITIONS = {"month": 7, "day": 10}
+CHUNK_ROWS = 100_000
+METADATA_FILE = "_dataset.json"
+
+# Fixed so that every part file has the same schema whatever its chunk holds
+HOUR_DTYPES = {
+    "instant": "int64",
+    "dteday": "str",
+    "season": "int64",
+    "yr": "int64",
+    "mnth": "int64",
+    "hr": "int64",
+    "holiday": "int64",
+    "weekday": "int64",
+    "workingday": "int64",
+    "weathersit": "int64",
+    "temp": "float64",
+    "atemp": "float64",
+    "hum": "float64",
+    "windspeed": "float64",
+    "casual": "int64",
+    "registered": "int64",
+    "cnt": "int64",
+}
+
+
+def split_to_partitions(
+    source=SOURCE_PATH,
+    root=DATASET_DIR,
+    *,
+    boundaries=DEFAULT_BOUNDARIES,
+    names=DEFAULT_NAMES,
+    partition="month",
+    chunk_rows=CHUNK_ROWS,
+    dtypes=None,
+):
+    """Stream ``source`` into date-partitioned Parquet splits under ``root``.
+
+    Args:
+        source: CSV file with a ``dteday`` column of ISO dates.
+        root: Output directory; replaced if it exists.
+        boundaries: Ascending ISO dates; each starts the next split.
+        names: One split name per date range, ``len(boundaries) + 1`` names.
+        partition: "month" or "day".
+        chunk_rows: Rows read at a time.
+        dtypes: Column dtypes; defaults to those of hour.csv.
+
+    Returns:
+        The dataset metadata, also saved as ``root/_dataset.json``.
+    """
+    boundaries, names = [str(b) for b in boundaries], list(names)
+    if len(names) != len(boundaries) + 1:
+        raise ValueError("Expected one split name more than boundaries.")
+    if boundaries != sorted(boundaries):
+        raise ValueError("Boundaries must be in ascending order.")
+    width = PARTITIONS[partition]
+
+    root = os.path.abspath(root)
+    os.makedirs(os.path.dirname(root), exist_ok=True)
+    tmp_root = tempfile.mkdtemp(dir=os.path.dirname(root), prefix=".partitions-")
+    rows = dict.fromkeys(names, 0)
+    try:
+        chunks = pd.read_csv(
+            source,
+            chunksize=chunk_rows,
+            dtype=HOUR_DTYPES if dtypes is None else dtypes,
+        )
+        for index, chunk in enumerate(chunks):
+            dates = chunk[DATE_COLUMN].to_numpy(dtype=str)
+            split = np.searchsorted(np.asarray(boundaries, dtype=str), dates, "right")
+            keys = chunk[DATE_COLUMN].str[:width].to_numpy()
+            for (position, key), part in chunk.groupby([split, keys], sort=False):
+                directory = os.path.join(
+                    tmp_root, names[position], f"{partition}={key}"
+                )
+                os.makedirs(directory, exist_ok=True)
+                part.to_parquet(
+                    os.path.join(directory, f"part-{index:05d}.parquet"), index=False
+                )
+                rows[names[position]] += len(part)
+
+        metadata = {
+            "source": os.path.basename(source),
+            "boundaries": boundaries,
+            "names": names,
+            "partition": partition,
+            "rows": rows,
+        }
+        with open(os.path.join(tmp_root, METADATA_FILE), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2)
+
+        if os.path.exists(root):
+            old_root = tempfile.mkdtemp(dir=os.path.dirname(root), prefix=".old-")
+            os.replace(root, os.path.join(old_root, "dataset"))
+            os.replace(tmp_root, root)
+            shutil.rmtree(old_root)
+        else:
+            os.replace(tmp_root, root)
+    except BaseException:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+        raise
+    return metadata
+
+
+def load_metadata(root=DATASET_DIR):
+    with open(os.path.join(root, METADATA_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def has_partitions(root=DATASET_DIR):
+    return os.path.exists(os.path.join(root, METADATA_FILE))
+
+
+def read_partitions(root=DATASET_DIR, splits=None, start=None, end=None, columns=None):
+    """Read rows of the partitioned dataset, opening only the needed files.
+
+    Args:
+        root: Directory written by split_to_partitions.
+        splits: Split names to read; all of them by default, in date order.
+        start: First ISO date to include.
+        end: ISO date to stop before.
+        columns: Columns to read; all by default.
+
+    Returns:
+        DataFrame of the rows in [start, end), partition by partition in
+        date order.
+    """
+    import pyarrow.dataset as ds  # pylint: disable=import-outside-toplevel
+
+    metadata = load_metadata(root)
+    partition, width = metadata["partition"], PARTITIONS[metadata["partition"]]
+    paths = []
+    for name in metadata["names"] if splits is None else splits:
+        directory = os.path.join(root, name)
+        if not os.path.isdir(directory):
+            continue
+        for entry in sorted(os.listdir(directory)):
+            key = entry[len(partition) + 1 :]
+            if (start is None or key >= str(start)[:width]) and (
+                end is None or key <= str(end)[:width]
+            ):
+                partition_dir = os.path.join(directory, entry)
+                paths += [
+                    os.path.join(partition_dir, part)
+                    for part in sorted(os.listdir(partition_dir))
+                ]
+    if not paths:
+        return pd.DataFrame(columns=columns)
+
+    date = ds.field(DATE_COLUMN)
+    condition = None
+    if start is not None:
+        condition = date >= str(start)
+    if end is not None:
+        condition = (
+            date < str(end) if condition is None else condition & (date < str(end))
+        )
+    table = ds.dataset(paths, format="parquet").to_table(
+        columns=columns, filter=condition
+    )
+    return table.to_pandas()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Split hour.csv into date-partitioned reference and "
+        "production data."
+    )
+    parser.add_argument("--source", default=SOURCE_PATH)
+    parser.add_argument("--output", default=DATASET_DIR)
+    parser.add_argument(
+        "--boundaries",
+        nargs="+",
+        default=list(DEFAULT_BOUNDARIES),
+        help="ISO dates starting each split after the first",
+    )
+    parser.add_argument("--names", nargs="+", default=list(DEFAULT_NAMES))
+    parser.add_argument("--partition", choices=sorted(PARTITIONS), default="month")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    metadata = split_to_partitions(
+        args.source,
+        args.output,
+        boundaries=args.boundaries,
+        names=args.names,
+        partition=args.partition,
+        chunk_rows=args.chunk_rows,
+    )
+    print(f"Partitioned {metadata['rows']} rows into {args.output}.")
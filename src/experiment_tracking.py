@@ -2,44 +2,60 @@
 To run this file you need to launch the MLflow server locally by running the following command in your terminal:
 
 mlflow server --backend-store-uri sqlite:///backend.db
+
+Importing this module has no side effects: MLflow and scikit-learn are
+imported, and the tracking URI, experiment and models directory are set up,
+on the first call that needs them (see init_tracking).
 """
 
 import os
 import pickle
 import sys  # Standard library import
 
-# Third-party imports
-import mlflow
-import mlflow.sklearn
-import pandas as pd
-from mlflow import MlflowClient
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import mean_absolute_error, r2_score
-from sklearn.model_selection import train_test_split
-from sklearn.tree import DecisionTreeRegressor
-
 from constants import FEATURES
+from features import DEFAULT_TRANSFORMER, FEATURE_SPEC_FILENAME
+from model_format import MODEL_EXTENSION, save_model
+from promotion import benchmark_model, load_benchmark_sample, promote_if_eligible
 
 # Local application imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-# Set the remote tracking URI
-REMOTE_TRACKING_URI = "http://127.0.0.1:5000"
-mlflow.set_tracking_uri(REMOTE_TRACKING_URI)
+REMOTE_TRACKING_URI = os.environ.get("MLFLOW_TRACKING_URI", "http://127.0.0.1:5000")
+EXPERIMENT_NAME = "Sklearn Models"
+models_dir = os.path.join(os.getcwd(), "models")
+
+_tracking_initialized = False
 
-print(f"MLflow tracking URI set to: {mlflow.get_tracking_uri()}")
 
-# Create new experiment
-EXPERIMENT_NAME = "Sklearn Models"
-mlflow.set_experiment(EXPERIMENT_NAME)
+def init_tracking():
+    """Point MLflow at the tracking server and experiment, once.
 
-# Ensure the models directory exists
-models_dir = os.path.join(os.getcwd(), "models")
-os.makedirs(models_dir, exist_ok=True)
+    Returns:
+        The mlflow module.
+    """
+    global _tracking_initialized  # pylint: disable=global-statement
+    import mlflow  # pylint: disable=import-outside-toplevel
+
+    if not _tracking_initialized:
+        mlflow.set_tracking_uri(REMOTE_TRACKING_URI)
+        print(f"MLflow tracking URI set to: {mlflow.get_tracking_uri()}")
+        mlflow.set_experiment(EXPERIMENT_NAME)
+        # Ensure the models directory exists
+        os.makedirs(models_dir, exist_ok=True)
+        _tracking_initialized = True
+    return mlflow
 
 
 def train_and_log_model(
-    model, model_name, x_train, x_test, y_train, y_test, dataset_path
+    model,
+    model_name,
+    x_train,
+    x_test,
+    y_train,
+    y_test,
+    dataset_path,
+    *,
+    transformer=DEFAULT_TRANSFORMER,
 ):
     """Train a model and log relevant information to MLflow.
 
@@ -51,13 +67,20 @@ def train_and_log_model(
         y_train: Training labels.
         y_test: Test labels.
         dataset_path: Path to the dataset.
+        transformer: FeatureTransformer applied to the features; it is logged
+            with the model so serving uses the same one.
 
     Returns:
         run_id: The ID of the MLflow run.
     """
+    # pylint: disable=import-outside-toplevel
+    import mlflow.sklearn
+    from sklearn.metrics import mean_absolute_error, r2_score
+
+    mlflow = init_tracking()
     with mlflow.start_run(run_name=model_name) as run:
         mlflow.set_tag("model", model_name)
-        mlflow.set_tag('developer', 'kachiann')
+        mlflow.set_tag("developer", "kachiann")
 
         if dataset_path:
             # Log the full dataset as an artifact
@@ -74,10 +97,10 @@ def train_and_log_model(
         mlflow.log_artifact(test_csv_path, artifact_path="data")
 
         # Train model
-        model.fit(x_train, y_train)
+        model.fit(transformer.transform(x_train), y_train)
 
         # Make predictions
-        predictions = model.predict(x_test)
+        predictions = model.predict(transformer.transform(x_test))
 
         # Log parameters
         for param, value in model.get_params().items():
@@ -89,6 +112,10 @@ def train_and_log_model(
         mlflow.log_metric("mae", mae)
         mlflow.log_metric("r2", r2)
 
+        # Log latency, size and memory measured on the fixed benchmark sample
+        sample = load_benchmark_sample(dataset_path) if dataset_path else x_test
+        mlflow.log_metrics(benchmark_model(model, sample, transformer))
+
         # Log model with MLflow
         mlflow.sklearn.log_model(model, "model")
 
@@ -100,6 +127,15 @@ def train_and_log_model(
         # Log the pickle file as an artifact
         mlflow.log_artifact(pickle_path, artifact_path="models")
 
+        # Save and log the memory-mappable copy used for serving
+        mapped_path = os.path.join(models_dir, f"{model_name}{MODEL_EXTENSION}")
+        save_model(model, mapped_path)
+        mlflow.log_artifact(mapped_path, artifact_path="models")
+
+        # Log the feature transformer the model was trained with
+        spec_path = transformer.save(os.path.join(models_dir, FEATURE_SPEC_FILENAME))
+        mlflow.log_artifact(spec_path, artifact_path="models")
+
         print(f"Run ID for {model_name}:", run.info.run_id)
         print(f"Model saved as {pickle_path}")
 
@@ -108,6 +144,15 @@ def train_and_log_model(
 
 def main():
     """Main function to load data, train models, and log to MLflow."""
+    # pylint: disable=import-outside-toplevel
+    import pandas as pd
+    from mlflow import MlflowClient
+    from sklearn.linear_model import LinearRegression
+    from sklearn.model_selection import train_test_split
+    from sklearn.tree import DecisionTreeRegressor
+
+    mlflow = init_tracking()
+
     # Path to the dataset
     dataset_path = os.path.abspath("../project-mlops/data/hour.csv")
 
@@ -152,16 +197,17 @@ def main():
         dataset_path,
     )
 
-    # Register and transition Linear Regression model to Production
+    # Register Linear Regression and promote it if it passes the gate
     client = MlflowClient()
     lr_model_uri = f"runs:/{lr_run_id}/model"
     lr_registered_model = mlflow.register_model(
         lr_model_uri, "LinearRegression_registered"
     )
-    client.transition_model_version_stage(
-        name=lr_registered_model.name,
-        version=lr_registered_model.version,
-        stage="Production",
+    promote_if_eligible(
+        client,
+        lr_registered_model.name,
+        lr_registered_model.version,
+        client.get_run(lr_run_id).data.metrics,
     )
 
     # Train and log Decision Tree Regressor
@@ -175,15 +221,16 @@ def main():
         dataset_path,
     )
 
-    # Register and transition Decision Tree Regressor model to Production
+    # Register Decision Tree Regressor and promote it if it passes the gate
     dt_model_uri = f"runs:/{dt_run_id}/model"
     dt_registered_model = mlflow.register_model(
         dt_model_uri, "DecisionTreeRegressor_registered"
     )
-    client.transition_model_version_stage(
-        name=dt_registered_model.name,
-        version=dt_registered_model.version,
-        stage="Production",
+    promote_if_eligible(
+        client,
+        dt_registered_model.name,
+        dt_registered_model.version,
+        client.get_run(dt_run_id).data.metrics,
     )
 
     print("\nExperiment Tracking all Completed")
@@ -0,0 +1,249 @@
+"""
+features.py
+The single definition of the model inputs and targets, shared by training,
+the web service, the Lambda handler and monitoring.
+
+A FeatureTransformer fixes the column order and dtype, optionally adds cyclic
+sine/cosine encodings for periodic columns such as ``hr`` and ``mnth``, and
+turns records, DataFrames or arrays into one C-contiguous float matrix. It is
+saved as JSON next to every trained model so serving applies exactly the
+transformation the model was trained with.
+"""
+
+import itertools
+import json
+import numbers
+import operator
+import os
+
+import numpy as np
+
+FEATURES = [
+    "season",
+    "holiday",
+    "workingday",
+    "weathersit",
+    "temp",
+    "atemp",
+    "hum",
+    "windspeed",
+    "hr",
+    "mnth",
+    "yr",
+]
+
+# Targets of hour.csv, cnt being casual + registered. A model trained on
+# several of them predicts one column per target, in the order given.
+TARGETS = ["cnt", "casual", "registered"]
+
+# Period of the columns that can be encoded as points on a circle
+CYCLIC_PERIODS = {"hr": 24, "mnth": 12}
+
+FEATURE_SPEC_FILENAME = "feature_transformer.json"
+FEATURE_SPEC_VERSION = 1
+
+
+class MissingFeaturesError(ValueError):
+    """Raised when input data lacks some of the required columns."""
+
+    def __init__(self, features):
+        self.features = list(features)
+        super().__init__(f"Missing features: {', '.join(self.features)}")
+
+
+class NonNumericFeatureError(ValueError):
+    """Raised when a required column holds non-numeric values."""
+
+    def __init__(self, feature):
+        self.feature = feature
+        super().__init__(f"Feature '{feature}' must be numeric.")
+
+
+class FeatureTransformer:
+    """Turns raw bike-sharing inputs into the model's feature matrix."""
+
+    def __init__(self, columns=None, cyclic=(), dtype="float64"):
+        """
+        Args:
+            columns: Raw input columns, in model order. Defaults to FEATURES.
+            cyclic: Columns from CYCLIC_PERIODS to add sin/cos encodings for.
+            dtype: Floating point dtype of the produced matrix.
+        """
+        self.columns = tuple(columns or FEATURES)
+        self.cyclic = tuple(cyclic)
+        self.dtype = np.dtype(dtype)
+
+        unknown = [c for c in self.cyclic if c not in CYCLIC_PERIODS]
+        if unknown:
+            raise ValueError(f"No cyclic period known for: {', '.join(unknown)}")
+        self._cyclic_index = [self.columns.index(c) for c in self.cyclic]
+        self._periods = np.array([CYCLIC_PERIODS[c] for c in self.cyclic], self.dtype)
+        self._getter = operator.itemgetter(*self.columns)
+
+    @property
+    def output_columns(self):
+        """Names of the matrix columns produced by transform."""
+        derived = [f"{c}_{fn}" for c in self.cyclic for fn in ("sin", "cos")]
+        return list(self.columns) + derived
+
+    @property
+    def n_features(self):
+        return len(self.columns) + 2 * len(self.cyclic)
+
+    def missing(self, data):
+        """Return the required columns that ``data`` does not provide."""
+        if isinstance(data, dict):
+            keys = data
+        elif hasattr(data, "columns"):
+            keys = set(data.columns)
+        else:
+            keys = set().union(*data) if len(data) else set()
+        return [c for c in self.columns if c not in keys]
+
+    def _from_records(self, records):
+        getter = self._getter
+        if len(self.columns) == 1:
+            rows = ((getter(r),) for r in records)
+        else:
+            rows = map(getter, records)
+        try:
+            values = list(itertools.chain.from_iterable(rows))
+        except KeyError:
+            missing = set().union(*map(self.missing, records))
+            raise MissingFeaturesError(
+                sorted(missing, key=self.columns.index)
+            ) from None
+
+        if any(not issubclass(t, numbers.Number) for t in set(map(type, values))):
+            for i, column in enumerate(self.columns):
+                if not all(
+                    isinstance(v, numbers.Number)
+                    for v in values[i :: len(self.columns)]
+                ):
+                    raise NonNumericFeatureError(column)
+        return np.array(values, dtype=self.dtype).reshape(
+            len(records), len(self.columns)
+        )
+
+    def _from_frame(self, df):
+        missing = self.missing(df)
+        if missing:
+            raise MissingFeaturesError(missing)
+        frame = df[list(self.columns)]
+        for column, dtype in frame.dtypes.items():
+            if dtype.kind not in "biuf":
+                raise NonNumericFeatureError(column)
+        return frame.to_numpy(dtype=self.dtype)
+
+    def _from_array(self, array):
+        array = np.asarray(array)
+        if array.ndim == 1:
+            array = array.reshape(1, -1)
+        if array.shape[1] != len(self.columns):
+            raise ValueError(
+                f"Expected {len(self.columns)} columns ({', '.join(self.columns)}), "
+                f"got {array.shape[1]}."
+            )
+        if array.dtype.kind not in "biuf":
+            raise NonNumericFeatureError(self.columns[0])
+        return array.astype(self.dtype, copy=False)
+
+    def transform(self, data):
+        """Build the feature matrix in one vectorized pass.
+
+        Args:
+            data: A record dict, a sequence of record dicts, a DataFrame, or an
+                array whose columns follow ``columns``.
+
+        Returns:
+            A C-contiguous (n_rows, n_features) array of ``dtype``.
+        """
+        if isinstance(data, dict):
+            base = self._from_records([data])
+        elif hasattr(data, "columns"):
+            base = self._from_frame(data)
+        elif isinstance(data, (list, tuple)) and data and isinstance(data[0], dict):
+            base = self._from_records(data)
+        else:
+            base = self._from_array(data)
+
+        if not self.cyclic:
+            return np.ascontiguousarray(base)
+
+        out = np.empty((base.shape[0], self.n_features), dtype=self.dtype)
+        out[:, : base.shape[1]] = base
+        angles = base[:, self._cyclic_index] * (2 * np.pi / self._periods)
+        out[:, base.shape[1] :: 2] = np.sin(angles)
+        out[:, base.shape[1] + 1 :: 2] = np.cos(angles)
+        return out
+
+    __call__ = transform
+
+    def select(self, record):
+        """Return the model inputs of a single record as an ordered dict."""
+        missing = self.missing(record)
+        if missing:
+            raise MissingFeaturesError(missing)
+        values = self._getter(record)
+        if len(self.columns) == 1:
+            values = (values,)
+        return dict(zip(self.columns, values))
+
+    def to_dict(self):
+        return {
+            "version": FEATURE_SPEC_VERSION,
+            "columns": list(self.columns),
+            "cyclic": list(self.cyclic),
+            "dtype": self.dtype.str,
+        }
+
+    @classmethod
+    def from_dict(cls, spec):
+        if spec.get("version") != FEATURE_SPEC_VERSION:
+            raise ValueError(f"Unsupported feature spec version: {spec.get('version')}")
+        return cls(spec["columns"], spec["cyclic"], spec["dtype"])
+
+    def save(self, path):
+        """Write the transformer spec as JSON and return the path."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rt", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, FeatureTransformer) and self.to_dict() == other.to_dict()
+        )
+
+    def __repr__(self):
+        return f"FeatureTransformer(columns={list(self.columns)}, cyclic={list(self.cyclic)})"
+
+
+def transformer_from_env(default_cyclic=()):
+    """Build the training transformer, reading CYCLIC_FEATURES (e.g. "hr,mnth")."""
+    cyclic = os.environ.get("CYCLIC_FEATURES")
+    if cyclic is None:
+        return FeatureTransformer(cyclic=default_cyclic)
+    return FeatureTransformer(
+        cyclic=[c.strip() for c in cyclic.split(",") if c.strip()]
+    )
+
+
+def targets_from_env(default=("cnt",)):
+    """Targets to train on, reading TARGETS (e.g. "cnt,casual,registered")."""
+    targets = os.environ.get("TARGETS")
+    if targets is None:
+        return list(default)
+    targets = [t.strip() for t in targets.split(",") if t.strip()]
+    unknown = [t for t in targets if t not in TARGETS]
+    if unknown or not targets:
+        raise ValueError(f"Unknown targets {unknown}, expected some of {TARGETS}.")
+    return targets
+
+
+DEFAULT_TRANSFORMER = FeatureTransformer()
@@ -0,0 +1,195 @@
+"""
+leaderboard.py
+Ranks every finished run of an MLflow experiment by accuracy and latency.
+
+All runs are fetched with paginated ``search_runs`` calls instead of one
+``get_run`` per run, and the result is cached on disk. The cache key is the
+experiment ID, its last update time and the end time of its most recently
+finished run, so a single one-row probe query tells whether the cached
+leaderboard is still current. Metrics logged to a run after it finished
+change neither, so code doing that (model_registry.get_benchmark_metrics)
+calls ``invalidate_cache``.
+
+Runs are ranked by MAE, then R², then latency. MAEs (and R²s) within
+``RANK_TOLERANCE`` of each other, relative to the best one, tie so that the
+next metric decides; without it latency would almost never matter.
+"""
+
+import json
+import math
+import os
+import tempfile
+
+LEADERBOARD_CACHE_DIR = os.environ.get(
+    "LEADERBOARD_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "project-mlops", "leaderboard"),
+)
+FINISHED_RUNS = "attributes.status = 'FINISHED'"
+PAGE_SIZE = 1000
+
+# Metric name -> True when larger is better
+RANK_METRICS = {"mae": False, "r2": True, "latency_p99_ms": False}
+# Relative distance from the best value within which runs tie on a metric
+RANK_TOLERANCE = 0.01
+
+
+def _client(client):
+    if client is not None:
+        return client
+    from mlflow import MlflowClient  # pylint: disable=import-outside-toplevel
+
+    return MlflowClient()
+
+
+def search_all_runs(client, experiment_ids, filter_string="", order_by=None):
+    """Return every run matching the filter, following the page tokens."""
+    runs, page_token = [], None
+    while True:
+        page = client.search_runs(
+            experiment_ids,
+            filter_string=filter_string,
+            max_results=PAGE_SIZE,
+            order_by=order_by,
+            page_token=page_token,
+        )
+        runs.extend(page)
+        page_token = page.token
+        if not page_token:
+            return runs
+
+
+def run_to_row(run):
+    """Flatten an MLflow run into a leaderboard row."""
+    metrics = run.data.metrics
+    return {
+        "run_id": run.info.run_id,
+        "run_name": run.info.run_name,
+        "model": run.data.tags.get("model", run.info.run_name),
+        "start_time": run.info.start_time,
+        **{name: metrics.get(name) for name in RANK_METRICS},
+    }
+
+
+def rank_rows(rows, tolerance=RANK_TOLERANCE):
+    """Sort rows best first: lowest MAE, then highest R², then lowest latency.
+
+    Each metric only decides between runs that tie on the previous ones. A
+    run's MAE and R² are bucketed by their distance from the best value in
+    steps of ``tolerance`` times that value, so e.g. MAEs of 50.2 and 50.4
+    tie; latency is compared exactly. Runs without an MAE (e.g. dataset
+    logging runs) are dropped; a missing metric ranks behind any measured
+    one.
+    """
+    ranked = [r for r in rows if r.get("mae") is not None]
+    last = list(RANK_METRICS)[-1]
+    best = {}
+    for name, higher_is_better in RANK_METRICS.items():
+        values = [r[name] for r in ranked if r.get(name) is not None]
+        if values:
+            best[name] = max(values) if higher_is_better else min(values)
+
+    def sort_key(row):
+        key = []
+        for name in RANK_METRICS:
+            if row.get(name) is None:
+                key.append(math.inf)
+                continue
+            distance = abs(row[name] - best[name])
+            step = tolerance * abs(best[name])
+            key.append(
+                distance if name == last or not step else math.floor(distance / step)
+            )
+        return tuple(key)
+
+    ranked.sort(key=sort_key)
+    for position, row in enumerate(ranked, start=1):
+        row["rank"] = position
+    return ranked
+
+
+def _cache_key(client, experiment):
+    latest = client.search_runs(
+        [experiment.experiment_id],
+        filter_string=FINISHED_RUNS,
+        max_results=1,
+        order_by=["attributes.end_time DESC"],
+    )
+    latest_end = latest[0].info.end_time if latest else None
+    return f"{experiment.experiment_id}:{experiment.last_update_time}:{latest_end}"
+
+
+def _cache_path(cache_dir, experiment_id):
+    return os.path.join(cache_dir, f"{experiment_id}.json")
+
+
+def invalidate_cache(experiment_id, cache_dir=LEADERBOARD_CACHE_DIR):
+    """Drop the cached leaderboard of an experiment, e.g. after logging metrics."""
+    try:
+        os.remove(_cache_path(cache_dir, experiment_id))
+    except FileNotFoundError:
+        pass
+
+
+def _read_cache(path, key):
+    try:
+        with open(path, "rt", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return cached["rows"] if cached.get("key") == key else None
+
+
+def _write_cache(path, key, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "rows": rows}, f)
+    os.replace(tmp_path, path)
+
+
+def get_leaderboard(experiment_name, client=None, cache_dir=LEADERBOARD_CACHE_DIR):
+    """Return the ranked rows of every finished run in an experiment.
+
+    Args:
+        experiment_name: Name of the MLflow experiment.
+        client: Optional MlflowClient.
+        cache_dir: Directory of the on-disk cache; None disables caching.
+
+    Returns:
+        List of row dicts, best run first.
+    """
+    client = _client(client)
+    experiment = client.get_experiment_by_name(experiment_name)
+    if experiment is None:
+        raise ValueError(f"Experiment '{experiment_name}' does not exist.")
+
+    key = _cache_key(client, experiment)
+    cache_path = _cache_path(cache_dir, experiment.experiment_id) if cache_dir else None
+    if cache_path:
+        rows = _read_cache(cache_path, key)
+        if rows is not None:
+            return rows
+
+    runs = search_all_runs(client, [experiment.experiment_id], FINISHED_RUNS)
+    rows = rank_rows([run_to_row(run) for run in runs])
+    if cache_path:
+        _write_cache(cache_path, key, rows)
+    return rows
+
+
+def format_leaderboard(rows, top=None):
+    """Render rows as a fixed-width text table."""
+
+    def fmt(value, spec):
+        return "-" if value is None else format(value, spec)
+
+    lines = [
+        f"{'#':>3}  {'model':<24}{'MAE':>10}{'R2':>8}{'p99 ms':>9}  run_id",
+    ]
+    for row in rows[:top]:
+        lines.append(
+            f"{row['rank']:>3}  {row['model'][:23]:<24}{fmt(row['mae'], '.3f'):>10}"
+            f"{fmt(row['r2'], '.4f'):>8}{fmt(row['latency_p99_ms'], '.3f'):>9}"
+            f"  {row['run_id']}"
+        )
+    return "\n".join(lines)
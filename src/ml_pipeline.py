@@ -2,31 +2,44 @@ import os
 import pickle
 import sys  # Standard library imports
 
-# Third-party imports
-import mlflow
+# Third-party imports; mlflow and scikit-learn are imported by the tasks
 import pandas as pd
 from prefect import flow, task
-from sklearn.metrics import mean_absolute_error, r2_score
-from sklearn.model_selection import train_test_split
-from sklearn.tree import DecisionTreeRegressor
 
-from constants import FEATURES
+from dataset_partitions import read_partitions
+from features import FEATURE_SPEC_FILENAME, targets_from_env, transformer_from_env
+from model_format import MODEL_EXTENSION, save_model
+from promotion import BENCHMARK_SAMPLE_SIZE, BENCHMARK_SEED, benchmark_model
+from task_profiling import log_task_profiles, profile_task
+from trainers import TRAINER, train
 
 # Local application imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 # Constants
-DATA_PATH = "data/hour.csv"
+# A CSV file, or a directory written by create_monitoring_datasets.py, in
+# which case the model is trained on its reference split only
+DATA_PATH = os.environ.get("TRAINING_DATA", "data/hour.csv")
+TRAINING_SPLIT = "reference"
 MODEL_DIR = "models"
-MODEL_FILENAME = "DecisionTreeRegressor_model.pkl"
-MLFLOW_TRACKING_URI = "http://127.0.0.1:5000"
+# Named as the registry expects: models/<model name>.pkl. The name is kept
+# for every trainer: deploy, batch_score and monitoring load this file
+MODEL_FILENAME = "DecisionTreeRegressor.pkl"
+MLFLOW_TRACKING_URI = os.environ.get("MLFLOW_TRACKING_URI", "http://127.0.0.1:5000")
 MLFLOW_EXPERIMENT = "MLflow Prefect Integration"
+FEATURE_TRANSFORMER = transformer_from_env()
+# One target (cnt), or several for one multi-output decision tree
+MODEL_TARGETS = targets_from_env()
 
 
 @task
+@profile_task
 def read_data(data_path=DATA_PATH):
     try:
-        df = pd.read_csv(data_path)
+        if os.path.isdir(data_path):
+            df = read_partitions(data_path, splits=[TRAINING_SPLIT])
+        else:
+            df = pd.read_csv(data_path)
         print(f"Data read successfully. Shape of the dataset: {df.shape}")
         return df
     except Exception as e:
@@ -34,10 +47,16 @@ def read_data(data_path=DATA_PATH):
 
 
 @task
-def preprocess_data(df):
+@profile_task
+def preprocess_data(df, transformer=FEATURE_TRANSFORMER, targets=None):
+    from sklearn.model_selection import (  # pylint: disable=import-outside-toplevel
+        train_test_split,
+    )
+
     try:
-        X = df[FEATURES]
-        y = df["cnt"]
+        X = transformer.transform(df)
+        targets = targets or MODEL_TARGETS
+        y = df[targets[0]] if len(targets) == 1 else df[targets]
         X_train, X_test, y_train, y_test = train_test_split(
             X, y, test_size=0.2, random_state=42
         )
@@ -48,20 +67,30 @@ def preprocess_data(df):
 
 
 @task
-def train_model(X_train, y_train):
+@profile_task
+def train_model(X_train, y_train, trainer=TRAINER, threads=None):
     try:
-        model = DecisionTreeRegressor()
-        model.fit(X_train, y_train)
-        print("Model training completed.")
-        return model
+        model, stats = train(X_train, y_train, trainer, threads)
+        print(
+            f"Model training completed with {trainer} on {stats['threads']} "
+            f"threads in {stats['train_seconds']:.2f}s."
+        )
+        return model, stats
     except Exception as e:
         raise RuntimeError(f"Model training failed: {e}") from e
 
 
 @task
+@profile_task
 def evaluate_model(model, X_test, y_test):
+    """MAE and R² of the model; of its first target for a multi-output model."""
+    # pylint: disable=import-outside-toplevel
+    from sklearn.metrics import mean_absolute_error, r2_score
+
     try:
         predictions = model.predict(X_test)
+        if predictions.ndim > 1:
+            predictions, y_test = predictions[:, 0], y_test.iloc[:, 0]
         mae = mean_absolute_error(y_test, predictions)
         r2 = r2_score(y_test, predictions)
         print(f"Model evaluation completed. MAE: {mae}, R²: {r2}")
@@ -71,12 +100,84 @@ def evaluate_model(model, X_test, y_test):
 
 
 @task
-def log_model(model, mae, r2, model_dir=MODEL_DIR, model_filename=MODEL_FILENAME):
+@profile_task
+def evaluate_targets(model, X_test, y_test):
+    """MAE and R² of every target of a multi-output model.
+
+    Returns:
+        Dict of metrics named mae_<target> and r2_<target>.
+    """
+    # pylint: disable=import-outside-toplevel
+    from sklearn.metrics import mean_absolute_error, r2_score
+
+    predictions = model.predict(X_test)
+    metrics = {}
+    for i, target in enumerate(y_test.columns):
+        metrics[f"mae_{target}"] = mean_absolute_error(
+            y_test[target], predictions[:, i]
+        )
+        metrics[f"r2_{target}"] = r2_score(y_test[target], predictions[:, i])
+    print(f"Per-target evaluation completed: {metrics}")
+    return metrics
+
+
+@task
+@profile_task
+def benchmark_inference(model, df, transformer=FEATURE_TRANSFORMER):
+    """Latency, size and memory of the model on a fixed sample of ``df``."""
+    sample = df.sample(
+        n=min(BENCHMARK_SAMPLE_SIZE, len(df)), random_state=BENCHMARK_SEED
+    )
+    return benchmark_model(model, sample, transformer)
+
+
+@task
+@profile_task
+def log_model(
+    model,
+    mae,
+    r2,
+    model_dir=MODEL_DIR,
+    model_filename=MODEL_FILENAME,
+    *,
+    stats=None,
+    benchmark=None,
+    targets=None,
+    target_metrics=None,
+):
+    """Log the model, its metrics and its artifacts in a new MLflow run.
+
+    Args:
+        stats: Training stats from trainers.train (trainer, threads and
+            training time).
+        benchmark: Inference metrics from promotion.benchmark_model; R² per
+            millisecond of single-row latency is logged with them.
+        targets: Targets the model predicts, in the order of its outputs.
+        target_metrics: Per-target metrics from evaluate_targets.
+    """
+    import mlflow.sklearn  # pylint: disable=import-outside-toplevel
+
     try:
-        with mlflow.start_run():
-            mlflow.log_param("model_type", "DecisionTreeRegressor")
+        with mlflow.start_run() as run:
+            estimator = getattr(model, "estimator_", model)
+            mlflow.log_param("model_type", type(estimator).__name__)
+            mlflow.log_param("features", ",".join(FEATURE_TRANSFORMER.output_columns))
+            mlflow.log_param("targets", ",".join(targets or MODEL_TARGETS))
             mlflow.log_metric("mae", mae)
             mlflow.log_metric("r2", r2)
+            if target_metrics:
+                mlflow.log_metrics(target_metrics)
+            if stats:
+                mlflow.log_params(
+                    {"trainer": stats["trainer"], "threads": stats["threads"]}
+                )
+                mlflow.log_metric("train_seconds", stats["train_seconds"])
+                mlflow.log_metric(
+                    f"train_seconds_{stats['threads']}_threads", stats["train_seconds"]
+                )
+            if benchmark:
+                mlflow.log_metrics(benchmark)
+                mlflow.log_metric("r2_per_ms", r2 / benchmark["latency_p50_ms"])
             mlflow.sklearn.log_model(model, "model")
 
             # Save model locally
@@ -86,21 +187,59 @@ def log_model(model, mae, r2, model_dir=MODEL_DIR, model_filename=MODEL_FILENAME
                 pickle.dump(model, f)
 
             # Log the model as an artifact in MLflow
-            mlflow.log_artifact(pickle_path)
+            mlflow.log_artifact(pickle_path, artifact_path="models")
+
+            # Save and log the memory-mappable copy used for serving
+            mapped_path = os.path.splitext(pickle_path)[0] + MODEL_EXTENSION
+            save_model(model, mapped_path, output_names=targets or MODEL_TARGETS)
+            mlflow.log_artifact(mapped_path, artifact_path="models")
+
+            # The transformer is part of the model: serving must apply the same one
+            spec_path = FEATURE_TRANSFORMER.save(
+                os.path.join(model_dir, FEATURE_SPEC_FILENAME)
+            )
+            mlflow.log_artifact(spec_path, artifact_path="models")
+        return run.info.run_id
     except Exception as e:
         raise RuntimeError(f"Logging model failed: {e}") from e
 
 
 @flow(log_prints=True)
-def ml_pipeline():
+def ml_pipeline(trainer=TRAINER, threads=None, targets=None):
+    """Train, evaluate and log a model.
+
+    Args:
+        trainer: Backend from trainers.TRAINERS; defaults to TRAINER.
+        threads: Cores the trainer may use; all of them by default.
+        targets: Columns to predict; defaults to MODEL_TARGETS. Several
+            targets train one multi-output model, whose metrics are logged
+            per target.
+    """
+    import mlflow  # pylint: disable=import-outside-toplevel
+
     mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
     mlflow.set_experiment(MLFLOW_EXPERIMENT)
 
+    targets = targets or MODEL_TARGETS
     df = read_data()
-    X_train, X_test, y_train, y_test = preprocess_data(df)
-    model = train_model(X_train, y_train)
+    X_train, X_test, y_train, y_test = preprocess_data(df, targets=targets)
+    model, stats = train_model(X_train, y_train, trainer, threads)
     mae, r2 = evaluate_model(model, X_test, y_test)
-    log_model(model, mae, r2)
+    target_metrics = (
+        evaluate_targets(model, X_test, y_test) if len(targets) > 1 else None
+    )
+    benchmark = benchmark_inference(model, df)
+    run_id = log_model(
+        model,
+        mae,
+        r2,
+        stats=stats,
+        benchmark=benchmark,
+        targets=targets,
+        target_metrics=target_metrics,
+    )
+    log_task_profiles(run_id=run_id)
+    return run_id
 
 
 if __name__ == "__main__":
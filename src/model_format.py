@@ -0,0 +1,434 @@
+"""
+model_format.py
+Versioned, memory-mappable serialization format for the bike-sharing models.
+
+A model file has a small fixed preamble, a JSON header describing the model
+and its arrays, and the numeric arrays themselves stored as raw buffers
+aligned to ALIGNMENT bytes:
+
+    MAGIC (8 bytes) | FORMAT_VERSION (uint32) | header length (uint32)
+    header JSON (padded) | array buffers (each aligned)
+
+Loading maps the file read-only and wraps every buffer with
+``numpy.frombuffer``, so no array data is copied into process memory.
+
+A multi-output model (one decision tree predicting cnt, casual and
+registered) stores the names of its outputs in the header; split_outputs()
+names the columns of its predictions.
+"""
+
+import abc
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+from features import TARGETS
+
+MAGIC = b"BKMODEL\x00"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+MODEL_EXTENSION = ".bkm"
+
+_PREAMBLE = struct.Struct("<8sII")
+_TREE_LEAF = -1
+# Link functions of the gradient boosting losses, by sklearn class name
+_LINKS = ("IdentityLink", "LogLink")
+# Fields of sklearn's private TreePredictor node records that are stored
+_BOOSTING_NODE_FIELDS = (
+    "value",
+    "feature_idx",
+    "num_threshold",
+    "missing_go_to_left",
+    "left",
+    "right",
+    "is_leaf",
+    "is_categorical",
+)
+# Rows of the probe a stored gradient boosting model must predict like sklearn
+PARITY_ROWS = 256
+# Largest (rows x trees) node table of one gradient boosting predict step
+PREDICT_CHUNK_NODES = 1 << 20
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _boosting_arrays(model):
+    """Flatten the trees of a gradient boosting model into one node table.
+
+    ``model`` is a HistGradientBoostingRegressor, or a
+    trainers.PrebinnedRegressor whose thresholds are bin codes; those are
+    replaced by the bin edges, so the stored model takes raw features.
+    """
+    bin_edges = getattr(model, "bin_edges_", None)
+    estimator = model.estimator_ if bin_edges is not None else model
+    # These are private sklearn attributes: fail loudly when they change
+    # pylint: disable=protected-access
+    try:
+        link = type(estimator._loss.link).__name__
+        trees = [
+            predictor.nodes for trees in estimator._predictors for predictor in trees
+        ]
+        baseline = float(np.ravel(estimator._baseline_prediction)[0])
+    except AttributeError as e:
+        raise TypeError(
+            f"The gradient boosting internals of scikit-learn {_sklearn_version()} "
+            f"are not supported: {e}"
+        ) from e
+    if link not in _LINKS:
+        raise TypeError(f"Unsupported gradient boosting link: {link}")
+    nodes = np.concatenate(trees)
+    missing = set(_BOOSTING_NODE_FIELDS) - set(nodes.dtype.names or ())
+    if missing:
+        raise TypeError(
+            f"The tree nodes of scikit-learn {_sklearn_version()} lack the "
+            f"fields {sorted(missing)}."
+        )
+    if nodes["is_categorical"].any():
+        raise TypeError("Categorical splits are not supported.")
+
+    sizes = [len(tree) for tree in trees]
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+    offsets = np.repeat(roots, sizes)
+    leaf = nodes["is_leaf"].astype(bool)
+    feature = nodes["feature_idx"].astype(np.int64)
+    threshold = nodes["num_threshold"].astype(np.float64)
+    missing_go_to_left = nodes["missing_go_to_left"].astype(np.uint8)
+    if bin_edges is not None:
+        # code <= k is x <= edges[k]; missing values have the last code
+        for i in np.flatnonzero(~leaf):
+            threshold[i] = bin_edges[feature[i]][int(threshold[i])]
+        missing_go_to_left[:] = 0
+
+    arrays = {
+        "children_left": np.where(leaf, _TREE_LEAF, nodes["left"] + offsets),
+        "children_right": np.where(leaf, _TREE_LEAF, nodes["right"] + offsets),
+        "feature": feature,
+        "threshold": threshold,
+        "missing_go_to_left": missing_go_to_left,
+        "value": nodes["value"].astype(np.float64),
+        "roots": roots,
+    }
+    meta = {
+        "n_outputs": 1,
+        "n_trees": len(trees),
+        "baseline": baseline,
+        "link": link,
+    }
+    _check_boosting_parity(model, meta, arrays)
+    return "gradient_boosting", meta, arrays
+
+
+def _sklearn_version():
+    import sklearn  # pylint: disable=import-outside-toplevel
+
+    return sklearn.__version__
+
+
+def _check_boosting_parity(model, meta, arrays):
+    """Raise TypeError unless the arrays predict like the sklearn model.
+
+    The probe takes every feature at and just above the model's thresholds,
+    and missing, so every branch of every split is taken by some row.
+    """
+    rng = np.random.default_rng(0)
+    probe = np.full((PARITY_ROWS, model.n_features_in_), np.nan)
+    split = arrays["children_left"] != _TREE_LEAF
+    for j in range(model.n_features_in_):
+        thresholds = arrays["threshold"][split & (arrays["feature"] == j)]
+        values = np.concatenate(
+            [thresholds, np.nextafter(thresholds, np.inf), [np.nan]]
+        )
+        probe[:, j] = rng.choice(values, PARITY_ROWS)
+    header = {"n_features": model.n_features_in_, "meta": meta}
+    mapped = MappedBoostingRegressor(header, arrays).predict(probe)
+    if not np.allclose(mapped, model.predict(probe)):
+        raise TypeError(
+            f"The gradient boosting trees of scikit-learn {_sklearn_version()} "
+            "do not predict like their stored copy."
+        )
+
+
+def _extract_arrays(model):
+    """Return the model kind, its scalar metadata and its numeric arrays."""
+    if hasattr(model, "_predictors") or hasattr(model, "bin_edges_"):
+        return _boosting_arrays(model)
+
+    if hasattr(model, "tree_"):
+        tree = model.tree_
+        # sklearn < 1.3 has no missing value support: NaN compares as > x
+        missing_go_to_left = getattr(
+            tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=np.uint8)
+        )
+        arrays = {
+            "children_left": tree.children_left.astype(np.int64),
+            "children_right": tree.children_right.astype(np.int64),
+            "feature": tree.feature.astype(np.int64),
+            "threshold": tree.threshold.astype(np.float64),
+            "missing_go_to_left": np.asarray(missing_go_to_left, dtype=np.uint8),
+            "value": tree.value.reshape(tree.node_count, -1).astype(np.float64),
+        }
+        meta = {"n_outputs": int(tree.n_outputs), "max_depth": int(tree.max_depth)}
+        return "decision_tree", meta, arrays
+
+    if hasattr(model, "coef_") and hasattr(model, "intercept_"):
+        arrays = {
+            "coef": np.atleast_2d(np.asarray(model.coef_, dtype=np.float64)),
+            "intercept": np.atleast_1d(np.asarray(model.intercept_, dtype=np.float64)),
+        }
+        meta = {"n_outputs": int(arrays["coef"].shape[0])}
+        return "linear", meta, arrays
+
+    raise TypeError(f"Unsupported model type: {type(model).__name__}")
+
+
+def save_model(model, path, output_names=None):
+    """Serialize a fitted model to the memory-mappable format.
+
+    Args:
+        model: A fitted DecisionTreeRegressor, linear regression or
+            HistGradientBoostingRegressor (or trainers.PrebinnedRegressor).
+        path: Destination file path.
+        output_names: Target of every output, e.g. ["cnt", "casual"].
+
+    Returns:
+        The path the model was written to.
+    """
+    kind, meta, arrays = _extract_arrays(model)
+    if output_names is not None and len(output_names) != meta["n_outputs"]:
+        raise ValueError(
+            f"{len(output_names)} output names for {meta['n_outputs']} outputs."
+        )
+    feature_names = getattr(model, "feature_names_in_", None)
+
+    header = {
+        "kind": kind,
+        "model_type": type(model).__name__,
+        "n_features": int(model.n_features_in_),
+        "feature_names": list(feature_names) if feature_names is not None else None,
+        "output_names": list(output_names) if output_names is not None else None,
+        "meta": meta,
+        "arrays": {},
+    }
+
+    # Offsets depend on the header size, which depends on the offsets, so
+    # reserve generous room for the digits and lay the buffers out after it.
+    layout = {
+        name: {"dtype": arr.dtype.str, "shape": list(arr.shape)}
+        for name, arr in arrays.items()
+    }
+    header["arrays"] = {
+        name: dict(spec, offset=10**12) for name, spec in layout.items()
+    }
+    data_start = _align(_PREAMBLE.size + len(json.dumps(header).encode("utf-8")))
+
+    offset = data_start
+    for name, arr in arrays.items():
+        header["arrays"][name] = dict(layout[name], offset=offset)
+        offset = _align(offset + arr.nbytes)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for name, arr in arrays.items():
+                f.write(b"\x00" * (header["arrays"][name]["offset"] - f.tell()))
+                f.write(np.ascontiguousarray(arr).tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def read_header(buffer):
+    """Parse and validate the header of a serialized model buffer."""
+    magic, version, header_len = _PREAMBLE.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a bike-sharing model file (bad magic bytes).")
+    if version != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported model format version {version}; expected {FORMAT_VERSION}."
+        )
+    start = _PREAMBLE.size
+    return json.loads(bytes(buffer[start : start + header_len]).decode("utf-8"))
+
+
+class MappedModel(abc.ABC):
+    """Base class for models whose arrays are views over a mapped file."""
+
+    def __init__(self, header, arrays, buffer=None):
+        self.header = header
+        self.arrays = arrays
+        self.n_features_in_ = header["n_features"]
+        self.n_outputs_ = header["meta"]["n_outputs"]
+        self.output_names = header.get("output_names")
+        self._buffer = buffer
+
+    @property
+    def model_type(self):
+        return self.header["model_type"]
+
+    def _as_matrix(self, X, dtype):
+        X = np.asarray(X, dtype=dtype)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"X has {X.shape[1]} features, but the model expects {self.n_features_in_}."
+            )
+        return X
+
+    def _finish(self, out):
+        return out[:, 0] if self.n_outputs_ == 1 else out
+
+    @abc.abstractmethod
+    def predict(self, X):
+        """Predict every row of X, like the scikit-learn model."""
+
+
+class MappedTreeRegressor(MappedModel):
+    """Decision tree predictor backed by memory-mapped node arrays."""
+
+    def predict(self, X):
+        # sklearn compares float32 features against float64 thresholds, do the same
+        X = self._as_matrix(X, np.float32)
+        left = self.arrays["children_left"]
+        right = self.arrays["children_right"]
+        feature = self.arrays["feature"]
+        threshold = self.arrays["threshold"]
+        # Files written before the flag was stored sent NaN to the right
+        missing_go_to_left = self.arrays.get("missing_go_to_left")
+        if missing_go_to_left is None:
+            missing_go_to_left = np.zeros(len(left), dtype=np.uint8)
+        missing_go_to_left = missing_go_to_left.astype(bool)
+
+        node = np.zeros(X.shape[0], dtype=np.int64)
+        active = np.arange(X.shape[0])
+        while active.size:
+            current = node[active]
+            internal = left[current] != _TREE_LEAF
+            active, current = active[internal], current[internal]
+            if not active.size:
+                break
+            x = X[active, feature[current]]
+            go_left = (x <= threshold[current]) | (
+                np.isnan(x) & missing_go_to_left[current]
+            )
+            node[active] = np.where(go_left, left[current], right[current])
+
+        return self._finish(self.arrays["value"][node])
+
+
+class MappedLinearRegressor(MappedModel):
+    """Linear model predictor backed by memory-mapped coefficients."""
+
+    def predict(self, X):
+        X = self._as_matrix(X, np.float64)
+        return self._finish(X @ self.arrays["coef"].T + self.arrays["intercept"])
+
+
+class MappedBoostingRegressor(MappedModel):
+    """Gradient boosted trees backed by one memory-mapped node table."""
+
+    def predict(self, X):
+        # sklearn's boosting compares float64 features with float64 thresholds
+        X = self._as_matrix(X, np.float64)
+        # Bound the (rows x trees) node table of large batches
+        chunk = max(1, PREDICT_CHUNK_NODES // len(self.arrays["roots"]))
+        raw = np.concatenate(
+            [self._raw_predict(X[i : i + chunk]) for i in range(0, len(X), chunk)]
+        )
+        return np.exp(raw) if self.header["meta"]["link"] == "LogLink" else raw
+
+    def _raw_predict(self, X):
+        left = self.arrays["children_left"]
+        right = self.arrays["children_right"]
+        feature = self.arrays["feature"]
+        threshold = self.arrays["threshold"]
+        missing_go_to_left = self.arrays["missing_go_to_left"].astype(bool)
+
+        # Walk every tree at once: one (row, tree) node per step of depth
+        node = np.tile(self.arrays["roots"], (X.shape[0], 1))
+        rows, trees = np.nonzero(left[node] != _TREE_LEAF)
+        while rows.size:
+            current = node[rows, trees]
+            x = X[rows, feature[current]]
+            go_left = (x <= threshold[current]) | (
+                np.isnan(x) & missing_go_to_left[current]
+            )
+            node[rows, trees] = np.where(go_left, left[current], right[current])
+            internal = left[node[rows, trees]] != _TREE_LEAF
+            rows, trees = rows[internal], trees[internal]
+
+        return self.header["meta"]["baseline"] + self.arrays["value"][node].sum(axis=1)
+
+
+def split_outputs(model, prediction):
+    """Name the columns of a model's predictions.
+
+    Args:
+        model: The model that made the predictions; a MappedModel knows its
+            output names, other models are assumed to predict TARGETS in
+            order.
+        prediction: Array of shape (rows,) or (rows, outputs).
+
+    Returns:
+        Dict of target name to 1-D predictions, the first target first.
+    """
+    prediction = np.asarray(prediction)
+    if prediction.ndim == 1:
+        prediction = prediction.reshape(-1, 1)
+    names = getattr(model, "output_names", None) or TARGETS[: prediction.shape[1]]
+    return {name: prediction[:, i] for i, name in enumerate(names)}
+
+
+_MODEL_CLASSES = {
+    "decision_tree": MappedTreeRegressor,
+    "linear": MappedLinearRegressor,
+    "gradient_boosting": MappedBoostingRegressor,
+}
+
+
+def _wrap(buffer, header):
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"], dtype=np.int64))
+        arrays[name] = np.frombuffer(
+            buffer, dtype=dtype, count=count, offset=spec["offset"]
+        ).reshape(spec["shape"])
+    if header["kind"] not in _MODEL_CLASSES:
+        raise ValueError(f"Unsupported model kind {header['kind']!r}.")
+    return _MODEL_CLASSES[header["kind"]](header, arrays, buffer)
+
+
+def load_model(path):
+    """Open a serialized model with mmap; array data is not copied.
+
+    Args:
+        path: Path to a file written by save_model.
+
+    Returns:
+        A MappedModel exposing ``predict``.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _wrap(buffer, read_header(buffer))
+
+
+def loads_model(data):
+    """Load a model from an in-memory bytes object (zero-copy over ``data``)."""
+    buffer = memoryview(data)
+    return _wrap(buffer, read_header(buffer))
@@ -1,21 +1,46 @@
+import argparse
 import os
 import pickle
+import shutil
+
+from artifact_cache import file_digest, get_default_cache
+from features import DEFAULT_TRANSFORMER, FEATURE_SPEC_FILENAME, FeatureTransformer
+from leaderboard import format_leaderboard, get_leaderboard, invalidate_cache
+from model_format import MODEL_EXTENSION, load_model
+from promotion import (
+    BENCHMARK_METRICS,
+    benchmark_model,
+    load_benchmark_sample,
+    promote_if_eligible,
+)
+
+EXPERIMENT_NAME = "Sklearn Models"
+BENCHMARK_DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "hour.csv")
+
+remote_tracking_uri = os.environ.get("MLFLOW_TRACKING_URI", "http://127.0.0.1:5000")
+models_dir = os.path.join(os.getcwd(), "models")
 
-import mlflow
-from mlflow import MlflowClient
+_tracking_initialized = False
 
-# Set the remote tracking URI
-remote_tracking_uri = "http://127.0.0.1:5000"
-mlflow.set_tracking_uri(remote_tracking_uri)
 
-print(f"MLflow tracking URI set to: {mlflow.get_tracking_uri()}")
+def init_tracking():
+    """Import MLflow and point it at the tracking server on first use.
 
-# Ensure the models directory exists
-models_dir = os.path.join(os.getcwd(), "models")
-os.makedirs(models_dir, exist_ok=True)
+    Returns:
+        The mlflow module.
+    """
+    global _tracking_initialized  # pylint: disable=global-statement
+    import mlflow  # pylint: disable=import-outside-toplevel
+
+    if not _tracking_initialized:
+        mlflow.set_tracking_uri(remote_tracking_uri)
+        print(f"MLflow tracking URI set to: {mlflow.get_tracking_uri()}")
+        _tracking_initialized = True
+    return mlflow
 
 
 def register_model(run_id, model_name):
+    mlflow = init_tracking()
     model_uri = f"runs:/{run_id}/model"
     registered_model_name = f"{model_name}_registered"
     registered_model = mlflow.register_model(model_uri, registered_model_name)
@@ -23,74 +48,143 @@ def register_model(run_id, model_name):
     print(f"Registered model name: {registered_model_name}")
     print(f"Registered model version: {registered_model.version}")
 
-    # Transition the model to Production stage
-    client = MlflowClient()
-    client.transition_model_version_stage(
-        name=registered_model_name, version=registered_model.version, stage="Production"
-    )
-    print(
-        f"Transitioned {registered_model_name} version {registered_model.version} to Production stage"
+    # Transition the model to Production stage only if it passes the gate
+    client = mlflow.MlflowClient()
+    promote_if_eligible(
+        client,
+        registered_model_name,
+        registered_model.version,
+        get_benchmark_metrics(client, run_id, model_name),
     )
 
     return registered_model_name, registered_model.version
 
 
-def compare_models(lr_run_id, dt_run_id):
-    client = MlflowClient()
-    lr_run = client.get_run(lr_run_id)
-    dt_run = client.get_run(dt_run_id)
+def get_benchmark_metrics(client, run_id, model_name):
+    """Return the run's metrics, benchmarking the model first if it never was."""
+    mlflow = init_tracking()
+    run = client.get_run(run_id)
+    metrics = run.data.metrics
+    if all(name in metrics for name in BENCHMARK_METRICS):
+        return metrics
 
-    print("\nModel Comparison:")
-    print(
-        "Linear Regression - MAE:",
-        lr_run.data.metrics["mae"],
-        "R2:",
-        lr_run.data.metrics["r2"],
+    with open(get_default_cache().fetch(run_id, f"models/{model_name}.pkl"), "rb") as f:
+        model = pickle.load(f)
+    try:
+        transformer = FeatureTransformer.load(
+            get_default_cache().fetch(run_id, f"models/{FEATURE_SPEC_FILENAME}")
+        )
+    except (mlflow.exceptions.MlflowException, OSError):
+        transformer = DEFAULT_TRANSFORMER
+
+    benchmark = benchmark_model(
+        model, load_benchmark_sample(BENCHMARK_DATA_PATH), transformer
     )
-    print(
-        "Decision Tree Regressor - MAE:",
-        dt_run.data.metrics["mae"],
-        "R2:",
-        dt_run.data.metrics["r2"],
+    for name, value in benchmark.items():
+        client.log_metric(run_id, name, value)
+    # The run finished earlier, so the leaderboard cache key cannot see these
+    invalidate_cache(run.info.experiment_id)
+    return {**metrics, **benchmark}
+
+
+def compare_models(*run_ids, experiment_name=EXPERIMENT_NAME):
+    """Print MAE and R² of the given runs, fetched with a single query."""
+    client = init_tracking().MlflowClient()
+    experiment = client.get_experiment_by_name(experiment_name)
+    quoted = ", ".join(f"'{run_id}'" for run_id in run_ids)
+    runs = client.search_runs(
+        [experiment.experiment_id],
+        filter_string=f"attributes.run_id IN ({quoted})",
+        max_results=len(run_ids),
     )
+    runs_by_id = {run.info.run_id: run for run in runs}
+
+    print("\nModel Comparison:")
+    for run_id in run_ids:
+        run = runs_by_id[run_id]
+        print(
+            f"{run.data.tags.get('model', run.info.run_name)} - MAE:",
+            run.data.metrics["mae"],
+            "R2:",
+            run.data.metrics["r2"],
+        )
 
 
 def load_model_from_pickle(run_id, model_name):
-    client = MlflowClient()
-    artifact_path = client.download_artifacts(run_id, f"models/{model_name}.pkl")
+    init_tracking()
+    # Downloads only on a cache miss
+    artifact_path = get_default_cache().fetch(run_id, f"models/{model_name}.pkl")
 
     with open(artifact_path, "rb") as f:
         model = pickle.load(f)
 
-    # Save the model in the local models directory
+    # Copy the cached file into the local models directory unless it is already there
+    os.makedirs(models_dir, exist_ok=True)
     local_model_path = os.path.join(models_dir, f"{model_name}.pkl")
-    with open(local_model_path, "wb") as f:
-        pickle.dump(model, f)
+    if not os.path.exists(local_model_path) or file_digest(
+        local_model_path
+    ) != os.path.basename(artifact_path):
+        shutil.copyfile(artifact_path, local_model_path)
 
     print(f"Loaded {model_name} from MLflow and saved to {local_model_path}")
     return model
 
 
-def main():
-    # Get run IDs from the user
-    lr_run_id = input("Enter the run ID for Linear Regression: ")
-    dt_run_id = input("Enter the run ID for Decision Tree Regressor: ")
+def load_mapped_model(run_id, model_name):
+    """Fetch the memory-mappable artifact of a run and open it without copying."""
+    init_tracking()
+    artifact_path = get_default_cache().fetch(
+        run_id, f"models/{model_name}{MODEL_EXTENSION}"
+    )
+    model = load_model(artifact_path)
+    print(f"Memory-mapped {model_name} from {artifact_path}")
+    return model
+
+
+def promote_best_run(experiment_name=EXPERIMENT_NAME, top=10):
+    """Rank all runs of the experiment, then register and promote the best one."""
+    init_tracking()
+    rows = get_leaderboard(experiment_name)
+    if not rows:
+        print(f"No finished runs with metrics in experiment '{experiment_name}'.")
+        return None
+
+    print(f"\nLeaderboard for '{experiment_name}':")
+    print(format_leaderboard(rows, top))
 
-    # Register models
-    lr_model_name, lr_model_version = register_model(lr_run_id, "LinearRegression")
-    dt_model_name, dt_model_version = register_model(dt_run_id, "DecisionTreeRegressor")
+    best = rows[0]
+    model_name, model_version = register_model(best["run_id"], best["model"])
+    load_model_from_pickle(best["run_id"], best["model"])
+    return model_name, model_version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank, register and promote models.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    board = subparsers.add_parser("leaderboard", help="Rank every run of an experiment")
+    board.add_argument("--experiment", default=EXPERIMENT_NAME)
+    board.add_argument("--top", type=int, default=10)
+    board.add_argument(
+        "--promote",
+        action="store_true",
+        help="Register the best run and move it to Production",
+    )
 
-    # Compare models
-    compare_models(lr_run_id, dt_run_id)
+    register = subparsers.add_parser("register", help="Register and promote one run")
+    register.add_argument("run_id")
+    register.add_argument("model_name", help="e.g. DecisionTreeRegressor")
 
-    # Print registered model info
-    print("\nRegistered Models:")
-    print(f"Linear Regression: {lr_model_name} (version {lr_model_version})")
-    print(f"Decision Tree Regressor: {dt_model_name} (version {dt_model_version})")
+    args = parser.parse_args()
+    init_tracking()
 
-    # Load models from pickle files
-    lr_model = load_model_from_pickle(lr_run_id, "LinearRegression")
-    dt_model = load_model_from_pickle(dt_run_id, "DecisionTreeRegressor")
+    if args.command == "register":
+        register_model(args.run_id, args.model_name)
+        load_model_from_pickle(args.run_id, args.model_name)
+    elif args.promote:
+        promote_best_run(args.experiment, args.top)
+    else:
+        print(format_leaderboard(get_leaderboard(args.experiment), args.top))
 
 
 if __name__ == "__main__":
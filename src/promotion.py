@@ -0,0 +1,162 @@
+"""
+promotion.py
+Latency-aware promotion gate for registered models.
+
+Every candidate is benchmarked on the same fixed sample of hour.csv:
+single-row p50/p99 latency, full-batch latency, pickled size and the memory
+the unpickled model occupies. The results are logged as MLflow metrics, and
+a registered version is moved to Production only if it meets the p99 latency
+and size budgets and its MAE is no worse than the current Production model.
+
+Budgets default to the PROMOTION_P99_BUDGET_MS and PROMOTION_SIZE_BUDGET_MB
+environment variables.
+"""
+
+import os
+import pickle
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from features import DEFAULT_TRANSFORMER
+
+BENCHMARK_SAMPLE_SIZE = 1000
+BENCHMARK_SEED = 42
+SINGLE_ROW_REPEATS = 500
+BATCH_REPEATS = 5
+
+P99_BUDGET_MS = float(os.environ.get("PROMOTION_P99_BUDGET_MS", 5.0))
+SIZE_BUDGET_MB = float(os.environ.get("PROMOTION_SIZE_BUDGET_MB", 50.0))
+
+BENCHMARK_METRICS = (
+    "latency_p50_ms",
+    "latency_p99_ms",
+    "batch_latency_ms",
+    "model_size_mb",
+    "model_memory_mb",
+)
+
+
+def load_benchmark_sample(data_path, size=BENCHMARK_SAMPLE_SIZE, seed=BENCHMARK_SEED):
+    """Return the fixed benchmark sample of a dataset (same rows on every call)."""
+    df = pd.read_csv(data_path)
+    return df.sample(n=min(size, len(df)), random_state=seed)
+
+
+def benchmark_model(model, sample, transformer=DEFAULT_TRANSFORMER):
+    """Measure inference latency, serialized size and memory of a model.
+
+    Args:
+        model: A fitted model exposing ``predict``.
+        sample: Rows to score (DataFrame, records or matrix).
+        transformer: FeatureTransformer the model was trained with.
+
+    Returns:
+        Dict with the BENCHMARK_METRICS.
+    """
+    X = transformer.transform(sample)
+    model.predict(X[:1])  # warm-up
+
+    rows = [X[i % len(X) : i % len(X) + 1] for i in range(SINGLE_ROW_REPEATS)]
+    latencies = np.empty(SINGLE_ROW_REPEATS)
+    for i, row in enumerate(rows):
+        start = time.perf_counter()
+        model.predict(row)
+        latencies[i] = time.perf_counter() - start
+
+    batch = []
+    for _ in range(BATCH_REPEATS):
+        start = time.perf_counter()
+        model.predict(X)
+        batch.append(time.perf_counter() - start)
+
+    blob = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+    tracemalloc.start()
+    try:
+        restored = pickle.loads(blob)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del restored
+
+    return {
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "batch_latency_ms": min(batch) * 1000,
+        "model_size_mb": len(blob) / 1024**2,
+        "model_memory_mb": peak / 1024**2,
+    }
+
+
+def check_promotion(
+    candidate,
+    production=None,
+    p99_budget_ms=P99_BUDGET_MS,
+    size_budget_mb=SIZE_BUDGET_MB,
+):
+    """Decide whether a candidate may replace the Production model.
+
+    Args:
+        candidate: Metrics of the candidate run (benchmark metrics and mae).
+        production: Metrics of the current Production run, if there is one.
+        p99_budget_ms: Maximum single-row p99 latency.
+        size_budget_mb: Maximum pickled model size.
+
+    Returns:
+        (passed, reasons) where reasons lists every failed check.
+    """
+    reasons = []
+    if candidate["latency_p99_ms"] > p99_budget_ms:
+        reasons.append(
+            f"p99 latency {candidate['latency_p99_ms']:.3f} ms exceeds {p99_budget_ms} ms"
+        )
+    if candidate["model_size_mb"] > size_budget_mb:
+        reasons.append(
+            f"model size {candidate['model_size_mb']:.2f} MB exceeds {size_budget_mb} MB"
+        )
+    if production and production.get("mae") is not None:
+        if candidate["mae"] > production["mae"]:
+            reasons.append(
+                f"MAE {candidate['mae']:.3f} is worse than Production {production['mae']:.3f}"
+            )
+    return not reasons, reasons
+
+
+def get_production_metrics(client, registered_model_name):
+    """Return the run metrics of the current Production version, or None."""
+    versions = client.get_latest_versions(registered_model_name, stages=["Production"])
+    if not versions:
+        return None
+    return client.get_run(versions[0].run_id).data.metrics
+
+
+def promote_if_eligible(client, registered_model_name, version, candidate, **budgets):
+    """Move a registered version to Production if it passes the gate.
+
+    The outcome is recorded as ``promotion`` tags on the model version.
+
+    Returns:
+        True if the version was promoted.
+    """
+    production = get_production_metrics(client, registered_model_name)
+    passed, reasons = check_promotion(candidate, production, **budgets)
+
+    client.set_model_version_tag(
+        registered_model_name, version, "promotion", "passed" if passed else "rejected"
+    )
+    if not passed:
+        client.set_model_version_tag(
+            registered_model_name, version, "promotion_reasons", "; ".join(reasons)
+        )
+        print(f"{registered_model_name} version {version} not promoted:")
+        for reason in reasons:
+            print(f"  - {reason}")
+        return False
+
+    client.transition_model_version_stage(
+        name=registered_model_name, version=version, stage="Production"
+    )
+    print(f"Transitioned {registered_model_name} version {version} to Production stage")
+    return True
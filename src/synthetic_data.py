@@ -0,0 +1,412 @@
+"""
+synthetic_data.py
+Generates synthetic hourly bike demand with the schema of hour.csv, for any
+number of years and stations.
+
+The generator is fitted on the real hour.csv:
+
+- calendar columns (season, holiday, weekday, workingday) follow the rules
+  of the real file, with Washington DC's holidays;
+- weather (temp, atemp, hum, windspeed, weathersit) is an hourly and monthly
+  mean plus a residual drawn from a Gaussian copula, so every column keeps
+  its marginal distribution, its correlation with the others and its
+  hour-to-hour autocorrelation;
+- log casual and registered demand is a regression on hour x working day,
+  month, weather and year, plus autocorrelated noise. Demand stays at the
+  level of the last real year instead of extrapolating its growth.
+
+With several stations each hour has one row per station: the stations share
+the weather and differ by a fixed demand scale and their own noise.
+
+Rows are generated and written ``chunk_rows`` at a time, so memory depends on
+the chunk size only. The random streams are split so that the output does
+not depend on the chunk size either.
+
+Usage:
+    python src/synthetic_data.py --years 20 --stations 10 \
+        --output data/synthetic/hour.parquet
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar,
+    Holiday,
+    USFederalHolidayCalendar,
+    nearest_workday,
+)
+from scipy.special import ndtr, ndtri  # pylint: disable=no-name-in-module
+
+from dataset_partitions import HOUR_DTYPES, SOURCE_PATH
+
+OUTPUT_PATH = os.path.join(os.path.dirname(SOURCE_PATH), "synthetic", "hour.csv")
+CHUNK_ROWS = 200_000
+
+WEATHER = ["temp", "atemp", "hum", "windspeed", "weathersit"]
+# Columns given as a mean per (month, hour) plus a residual
+SEASONAL = WEATHER[:4]
+DEMAND = ["casual", "registered"]
+# First day (MM-DD) of each season, as in hour.csv
+SEASON_STARTS = (("03-21", 2), ("06-21", 3), ("09-23", 4), ("12-21", 1))
+# Spread of the log demand scale between stations
+STATION_SPREAD = 0.5
+QUANTILE_LEVELS = 1001
+
+
+class HolidayCalendar(AbstractHolidayCalendar):
+    """US federal holidays and DC Emancipation Day, the holidays of hour.csv."""
+
+    rules = USFederalHolidayCalendar.rules + [
+        Holiday(
+            "Emancipation Day",
+            month=4,
+            day=16,
+            observance=nearest_workday,
+        )
+    ]
+
+
+def calendar(timestamps):
+    """Calendar columns of hour.csv for a DatetimeIndex of hours."""
+    days = timestamps.normalize()
+    holidays = HolidayCalendar().holidays(days.min(), days.max())
+    month_day = np.asarray(timestamps.strftime("%m-%d"))
+    starts = np.array([start for start, _ in SEASON_STARTS])
+    seasons = np.array([SEASON_STARTS[-1][1]] + [season for _, season in SEASON_STARTS])
+    weekday = (timestamps.dayofweek.to_numpy() + 1) % 7
+    holiday = days.isin(holidays).astype("int64")
+    return {
+        "dteday": np.asarray(timestamps.strftime("%Y-%m-%d")),
+        "season": seasons[np.searchsorted(starts, month_day, "right")],
+        "mnth": timestamps.month.to_numpy(),
+        "hr": timestamps.hour.to_numpy(),
+        "holiday": holiday,
+        "weekday": weekday,
+        "workingday": ((weekday >= 1) & (weekday <= 5) & (holiday == 0)).astype(
+            "int64"
+        ),
+    }
+
+
+def _normal_scores(values):
+    """Gaussian copula scores of a column, ties sharing their average rank."""
+    ranks = pd.Series(values).rank(method="average").to_numpy()
+    return ndtri((ranks - 0.5) / len(values))
+
+
+def _lag_correlation(values):
+    return float(np.corrcoef(values[:-1], values[1:])[0, 1])
+
+
+# The fitted arrays are the profile; it has no other behaviour than demand()
+class DemandProfile:  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """Seasonality, correlations and demand model fitted on hour.csv."""
+
+    def __init__(self, df):
+        """
+        Args:
+            df: DataFrame with the columns of hour.csv.
+        """
+        df = df.sort_values("instant")
+        month, hour = df["mnth"].to_numpy() - 1, df["hr"].to_numpy()
+
+        # Weather: mean per (month, hour) and the quantiles of the residuals
+        means = df.groupby(["mnth", "hr"])[SEASONAL].mean()
+        self.weather_mean = np.zeros((12, 24, len(WEATHER)))
+        self.weather_mean[..., : len(SEASONAL)] = (
+            means.reindex(pd.MultiIndex.from_product([range(1, 13), range(24)]))
+            .interpolate()
+            .to_numpy()
+            .reshape(12, 24, len(SEASONAL))
+        )
+        residuals = (
+            df[WEATHER].to_numpy(dtype="float64") - self.weather_mean[month, hour]
+        )
+        levels = np.linspace(0.0, 1.0, QUANTILE_LEVELS)
+        self.weather_quantiles = np.quantile(residuals, levels, axis=0).T
+        self.weathersit_values = np.quantile(
+            df["weathersit"], levels, method="inverted_cdf"
+        )
+        scores = np.column_stack([_normal_scores(column) for column in residuals.T])
+        self.weather_corr = np.corrcoef(scores, rowvar=False)
+        self.weather_phi = np.array([_lag_correlation(column) for column in scores.T])
+
+        # Demand: log1p regression with autocorrelated residuals
+        self.max_yr = int(df["yr"].max())
+        targets = np.log1p(df[DEMAND].to_numpy(dtype="float64"))
+        design = self._design(
+            hour,
+            df["workingday"].to_numpy(),
+            month,
+            df["weathersit"].to_numpy(),
+            weather=df[["temp", "hum", "windspeed"]].to_numpy(dtype="float64"),
+            yr=df["yr"].to_numpy(),
+        )
+        self.demand_coef = np.linalg.lstsq(design, targets, rcond=None)[0]
+        residuals = targets - design @ self.demand_coef
+        # Log demand varies much more at night, so its noise is scaled per
+        # (hour, working day) and correlated and autocorrelated after that
+        group = hour * 2 + df["workingday"].to_numpy()
+        self.demand_sigma = (
+            pd.DataFrame(residuals).groupby(group).std().reindex(range(48)).to_numpy()
+        )
+        residuals = residuals / self.demand_sigma[group]
+        self.demand_corr = np.corrcoef(residuals, rowvar=False)
+        self.demand_phi = np.array([_lag_correlation(column) for column in residuals.T])
+
+    @staticmethod
+    def _design(hour, workingday, month, weathersit, *, weather, yr):
+        """Regression inputs; only used for fitting, on hour.csv sized data."""
+        temp, hum, windspeed = weather.T
+        return np.column_stack(
+            [
+                np.eye(48)[hour * 2 + workingday],
+                np.eye(12)[month],
+                np.eye(4)[weathersit - 1],
+                temp,
+                temp**2,
+                hum,
+                windspeed,
+                yr,
+            ]
+        )
+
+    def demand(self, hour, workingday, month, weathersit, *, weather, yr):
+        """Expected log1p demand, (rows, len(DEMAND)), without the design matrix."""
+        coef = self.demand_coef
+        temp, hum, windspeed = weather.T
+        return (
+            coef[hour * 2 + workingday]
+            + coef[48 + month]
+            + coef[60 + weathersit - 1]
+            + np.outer(temp, coef[64])
+            + np.outer(temp**2, coef[65])
+            + np.outer(hum, coef[66])
+            + np.outer(windspeed, coef[67])
+            + np.outer(np.minimum(yr, self.max_yr), coef[68])
+        )
+
+
+def fit_profile(source=SOURCE_PATH):
+    return DemandProfile(pd.read_csv(source, dtype=HOUR_DTYPES))
+
+
+# A stateful stream: draw() continues where the last call ended
+class _AutoregressiveNoise:  # pylint: disable=too-few-public-methods
+    """Correlated standard normal columns, each an AR(1) series over rows."""
+
+    def __init__(self, rng, corr, phi, shape=()):
+        self.rng = rng
+        self.chol = np.linalg.cholesky(corr)
+        self.phi = phi
+        self.shape = shape
+        # The value before the first row, from the stationary distribution
+        self.last = self._innovations(1)[0]
+
+    def _innovations(self, rows):
+        return (
+            self.rng.standard_normal((rows, *self.shape, len(self.phi))) @ self.chol.T
+        )
+
+    def draw(self, rows):
+        # scipy.signal alone takes a second to import
+        from scipy.signal import lfilter  # pylint: disable=import-outside-toplevel
+
+        innovations = self._innovations(rows)
+        out = np.empty_like(innovations)
+        for j, phi in enumerate(self.phi):
+            out[..., j], _ = lfilter(
+                [np.sqrt(1 - phi**2)],
+                [1, -phi],
+                innovations[..., j],
+                axis=0,
+                zi=np.expand_dims(phi * self.last[..., j], 0),
+            )
+        self.last = out[-1]
+        return out
+
+
+def generate_chunks(
+    profile,
+    start="2011-01-01",
+    years=2,
+    *,
+    stations=1,
+    chunk_rows=CHUNK_ROWS,
+    seed=0,
+):
+    """Yield DataFrames with the columns and dtypes of hour.csv.
+
+    Args:
+        profile: DemandProfile fitted on real data.
+        start: First day.
+        years: Number of years, from ``start``.
+        stations: Rows per hour; stations share the weather.
+        chunk_rows: Rows per DataFrame, rounded down to whole hours.
+        seed: Seed of the random streams.
+    """
+    start = pd.Timestamp(start)
+    end = start + pd.DateOffset(years=years)
+    total_hours = int((end - start) / pd.Timedelta(hours=1))
+    hours_per_chunk = max(1, chunk_rows // stations)
+
+    weather_rng, demand_rng, station_rng = [
+        np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(3)
+    ]
+    weather_noise = _AutoregressiveNoise(
+        weather_rng, profile.weather_corr, profile.weather_phi
+    )
+    demand_noise = _AutoregressiveNoise(
+        demand_rng, profile.demand_corr, profile.demand_phi, (stations,)
+    )
+    offsets = np.zeros(stations)
+    if stations > 1:
+        offsets = station_rng.normal(0.0, STATION_SPREAD, stations)
+        offsets -= offsets.mean()
+
+    levels = np.linspace(0.0, 1.0, QUANTILE_LEVELS)
+    for first in range(0, total_hours, hours_per_chunk):
+        count = min(hours_per_chunk, total_hours - first)
+        timestamps = pd.date_range(
+            start + pd.Timedelta(hours=first), periods=count, freq="h"
+        )
+        columns = calendar(timestamps)
+        month, hour = columns["mnth"] - 1, columns["hr"]
+
+        # Weather: copula scores -> residual quantiles -> plus the seasonal mean
+        uniform = ndtr(weather_noise.draw(count))
+        weather = np.column_stack(
+            [
+                np.interp(uniform[:, j], levels, profile.weather_quantiles[j])
+                for j in range(len(SEASONAL))
+            ]
+        )
+        weather = np.clip(
+            weather + profile.weather_mean[month, hour, : len(SEASONAL)], 0.0, 1.0
+        ).round(4)
+        weathersit = profile.weathersit_values[
+            np.minimum(
+                (uniform[:, -1] * QUANTILE_LEVELS).astype(int), QUANTILE_LEVELS - 1
+            )
+        ].astype("int64")
+
+        yr = timestamps.to_series().dt.year.to_numpy() - start.year
+        expected = profile.demand(
+            hour,
+            columns["workingday"],
+            month,
+            weathersit,
+            weather=weather[:, [0, 2, 3]],
+            yr=yr,
+        )
+        log_demand = (
+            expected[:, np.newaxis, :]
+            + offsets[np.newaxis, :, np.newaxis]
+            + demand_noise.draw(count)
+            * profile.demand_sigma[hour * 2 + columns["workingday"], np.newaxis]
+        )
+        demand = np.maximum(np.rint(np.expm1(log_demand)), 0).astype("int64")
+
+        def repeat(values):
+            return np.repeat(values, stations)
+
+        chunk = pd.DataFrame(
+            {
+                "instant": np.arange(
+                    first * stations + 1, (first + count) * stations + 1
+                ),
+                "dteday": repeat(columns["dteday"]),
+                "season": repeat(columns["season"]),
+                "yr": repeat(yr),
+                "mnth": repeat(columns["mnth"]),
+                "hr": repeat(hour),
+                "holiday": repeat(columns["holiday"]),
+                "weekday": repeat(columns["weekday"]),
+                "workingday": repeat(columns["workingday"]),
+                "weathersit": repeat(weathersit),
+                "temp": repeat(weather[:, 0]),
+                "atemp": repeat(weather[:, 1]),
+                "hum": repeat(weather[:, 2]),
+                "windspeed": repeat(weather[:, 3]),
+                "casual": demand[..., 0].ravel(),
+                "registered": demand[..., 1].ravel(),
+            }
+        )
+        chunk["cnt"] = chunk["casual"] + chunk["registered"]
+        yield chunk.astype(HOUR_DTYPES)
+
+
+def write_synthetic(path=OUTPUT_PATH, source=SOURCE_PATH, **kwargs):
+    """Fit on ``source`` and write the generated rows to a CSV or Parquet file.
+
+    Args:
+        path: Output file; ``.parquet`` writes Parquet, anything else CSV.
+        source: Real data to fit on.
+        **kwargs: Passed to generate_chunks.
+
+    Returns:
+        The number of rows written.
+    """
+    profile = fit_profile(source)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    rows, writer = 0, None
+    try:
+        for chunk in generate_chunks(profile, **kwargs):
+            if path.endswith(".parquet"):
+                # pylint: disable=import-outside-toplevel
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp_path, table.schema)
+                writer.write_table(table)
+            else:
+                chunk.to_csv(
+                    tmp_path, mode="a" if rows else "w", header=not rows, index=False
+                )
+            rows += len(chunk)
+        if writer is not None:
+            writer.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--source", default=SOURCE_PATH)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--start", default="2011-01-01")
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--stations", type=int, default=1)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rows = write_synthetic(
+        args.output,
+        args.source,
+        start=args.start,
+        years=args.years,
+        stations=args.stations,
+        chunk_rows=args.chunk_rows,
+        seed=args.seed,
+    )
+    print(f"Wrote {rows} synthetic rows to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+task_profiling.py
+Instrumentation for Prefect tasks: wall time, CPU time, peak RSS and the
+size of task inputs and outputs, collected per task run.
+
+CPU time is the process's, so it includes the worker threads of NumPy,
+OpenMP or scikit-learn. The peak RSS of a run is the largest RSS sampled by a
+background thread while the task runs (with psutil, or /proc on Linux);
+where neither is available it falls back to the peak of the whole process
+so far.
+
+Decorate the plain function below ``@task`` so Prefect still sees the
+original signature:
+
+    @task
+    @profile_task
+    def read_data(data_path=DATA_PATH):
+        ...
+
+Records are kept in memory until ``log_task_profiles`` writes them to a JSON
+profile and logs them to MLflow. Setting ``TASK_PROFILE_THRESHOLD`` (seconds)
+runs every task under cProfile and keeps the pstats dump of any task slower
+than the threshold.
+"""
+
+import cProfile
+import datetime
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - optional
+    psutil = None
+
+PROFILE_DIR = os.environ.get("TASK_PROFILE_DIR", "profiles")
+PROFILE_THRESHOLD_ENV = "TASK_PROFILE_THRESHOLD"
+# Seconds between two RSS samples of a running task
+RSS_SAMPLE_INTERVAL = 0.01
+
+_records = []
+_lock = threading.Lock()
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _rss_mb():
+    """Current RSS of the process, or None where it cannot be read."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class RssSampler:
+    """Samples the RSS in a background thread and keeps the largest value."""
+
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak_mb = _rss_mb()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, _rss_mb())
+
+    def __enter__(self):
+        if self.peak_mb is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, _rss_mb())
+
+    def peak(self):
+        """Peak RSS in MB seen while sampling, else of the whole process."""
+        return _peak_rss_mb() if self.peak_mb is None else self.peak_mb
+
+
+def estimate_size(obj):
+    """Approximate the in-memory size of a task argument or result in bytes."""
+    if obj is None:
+        return 0
+    if hasattr(obj, "memory_usage"):  # pandas DataFrame / Series
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    if hasattr(obj, "nbytes"):  # numpy arrays
+        return int(obj.nbytes)
+    if isinstance(obj, (list, tuple, set)):
+        return sum(estimate_size(item) for item in obj)
+    if isinstance(obj, dict):
+        return sum(estimate_size(value) for value in obj.values())
+    return sys.getsizeof(obj)
+
+
+def _slow_threshold(threshold):
+    if threshold is not None:
+        return threshold
+    value = os.environ.get(PROFILE_THRESHOLD_ENV)
+    return float(value) if value else None
+
+
+def profile_task(func=None, *, slow_threshold=None):
+    """Record timing and memory for every call of the decorated function.
+
+    Args:
+        func: The task function to instrument.
+        slow_threshold: Seconds after which a cProfile dump is kept. Defaults
+            to the TASK_PROFILE_THRESHOLD environment variable; when neither
+            is set no profiler runs.
+    """
+    if func is None:
+        return functools.partial(profile_task, slow_threshold=slow_threshold)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        threshold = _slow_threshold(slow_threshold)
+        profiler = cProfile.Profile() if threshold is not None else None
+
+        started_at = datetime.datetime.now()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        with RssSampler() as rss:
+            if profiler:
+                profiler.enable()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                if profiler:
+                    profiler.disable()
+        wall_s = time.perf_counter() - wall_start
+        cpu_s = time.process_time() - cpu_start
+
+        record = {
+            "task": func.__name__,
+            "started_at": started_at.isoformat(),
+            "wall_s": wall_s,
+            "cpu_s": cpu_s,
+            "peak_rss_mb": rss.peak(),
+            "input_bytes": estimate_size(args) + estimate_size(kwargs),
+            "output_bytes": estimate_size(result),
+            "pstats_path": None,
+        }
+        if profiler and wall_s > threshold:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stamp = started_at.strftime("%Y%m%dT%H%M%S%f")
+            record["pstats_path"] = os.path.join(
+                PROFILE_DIR, f"{func.__name__}-{stamp}.prof"
+            )
+            profiler.dump_stats(record["pstats_path"])
+
+        with _lock:
+            _records.append(record)
+        return result
+
+    return wrapper
+
+
+def get_task_profiles():
+    """Return a copy of the records collected so far."""
+    with _lock:
+        return list(_records)
+
+
+def clear_task_profiles():
+    with _lock:
+        _records.clear()
+
+
+def pop_task_profiles():
+    """Return the records collected so far and forget them."""
+    with _lock:
+        records = list(_records)
+        _records.clear()
+    return records
+
+
+def record_task_profiles(records):
+    """Add records collected elsewhere, e.g. returned by a worker process."""
+    with _lock:
+        _records.extend(records)
+
+
+def write_task_profiles(path=None):
+    """Write the collected records to a JSON profile and return its path."""
+    path = path or os.path.join(PROFILE_DIR, "task_profile.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"tasks": get_task_profiles()}, f, indent=2)
+    return path
+
+
+def log_task_profiles(run_id=None, experiment_name=None, clear=True):
+    """Log the collected records as MLflow metrics plus a JSON artifact.
+
+    Metrics are named ``<task>.<measure>`` and use the call index of the task
+    as the step, so repeated task runs show up as a series.
+
+    Args:
+        run_id: Existing run to attach the profile to; a new run is started
+            when omitted.
+        experiment_name: Experiment for the new run, if one is started.
+        clear: Drop the in-memory records once they have been logged.
+
+    Returns:
+        Path of the JSON profile written to disk.
+    """
+    records = get_task_profiles()
+    profile_path = write_task_profiles()
+
+    try:
+        import mlflow  # pylint: disable=import-outside-toplevel
+
+        if run_id is None and experiment_name:
+            mlflow.set_experiment(experiment_name)
+        with mlflow.start_run(
+            run_id=run_id, run_name=None if run_id else "task-profile"
+        ):
+            steps = {}
+            for record in records:
+                step = steps.get(record["task"], 0)
+                steps[record["task"]] = step + 1
+                mlflow.log_metrics(
+                    {
+                        f"{record['task']}.{measure}": record[measure]
+                        for measure in (
+                            "wall_s",
+                            "cpu_s",
+                            "peak_rss_mb",
+                            "input_bytes",
+                            "output_bytes",
+                        )
+                    },
+                    step=step,
+                )
+                if record["pstats_path"]:
+                    mlflow.log_artifact(record["pstats_path"], artifact_path="profiles")
+            mlflow.log_artifact(profile_path, artifact_path="profiles")
+    except Exception as e:
+        logging.warning("Could not log task profiles to MLflow: %s", e)
+
+    if clear:
+        clear_task_profiles()
+    return profile_path
@@ -0,0 +1,182 @@
+"""
+trainers.py
+Trainer backends of the training pipeline.
+
+TRAINER (or the ``trainer`` argument of train()) picks one:
+
+    decision_tree            one DecisionTreeRegressor, single-threaded
+    hist_gradient_boosting   sklearn's HistGradientBoostingRegressor on all
+                             cores (or ``threads``), with early stopping
+
+The gradient boosting backend bins the features itself: every feature is cut
+into at most MAX_BINS bins and the model is fitted on the uint8 bin codes.
+The bin edges and codes are cached under BIN_CACHE_DIR, keyed by the
+fingerprint of the training matrix, so training again on the same data (on
+another number of cores, with other parameters) skips the binning.
+
+The fitted model is a PrebinnedRegressor, which bins raw features before
+predicting. model_format stores it as a plain tree ensemble with the bin
+edges as thresholds, so it is served like any other model.
+
+Only the decision tree fits several targets at once (one tree whose leaves
+hold a value per target); the gradient boosting backend takes one target.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+
+TRAINER = os.environ.get("TRAINER", "decision_tree")
+BIN_CACHE_DIR = os.environ.get(
+    "BIN_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "project-mlops", "bins"),
+)
+# 255 bins keep the codes in a uint8, as sklearn's own binning does
+MAX_BINS = 255
+BINNING_VERSION = 1
+BOOSTING_PARAMS = {
+    "max_iter": 1000,
+    "learning_rate": 0.1,
+    "max_leaf_nodes": 31,
+    "early_stopping": True,
+    "validation_fraction": 0.1,
+    "n_iter_no_change": 20,
+    "random_state": 42,
+}
+
+
+def compute_bin_edges(X, max_bins=MAX_BINS):
+    """Upper edges of the bins of every column of X.
+
+    A column with at most ``max_bins`` distinct values gets one bin per
+    value, cut halfway between consecutive values; other columns are cut at
+    quantiles.
+    """
+    edges = []
+    for column in np.asarray(X, dtype=np.float64).T:
+        column = column[~np.isnan(column)]
+        values = np.unique(column)
+        if len(values) <= max_bins:
+            edges.append((values[:-1] + values[1:]) / 2)
+        else:
+            quantiles = np.linspace(0, 100, max_bins + 1)[1:-1]
+            edges.append(np.unique(np.percentile(column, quantiles, method="midpoint")))
+    return edges
+
+
+def apply_bins(X, edges):
+    """Bin codes of X: the code of x is the number of edges below x.
+
+    A code <= k is therefore the same test as x <= edges[k]. Missing values
+    get the last code.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    codes = np.empty(X.shape, dtype=np.uint8)
+    for j, column_edges in enumerate(edges):
+        codes[:, j] = np.searchsorted(column_edges, X[:, j], side="left")
+    return codes
+
+
+def fingerprint(X, max_bins=MAX_BINS):
+    """Key of the binned copy of a training matrix."""
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    digest = hashlib.sha256(f"{BINNING_VERSION}:{max_bins}:{X.shape}".encode())
+    digest.update(X.data)
+    return digest.hexdigest()
+
+
+def load_or_bin(X, max_bins=MAX_BINS, cache_dir=BIN_CACHE_DIR):
+    """Return (edges, codes) of X, from the cache when it was binned before."""
+    path = os.path.join(cache_dir, f"{fingerprint(X, max_bins)}.npz")
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            edges = [cached[f"edges_{j}"] for j in range(X.shape[1])]
+            return edges, cached["codes"]
+
+    edges = compute_bin_edges(X, max_bins)
+    codes = apply_bins(X, edges)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        np.savez(f, codes=codes, **{f"edges_{j}": edge for j, edge in enumerate(edges)})
+    os.replace(tmp_path, path)
+    return edges, codes
+
+
+class PrebinnedRegressor:
+    """A regressor fitted on bin codes, predicting from raw features."""
+
+    def __init__(self, bin_edges, estimator):
+        self.bin_edges_ = bin_edges
+        self.estimator_ = estimator
+        self.n_features_in_ = len(bin_edges)
+
+    def predict(self, X):
+        return self.estimator_.predict(apply_bins(X, self.bin_edges_))
+
+    def get_params(self, deep=True):  # pylint: disable=unused-argument
+        return dict(self.estimator_.get_params(), max_bins=MAX_BINS)
+
+
+def fit_decision_tree(X, y, threads=None):  # pylint: disable=unused-argument
+    from sklearn.tree import (  # pylint: disable=import-outside-toplevel
+        DecisionTreeRegressor,
+    )
+
+    return DecisionTreeRegressor().fit(X, y)
+
+
+def fit_hist_gradient_boosting(X, y, threads=None, cache_dir=BIN_CACHE_DIR):
+    # pylint: disable=import-outside-toplevel
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    from threadpoolctl import threadpool_limits
+
+    edges, codes = load_or_bin(X, cache_dir=cache_dir)
+    estimator = HistGradientBoostingRegressor(max_bins=MAX_BINS, **BOOSTING_PARAMS)
+    with threadpool_limits(limits=threads, user_api="openmp"):
+        estimator.fit(codes, y)
+    return PrebinnedRegressor(edges, estimator)
+
+
+TRAINERS = {
+    "decision_tree": fit_decision_tree,
+    "hist_gradient_boosting": fit_hist_gradient_boosting,
+}
+MULTI_OUTPUT_TRAINERS = ("decision_tree",)
+
+
+def train(X, y, trainer=TRAINER, threads=None):
+    """Fit a model with one of the TRAINERS.
+
+    Args:
+        X: Feature matrix.
+        y: Target, or one column per target for a multi-output model.
+        trainer: Name of the backend.
+        threads: Cores the backend may use; all of them by default.
+
+    Returns:
+        (model, stats), stats holding the trainer, the number of threads and
+        the training time in seconds.
+    """
+    if trainer not in TRAINERS:
+        raise ValueError(
+            f"Unknown trainer {trainer!r}, expected one of {list(TRAINERS)}."
+        )
+    if np.ndim(y) > 1 and np.shape(y)[1] > 1 and trainer not in MULTI_OUTPUT_TRAINERS:
+        raise ValueError(
+            f"Trainer {trainer!r} fits one target, use one of {MULTI_OUTPUT_TRAINERS}."
+        )
+    threads = threads or os.cpu_count() or 1
+    start = time.perf_counter()
+    model = TRAINERS[trainer](X, y, threads=threads)
+    stats = {
+        "trainer": trainer,
+        "threads": 1 if trainer == "decision_tree" else threads,
+        "train_seconds": time.perf_counter() - start,
+    }
+    return model, stats
@@ -6,22 +6,26 @@ This module defines the ModelService class for bike-sharing prediction.
 import base64
 import json
 
+from features import DEFAULT_TRANSFORMER
+
 
 class ModelService:
     """
     Class to handle model predictions and data preprocessing.
     """
 
-    def __init__(self, model, version=None):
+    def __init__(self, model, version=None, transformer=None):
         """
         Initializes the ModelService with a given model and optional version.
 
         Args:
             model: The machine learning model to use for predictions.
             version: The version of the model.
+            transformer: The FeatureTransformer saved with the model.
         """
         self.model = model
         self.version = version
+        self.transformer = transformer or DEFAULT_TRANSFORMER
 
     def base64_decode(self, base64_input):
         decoded_bytes = base64.b64decode(base64_input)
@@ -42,33 +46,20 @@ class ModelService:
         Returns:
             A dictionary of features.
         """
-        features = {
-            "season": ride["season"],
-            "holiday": ride["holiday"],
-            "workingday": ride["workingday"],
-            "weathersit": ride["weathersit"],
-            "temp": ride["temp"],
-            "atemp": ride["atemp"],
-            "hum": ride["hum"],
-            "windspeed": ride["windspeed"],
-            "hr": ride["hr"],
-            "mnth": ride["mnth"],
-            "yr": ride["yr"],
-        }
-        return features
+        return self.transformer.select(ride)
 
     def predict(self, features):
         """
         Predicts the count using the model and features provided.
 
         Args:
-            features: A dictionary of input features.
+            features: A dictionary of input features, a list of them or a
+                feature matrix.
 
         Returns:
-            The predicted count as a float.
+            The predicted count (of the first row) as a float.
         """
-        features_list = [list(features.values())]
-        preds = self.model.predict(features_list)
+        preds = self.model.predict(self.transformer.transform(features))
         return float(preds[0])
 
     def lambda_handler(self, event):
@@ -81,20 +72,22 @@ class ModelService:
         Returns:
             A dictionary containing predictions for each record.
         """
-        predictions = []
-        for record in event["Records"]:
-            base64_input = record["kinesis"]["data"]
-            ride_event = self.base64_decode(base64_input)
-            ride = ride_event["ride"]
-
-            features = self.prepare_features(ride)
-            prediction_result = self.predict(features)
-
-            result = {
+        rides = [
+            self.base64_decode(record["kinesis"]["data"])["ride"]
+            for record in event["Records"]
+        ]
+        if not rides:
+            return {"predictions": []}
+
+        # One feature matrix and one predict call for the whole batch
+        preds = self.model.predict(self.transformer.transform(rides))
+
+        predictions = [
+            {
                 "model": "bike_sharing_prediction_model",
                 "version": self.version,
-                "prediction": {"prediction_result": prediction_result},
+                "prediction": {"prediction_result": float(prediction_result)},
             }
-            predictions.append(result)
-
+            for prediction_result in preds
+        ]
         return {"predictions": predictions}
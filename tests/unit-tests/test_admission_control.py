@@ -0,0 +1,152 @@
+"""
+test_admission_control.py
+This module contains tests for the admission control of the prediction
+service.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+from flask import Flask, jsonify, request
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "web_service"))
+
+# pylint: disable=wrong-import-position
+from admission_control import (
+    DEADLINE_HEADER,
+    AdmissionController,
+    Shed,
+    install_admission_control,
+)
+
+
+def make_app(controller, release):
+    app = Flask(__name__)
+    app.calls = 0
+
+    @app.route("/predict", methods=["POST"])
+    def predict():
+        app.calls += 1
+        release.wait(timeout=5)
+        return jsonify({"prediction": [len(request.json)]})
+
+    install_admission_control(app, controller=controller)
+    return app
+
+
+def metric(app, name):
+    for line in app.test_client().get("/metrics").get_data(as_text=True).split("\n"):
+        if line.startswith(f"{name} "):
+            return float(line.split()[-1])
+    raise KeyError(name)
+
+
+@pytest.fixture(name="release")
+def fixture_release():
+    release = threading.Event()
+    yield release
+    release.set()
+
+
+def test_late_requests_are_shed_before_the_view(release):
+    """
+    Tests that requests past their deadline, or that would finish after it,
+    are rejected with 503 before the view runs, and that the reasons are
+    counted.
+    """
+    release.set()
+    controller = AdmissionController(max_concurrent=1, max_queued=1)
+    app = make_app(controller, release)
+    client = app.test_client()
+
+    response = client.post(
+        "/predict", data="not json", headers={DEADLINE_HEADER: str(time.time() - 1)}
+    )
+    assert response.status_code == 503
+    assert response.json["reason"] == "deadline_exceeded"
+    assert response.headers["Retry-After"] == "1"
+    assert client.post("/predict", headers={DEADLINE_HEADER: "soon"}).status_code == 400
+
+    deadline = {DEADLINE_HEADER: str(time.time() + 60)}
+    assert client.post("/predict", json={"hr": 1}, headers=deadline).status_code == 200
+    controller.service_time = 10.0
+    response = client.post(
+        "/predict", json={"hr": 1}, headers={DEADLINE_HEADER: str(time.time() + 5)}
+    )
+    assert response.json["reason"] == "deadline_unreachable"
+    assert app.calls == 1
+
+    assert metric(app, "predict_admitted_total") == 1
+    assert metric(app, 'predict_shed_total{reason="deadline_exceeded"}') == 1
+    assert metric(app, 'predict_shed_total{reason="deadline_unreachable"}') == 1
+    assert metric(app, "predict_running") == 0
+
+
+def test_queue_is_bounded(release):
+    """
+    Tests that requests beyond the concurrency limit wait in a bounded
+    queue, that a full queue gives 429, that a queued request gives up at
+    its deadline and that the queue time is recorded.
+    """
+    controller = AdmissionController(max_concurrent=1, max_queued=1, max_wait_ms=5000)
+    app = make_app(controller, release)
+    responses = {}
+
+    def post(name, headers=None):
+        response = app.test_client().post("/predict", json={}, headers=headers or {})
+        responses[name] = response.status_code
+
+    def wait_for(condition):
+        for _ in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        raise AssertionError("timed out")
+
+    running = threading.Thread(target=post, args=("running",))
+    running.start()
+    wait_for(lambda: controller.running == 1)
+    late = {DEADLINE_HEADER: str(time.time() + 0.2)}
+    post("late", late)
+    assert responses["late"] == 503
+    assert controller.shed["queue_timeout"] == 1
+
+    queued = threading.Thread(target=post, args=("queued",))
+    queued.start()
+    wait_for(lambda: controller.queued == 1)
+    post("rejected")
+    assert responses["rejected"] == 429
+    assert metric(app, "predict_queued") == 1
+
+    time.sleep(0.05)
+    release.set()
+    running.join()
+    queued.join()
+    assert responses["running"] == responses["queued"] == 200
+    assert app.calls == 2
+    assert metric(app, 'predict_shed_total{reason="queue_full"}') == 1
+    assert metric(app, 'predict_queue_seconds_bucket{le="+Inf"}') == 2
+    # The queued request waited for the running one
+    assert metric(app, "predict_queue_seconds_sum") >= 0.05
+
+
+def test_recovers_from_a_slow_outlier():
+    """
+    Tests that one slow request sheds requests with a tight deadline only
+    until the service time estimate has decayed.
+    """
+    controller = AdmissionController(max_concurrent=1, max_queued=1, half_life=0.05)
+    controller.acquire()
+    controller.release(5.0)  # e.g. the first request, which loads the model
+    assert controller.expected_service_time() > 0.2
+
+    with pytest.raises(Shed, match="deadline_unreachable"):
+        controller.acquire(time.time() + 0.2)
+    time.sleep(0.4)
+    controller.acquire(time.time() + 0.2)
+    controller.release(0.01)
+    assert controller.expected_service_time() < 0.05
+    assert controller.shed["deadline_unreachable"] == 1
@@ -0,0 +1,94 @@
+"""
+test_artifact_cache.py
+This module contains tests for the local artifact cache.
+"""
+
+import os
+
+from artifact_cache import ArtifactCache, file_digest
+
+
+class FakeDownloader:
+    # pylint: disable=too-few-public-methods
+    """
+    Stands in for MlflowClient.download_artifacts and counts the calls.
+    """
+
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.calls = []
+
+    def __call__(self, run_id, artifact_path, dst_dir):
+        self.calls.append((run_id, artifact_path))
+        path = os.path.join(dst_dir, os.path.basename(artifact_path))
+        with open(path, "wb") as f:
+            f.write(self.payloads[(run_id, artifact_path)])
+        return path
+
+
+def test_hit_skips_download(tmp_path):
+    """
+    Tests that a second fetch is served from the cache.
+    """
+    download = FakeDownloader({("run1", "models/m.pkl"): b"model bytes"})
+    cache = ArtifactCache(tmp_path / "cache")
+
+    first = cache.fetch("run1", "models/m.pkl", download)
+    second = cache.fetch("run1", "models/m.pkl", download)
+
+    assert first == second
+    assert download.calls == [("run1", "models/m.pkl")]
+    assert os.path.basename(first) == file_digest(first)
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    """
+    Tests that two runs logging the same bytes share one blob.
+    """
+    download = FakeDownloader(
+        {("run1", "models/m.pkl"): b"same", ("run2", "models/m.pkl"): b"same"}
+    )
+    cache = ArtifactCache(tmp_path / "cache")
+
+    assert cache.fetch("run1", "models/m.pkl", download) == cache.fetch(
+        "run2", "models/m.pkl", download
+    )
+    assert cache.total_bytes() == 4
+
+
+def test_corrupted_blob_is_downloaded_again(tmp_path):
+    """
+    Tests that a blob failing its checksum counts as a miss.
+    """
+    download = FakeDownloader({("run1", "models/m.pkl"): b"model bytes"})
+    cache = ArtifactCache(tmp_path / "cache")
+    path = cache.fetch("run1", "models/m.pkl", download)
+
+    with open(path, "r+b") as f:
+        f.write(b"X")
+    cache.fetch("run1", "models/m.pkl", download)
+
+    assert len(download.calls) == 2
+
+
+def test_lru_eviction(tmp_path):
+    """
+    Tests that the least recently used artifact is evicted first.
+    """
+    download = FakeDownloader(
+        {
+            ("a", "m"): b"a" * 40,
+            ("b", "m"): b"b" * 40,
+            ("c", "m"): b"c" * 40,
+        }
+    )
+    cache = ArtifactCache(tmp_path / "cache", max_bytes=100)
+
+    path_a = cache.fetch("a", "m", download)
+    cache.fetch("b", "m", download)
+    cache.fetch("a", "m", download)  # a is now more recent than b
+    cache.fetch("c", "m", download)
+
+    assert cache.get("b", "m") is None
+    assert cache.get("a", "m") == path_a
+    assert cache.total_bytes() == 80
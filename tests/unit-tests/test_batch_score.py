@@ -0,0 +1,84 @@
+"""
+test_batch_score.py
+This module contains tests for the multi-process offline batch scoring job.
+"""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+from sklearn.tree import DecisionTreeRegressor
+
+from batch_score import PROGRESS_FILE, resolve_model, score_file
+from features import DEFAULT_TRANSFORMER
+from model_format import MODEL_EXTENSION, save_model
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "data", "hour.csv")
+
+
+@pytest.fixture(name="job")
+def fixture_job(tmp_path):
+    hours = pd.read_csv(DATA_PATH, nrows=5000)
+    source = tmp_path / "hours.csv"
+    hours.to_csv(source, index=False)
+    model = DecisionTreeRegressor(max_depth=8, random_state=0).fit(
+        DEFAULT_TRANSFORMER.transform(hours), hours["cnt"]
+    )
+    model_path = tmp_path / f"DecisionTreeRegressor{MODEL_EXTENSION}"
+    save_model(model, model_path)
+    expected = model.predict(DEFAULT_TRANSFORMER.transform(hours))
+    return str(source), hours, resolve_model(str(model_path)), expected
+
+
+def read_predictions(output_dir):
+    parts = sorted(name for name in os.listdir(output_dir) if name.endswith(".parquet"))
+    return pd.concat(
+        [pd.read_parquet(os.path.join(output_dir, part)) for part in parts],
+        ignore_index=True,
+    )
+
+
+def test_scores_chunks_in_order_across_workers(job, tmp_path):
+    """
+    Tests that a process pool writes every prediction, with the model
+    version, in input order.
+    """
+    source, hours, model_source, expected = job
+    output_dir = tmp_path / "predictions"
+
+    stats = score_file(source, output_dir, model_source, workers=2, chunk_rows=700)
+
+    predictions = read_predictions(output_dir)
+    assert stats["rows"] == len(hours)
+    assert stats["chunks"] == 8
+    assert predictions["instant"].tolist() == hours["instant"].tolist()
+    assert predictions["prediction"].tolist() == pytest.approx(expected.tolist())
+    assert set(predictions["model_version"]) == {model_source.version}
+
+
+def test_resumes_after_the_last_completed_chunk(job, tmp_path):
+    """
+    Tests that a rerun after a crash only scores the chunks that were not
+    completed, and refuses the output of another job.
+    """
+    source, hours, model_source, expected = job
+    output_dir = tmp_path / "predictions"
+    score_file(source, output_dir, model_source, workers=1, chunk_rows=700)
+    # Simulate a crash after three chunks
+    progress_path = output_dir / PROGRESS_FILE
+    progress = json.loads(progress_path.read_text())
+    progress.update(completed=3, done=False)
+    progress_path.write_text(json.dumps(progress))
+    for index in range(3, 8):
+        os.remove(output_dir / f"part-{index:05d}.parquet")
+
+    stats = score_file(source, output_dir, model_source, workers=1, chunk_rows=700)
+
+    assert stats["resumed_from_chunk"] == 3
+    assert stats["rows"] == len(hours) - 3 * 700
+    predictions = read_predictions(output_dir)
+    assert predictions["instant"].tolist() == hours["instant"].tolist()
+    assert predictions["prediction"].tolist() == pytest.approx(expected.tolist())
+    with pytest.raises(ValueError):
+        score_file(source, output_dir, model_source, workers=1, chunk_rows=500)
@@ -0,0 +1,67 @@
+"""
+test_dataset_partitions.py
+This module contains tests for the streaming, date-partitioned dataset
+splitter.
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from dataset_partitions import read_partitions, split_to_partitions
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "data", "hour.csv")
+
+
+@pytest.fixture(name="hours")
+def fixture_hours():
+    return pd.read_csv(DATA_PATH, nrows=3000)
+
+
+def test_split_by_date_boundaries(tmp_path, hours):
+    """
+    Tests that streaming in small chunks puts every row in the split and
+    month partition of its date.
+    """
+    source = tmp_path / "hours.csv"
+    hours.to_csv(source, index=False)
+
+    metadata = split_to_partitions(
+        source,
+        tmp_path / "dataset",
+        boundaries=["2011-03-01", "2011-04-01"],
+        names=["reference", "validation", "production"],
+        chunk_rows=500,
+    )
+
+    assert sum(metadata["rows"].values()) == len(hours)
+    assert sorted(os.listdir(tmp_path / "dataset" / "validation")) == ["month=2011-03"]
+    reference = read_partitions(tmp_path / "dataset", splits=["reference"])
+    assert reference["dteday"].max() < "2011-03-01"
+    pd.testing.assert_frame_equal(
+        read_partitions(tmp_path / "dataset"), hours, check_dtype=False
+    )
+
+
+def test_read_only_the_requested_range(tmp_path, hours):
+    """
+    Tests that a date range selects its rows and skips partitions outside it.
+    """
+    source = tmp_path / "hours.csv"
+    hours.to_csv(source, index=False)
+    split_to_partitions(source, tmp_path / "dataset", chunk_rows=1000)
+    # A corrupt file in a partition outside the range must never be opened
+    (
+        tmp_path / "dataset" / "reference" / "month=2011-01" / "part-99999.parquet"
+    ).write_bytes(b"not parquet")
+
+    rows = read_partitions(
+        tmp_path / "dataset", start="2011-02-10", end="2011-03-05", columns=["dteday"]
+    )
+
+    expected = hours[
+        (hours["dteday"] >= "2011-02-10") & (hours["dteday"] < "2011-03-05")
+    ]
+    assert list(rows.columns) == ["dteday"]
+    assert rows["dteday"].tolist() == expected["dteday"].tolist()
@@ -0,0 +1,134 @@
+"""
+test_drift_engine.py
+This module contains tests for the NumPy drift engine.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from drift_engine import DriftEngine, share_of_missing_values
+from reference_profile import ReferenceProfile
+from scipy import stats
+from scipy.spatial import distance
+
+from features import FEATURES
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+
+
+def make_frame(seed, size, shift=0.0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "temp": rng.normal(0.5 + shift, 0.2, size).round(2),
+            "holiday": rng.integers(0, 2, size),
+            "hr": rng.integers(0, 24, size),
+        }
+    )
+
+
+def test_scores_match_scipy():
+    """
+    Tests that every statistic equals its reference implementation.
+    """
+    reference, current = make_frame(0, 5000), make_frame(1, 300, shift=0.1)
+    engine = DriftEngine(ReferenceProfile.build(reference, list(reference.columns)))
+    result = engine.compute(current)
+
+    for i, column in enumerate(engine.columns):
+        ks = stats.ks_2samp(reference[column], current[column]).statistic
+        wasserstein = stats.wasserstein_distance(reference[column], current[column])
+        assert np.isclose(result["ks"][i], ks)
+        assert np.isclose(
+            result["wasserstein"][i], wasserstein / np.std(reference[column])
+        )
+
+    ref_share = reference["holiday"].value_counts(normalize=True).sort_index()
+    cur_share = current["holiday"].value_counts(normalize=True).sort_index()
+    assert np.isclose(
+        result["jensenshannon"][1], distance.jensenshannon(ref_share, cur_share)
+    )
+    assert list(result["stattest"]) == ["wasserstein", "jensenshannon", "wasserstein"]
+    assert list(result["drifted"]) == [True, False, False]
+
+
+def test_psi_over_reference_histogram():
+    """
+    Tests PSI against a direct computation on the reference bins.
+    """
+    reference, current = make_frame(0, 5000), make_frame(1, 300, shift=0.3)
+    engine = DriftEngine(ReferenceProfile.build(reference, ["temp"]))
+
+    edges = np.histogram_bin_edges(reference["temp"], bins="sturges")
+    ref = np.histogram(reference["temp"], edges)[0] / len(reference)
+    cur = np.histogram(np.clip(current["temp"], edges[0], edges[-1]), edges)[0]
+    cur = cur / len(current)
+    ref, cur = np.where(ref > 0, ref, 0.0001), np.where(cur > 0, cur, 0.0001)
+
+    assert np.isclose(
+        engine.compute(current)["psi"][0], np.sum((cur - ref) * np.log(cur / ref))
+    )
+
+
+def test_small_reference_uses_ks_p_value():
+    """
+    Tests that references of at most 1000 rows are judged by the KS test.
+    """
+    reference = make_frame(0, 500)
+    engine = DriftEngine(ReferenceProfile.build(reference, ["temp"]))
+    result = engine.compute(make_frame(1, 500, shift=0.2))
+
+    assert result["stattest"][0] == "ks"
+    assert result["drifted"][0]
+
+
+def test_share_of_missing_values():
+    """
+    Tests that empty strings, infinities and nulls count as missing cells.
+    """
+    df = pd.DataFrame({"a": [1.0, np.nan, np.inf, 2.0], "b": ["x", "", None, "y"]})
+    assert share_of_missing_values(df) == 4 / 8
+
+
+def test_agrees_with_evidently():
+    """
+    Tests that the window metrics match Evidently's report on real windows.
+    """
+    evidently = pytest.importorskip("evidently")
+    from evidently.metrics import (  # pylint: disable=import-outside-toplevel
+        ColumnDriftMetric,
+        DatasetDriftMetric,
+        DatasetMissingValuesMetric,
+    )
+    from evidently.report import Report  # pylint: disable=import-outside-toplevel
+
+    reference = pd.read_csv(os.path.join(DATA_DIR, "reference.csv"))
+    current = pd.read_csv(os.path.join(DATA_DIR, "hour.csv"))
+    current["prediction"] = np.resize(reference["prediction"].to_numpy(), len(current))
+    columns = FEATURES + ["prediction"]
+    engine = DriftEngine(ReferenceProfile.build(reference, columns))
+    mapping = evidently.ColumnMapping(
+        prediction="prediction", numerical_features=FEATURES, target=None
+    )
+
+    for _, window in list(current.groupby("dteday"))[::60]:
+        report = Report(
+            metrics=[
+                ColumnDriftMetric(column_name="prediction"),
+                DatasetDriftMetric(),
+                DatasetMissingValuesMetric(),
+            ]
+        )
+        report.run(
+            reference_data=reference, current_data=window, column_mapping=mapping
+        )
+        result = report.as_dict()["metrics"]
+
+        prediction_drift, drifted, missing = engine.window_metrics(window)
+        assert prediction_drift == pytest.approx(result[0]["result"]["drift_score"])
+        assert drifted == result[1]["result"]["number_of_drifted_columns"]
+        assert missing == pytest.approx(
+            result[2]["result"]["current"]["share_of_missing_values"]
+        )
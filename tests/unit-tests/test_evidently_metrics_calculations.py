@@ -0,0 +1,102 @@
+"""
+test_evidently_metrics_calculations.py
+This module contains tests for the drift metrics backfill.
+"""
+
+import datetime
+import sqlite3
+from types import SimpleNamespace
+
+import evidently_metrics_calculations as backfill
+import numpy as np
+import pandas as pd
+import pytest
+from drift_engine import DriftEngine
+from metrics_schema import get_drift_sink
+from reference_profile import ReferenceProfile
+
+import task_profiling
+
+
+def make_frame(seed, size):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "temp": rng.normal(0.5, 0.2, size),
+            "hr": rng.integers(0, 24, size),
+            "prediction": rng.normal(200, 50, size),
+        }
+    )
+
+
+def test_worker_task_profiles_are_recorded(monkeypatch):
+    """
+    Tests that the windows scored in the process pool come back with their
+    task profiles, which are recorded in the parent.
+    """
+    reference = make_frame(0, 2000)
+    engine = DriftEngine(ReferenceProfile.build(reference, list(reference.columns)))
+    monkeypatch.setattr(backfill, "_drift_engine", engine)
+    start = datetime.datetime(2012, 6, 1)
+    windows = [
+        (start + datetime.timedelta(days=i), make_frame(i + 1, 24)) for i in range(3)
+    ]
+    task_profiling.clear_task_profiles()
+
+    rows = backfill.compute_windows_parallel.fn(windows, workers=1, engine="native")
+
+    assert [row.timestamp for row in rows] == [start for start, _ in windows]
+    tasks = [record["task"] for record in task_profiling.get_task_profiles()]
+    assert tasks == ["compute_window_metrics"] * 3 + ["compute_windows_parallel"]
+
+
+def test_prep_db_raises_on_a_broken_database(tmp_path):
+    """
+    Tests that a database that cannot be prepared fails the backfill up
+    front instead of in the workers.
+    """
+    path = tmp_path / "metrics.db"
+    path.write_bytes(b"not a database" * 100)
+    sink = get_drift_sink(f"sqlite:///{path}")
+
+    with pytest.raises(sqlite3.DatabaseError):
+        backfill.prep_db.fn(sink)
+
+
+def test_calculate_metrics_postgresql_keeps_the_cursor_signature(monkeypatch):
+    """
+    Tests that the original entry point still reports the whole dataset
+    through a database cursor.
+    """
+    reference = make_frame(0, 2000)
+    engine = DriftEngine(ReferenceProfile.build(reference, list(reference.columns)))
+    monkeypatch.setattr(backfill, "_drift_engine", engine)
+    monkeypatch.setattr(backfill, "load_raw_data", lambda: make_frame(1, 48))
+    executed = []
+    cursor = SimpleNamespace(
+        execute=lambda statement, params: executed.append((statement, params))
+    )
+
+    backfill.calculate_metrics_postgresql.fn(cursor)
+
+    assert len(executed) == 1
+    assert executed[0][0].startswith("INSERT INTO dummy_metrics")
+    assert len(executed[0][1]) == 4
+
+
+def test_failed_windows_are_raised(tmp_path, monkeypatch):
+    """
+    Tests that a window whose metrics cannot be computed fails instead of
+    being skipped.
+    """
+    reference = make_frame(0, 2000)
+    engine = DriftEngine(ReferenceProfile.build(reference, list(reference.columns)))
+    monkeypatch.setattr(backfill, "_drift_engine", engine)
+    sink = get_drift_sink(f"sqlite:///{tmp_path / 'metrics.db'}")
+    sink.prepare()
+
+    with pytest.raises(KeyError):
+        backfill.write_window_metrics.fn(
+            sink, pd.DataFrame({"prediction": [1.0]}), engine="native"
+        )
+    sink.close()
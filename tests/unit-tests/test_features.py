@@ -0,0 +1,79 @@
+"""
+test_features.py
+This module contains tests for the shared FeatureTransformer.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import (
+    FEATURES,
+    FeatureTransformer,
+    MissingFeaturesError,
+    NonNumericFeatureError,
+)
+from utils import BIKE_DATA_TEMPLATE
+
+
+def test_inputs_give_identical_matrices():
+    """
+    Tests that records, DataFrames and arrays produce the same matrix.
+    """
+    transformer = FeatureTransformer()
+    records = [BIKE_DATA_TEMPLATE, dict(BIKE_DATA_TEMPLATE, hr=18, extra="ignored")]
+
+    from_records = transformer.transform(records)
+    from_frame = transformer.transform(pd.DataFrame(records))
+    from_array = transformer.transform(from_records.tolist())
+
+    assert from_records.flags.c_contiguous
+    assert from_records.dtype == np.float64
+    assert from_records.shape == (2, len(FEATURES))
+    np.testing.assert_array_equal(from_records, from_frame)
+    np.testing.assert_array_equal(from_records, from_array)
+    np.testing.assert_array_equal(
+        transformer.transform(BIKE_DATA_TEMPLATE), from_records[:1]
+    )
+
+
+def test_cyclic_encodings():
+    """
+    Tests the sine/cosine encodings of hr and mnth.
+    """
+    transformer = FeatureTransformer(cyclic=["hr", "mnth"])
+    matrix = transformer.transform(dict(BIKE_DATA_TEMPLATE, hr=6, mnth=12))
+
+    assert transformer.output_columns[-4:] == [
+        "hr_sin",
+        "hr_cos",
+        "mnth_sin",
+        "mnth_cos",
+    ]
+    np.testing.assert_allclose(matrix[0, -4:], [1.0, 0.0, 0.0, 1.0], atol=1e-12)
+
+
+def test_validation_errors():
+    """
+    Tests that missing and non-numeric features are reported by name.
+    """
+    transformer = FeatureTransformer()
+    record = dict(BIKE_DATA_TEMPLATE)
+    del record["hum"]
+
+    with pytest.raises(MissingFeaturesError, match="Missing features: hum"):
+        transformer.transform(record)
+    with pytest.raises(NonNumericFeatureError, match="'temp'"):
+        transformer.transform(dict(BIKE_DATA_TEMPLATE, temp="warm"))
+
+
+def test_spec_round_trip(tmp_path):
+    """
+    Tests that a saved transformer loads back unchanged.
+    """
+    transformer = FeatureTransformer(cyclic=["hr"], dtype="float32")
+
+    loaded = FeatureTransformer.load(transformer.save(tmp_path / "features.json"))
+
+    assert loaded == transformer
+    assert loaded.transform(BIKE_DATA_TEMPLATE).dtype == np.float32
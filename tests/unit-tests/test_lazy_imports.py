@@ -0,0 +1,53 @@
+"""
+test_lazy_imports.py
+This module contains tests that importing the training and registry modules
+has no side effects.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+PROBE = """
+import json, os, sys
+import {module}
+print(json.dumps({{
+    "loaded": sorted(m for m in ("mlflow", "sklearn", "evidently") if m in sys.modules),
+    "files": os.listdir("."),
+}}))
+"""
+
+
+@pytest.mark.parametrize(
+    "module", ["experiment_tracking", "model_registry", "drift_engine"]
+)
+def test_import_has_no_side_effects(tmp_path, module):
+    """
+    Tests that importing a module neither loads the heavy libraries nor
+    touches MLflow or the file system.
+    """
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(
+            [os.path.join(ROOT, "src"), os.path.join(ROOT, "monitoring")]
+        ),
+        # Any attempt to reach the tracking server would fail fast
+        MLFLOW_TRACKING_URI="http://127.0.0.1:9",
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        cwd=tmp_path,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60,
+        check=True,
+    )
+
+    state = json.loads(result.stdout.strip().splitlines()[-1])
+    assert state == {"loaded": [], "files": []}
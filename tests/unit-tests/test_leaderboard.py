@@ -0,0 +1,140 @@
+"""
+test_leaderboard.py
+This module contains tests for the run leaderboard.
+"""
+
+from types import SimpleNamespace
+
+import leaderboard
+
+
+class Page(list):
+    """
+    A page of runs with a continuation token, like mlflow's PagedList.
+    """
+
+    def __init__(self, items, token=None):
+        super().__init__(items)
+        self.token = token
+
+
+def make_run(run_id, end_time, **metrics):
+    return SimpleNamespace(
+        info=SimpleNamespace(
+            run_id=run_id, run_name=run_id, start_time=0, end_time=end_time
+        ),
+        data=SimpleNamespace(metrics=metrics, tags={"model": f"model-{run_id}"}),
+    )
+
+
+class FakeClient:
+    """
+    Serves runs in pages of two and counts full listing queries.
+    """
+
+    def __init__(self, runs):
+        self.runs = runs
+        self.listings = 0
+        self.experiment = SimpleNamespace(experiment_id="1", last_update_time=5)
+
+    def get_experiment_by_name(self, name):
+        return self.experiment if name == "exp" else None
+
+    def search_runs(
+        self,
+        experiment_ids,
+        filter_string="",
+        max_results=1000,
+        order_by=None,
+        page_token=None,
+    ):
+        # pylint: disable=unused-argument,too-many-arguments
+        if max_results == 1:
+            latest = max(self.runs, key=lambda r: r.info.end_time)
+            return Page([latest])
+        start = int(page_token or 0)
+        if start == 0:
+            self.listings += 1
+        end = start + 2
+        return Page(self.runs[start:end], str(end) if end < len(self.runs) else None)
+
+
+def test_rank_rows_orders_by_mae_r2_latency():
+    """
+    Tests ranking ties on MAE broken by R² and then latency.
+    """
+    rows = [
+        {"run_id": "a", "mae": 10.0, "r2": 0.8, "latency_p99_ms": 2.0},
+        {"run_id": "b", "mae": 5.0, "r2": 0.7, "latency_p99_ms": None},
+        {"run_id": "c", "mae": 5.0, "r2": 0.7, "latency_p99_ms": 1.0},
+        {"run_id": "d", "mae": 5.0, "r2": 0.9, "latency_p99_ms": 9.0},
+        {"run_id": "dataset", "mae": None, "r2": None, "latency_p99_ms": None},
+    ]
+
+    ranked = leaderboard.rank_rows(rows)
+
+    assert [r["run_id"] for r in ranked] == ["d", "c", "b", "a"]
+    assert [r["rank"] for r in ranked] == [1, 2, 3, 4]
+
+
+def test_leaderboard_pages_and_caches(tmp_path):
+    """
+    Tests that all pages are read once and reused until a new run finishes.
+    """
+    runs = [make_run(f"r{i}", end_time=i, mae=10.0 - i, r2=0.5) for i in range(5)]
+    client = FakeClient(runs)
+
+    first = leaderboard.get_leaderboard("exp", client, cache_dir=tmp_path)
+    second = leaderboard.get_leaderboard("exp", client, cache_dir=tmp_path)
+
+    assert [r["run_id"] for r in first] == ["r4", "r3", "r2", "r1", "r0"]
+    assert second == first
+    assert client.listings == 1
+
+    client.runs.append(make_run("r5", end_time=10, mae=0.5, r2=0.9))
+    third = leaderboard.get_leaderboard("exp", client, cache_dir=tmp_path)
+
+    assert third[0]["run_id"] == "r5"
+    assert client.listings == 2
+
+
+def test_rank_rows_ties_within_tolerance():
+    """
+    Tests that runs whose MAE and R² are within the tolerance of the best
+    are ranked by latency.
+    """
+    rows = [
+        {"run_id": "accurate", "mae": 50.0, "r2": 0.900, "latency_p99_ms": 9.0},
+        {"run_id": "fast", "mae": 50.3, "r2": 0.899, "latency_p99_ms": 1.0},
+        {"run_id": "worse", "mae": 52.0, "r2": 0.950, "latency_p99_ms": 0.5},
+    ]
+
+    assert [r["run_id"] for r in leaderboard.rank_rows(rows)] == [
+        "fast",
+        "accurate",
+        "worse",
+    ]
+    assert [r["run_id"] for r in leaderboard.rank_rows(rows, tolerance=0)] == [
+        "accurate",
+        "fast",
+        "worse",
+    ]
+
+
+def test_invalidate_cache_picks_up_late_metrics(tmp_path):
+    """
+    Tests that metrics logged to a finished run show up once the cache is
+    invalidated, although the cache key does not change.
+    """
+    runs = [make_run(f"r{i}", end_time=i, mae=10.0 - i, r2=0.5) for i in range(3)]
+    client = FakeClient(runs)
+    leaderboard.get_leaderboard("exp", client, cache_dir=tmp_path)
+
+    runs[0].data.metrics["latency_p99_ms"] = 1.5
+    stale = leaderboard.get_leaderboard("exp", client, cache_dir=tmp_path)
+    leaderboard.invalidate_cache("1", cache_dir=tmp_path)
+    fresh = leaderboard.get_leaderboard("exp", client, cache_dir=tmp_path)
+
+    assert stale[-1]["latency_p99_ms"] is None
+    assert fresh[-1]["latency_p99_ms"] == 1.5
+    assert client.listings == 2
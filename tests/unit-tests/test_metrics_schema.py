@@ -0,0 +1,128 @@
+"""
+test_metrics_schema.py
+This module contains tests for the drift metrics tables and their rollups.
+"""
+
+import datetime
+import sqlite3
+
+import pytest
+
+from metrics_schema import WindowMetrics, get_drift_sink
+
+
+def window_rows(count, start=datetime.datetime(2011, 1, 1, 22)):
+    return [
+        WindowMetrics(
+            start + datetime.timedelta(minutes=30 * i),
+            i / 10,
+            i % 3,
+            0.0,
+            {
+                "temp": ("wasserstein", i / 20, i % 2 == 0),
+                "prediction": ("wasserstein", i / 10, i % 3 == 0),
+            },
+        )
+        for i in range(count)
+    ]
+
+
+def query(path, statement):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(statement).fetchall()
+
+
+def test_windows_are_stored_per_feature(tmp_path):
+    """
+    Tests that every window is stored with its model version and one row
+    per feature.
+    """
+    path = tmp_path / "metrics.db"
+    with get_drift_sink(f"sqlite:///{path}", "run-1") as sink:
+        sink.prepare()
+        sink.write_many(window_rows(6))
+
+    assert query(path, "SELECT COUNT(*), MIN(model_version) FROM drift_metrics") == [
+        (6, "run-1")
+    ]
+    assert query(
+        path,
+        "SELECT feature, COUNT(*), SUM(drifted) FROM feature_drift "
+        "GROUP BY feature ORDER BY feature",
+    ) == [("prediction", 6, 2), ("temp", 6, 3)]
+    indexes = query(path, "SELECT name FROM sqlite_master WHERE type = 'index'")
+    assert ("drift_metrics_timestamp_idx",) in indexes
+
+
+@pytest.mark.parametrize("batch_size", [1, 4, 100])
+def test_rollups_are_updated_incrementally(tmp_path, batch_size):
+    """
+    Tests that the rollups match an aggregation of all windows however the
+    windows are split into batches.
+    """
+    path = tmp_path / "metrics.db"
+    rows = window_rows(10)
+    with get_drift_sink(f"sqlite:///{path}", "run-1", batch_size=batch_size) as sink:
+        sink.prepare()
+        sink.write_many(rows)
+
+    hourly = query(
+        path,
+        "SELECT bucket, windows, prediction_drift_sum, prediction_drift_max, "
+        "drifted_columns_max FROM drift_metrics_hourly ORDER BY bucket",
+    )
+    assert len(hourly) == 5
+    assert hourly[0] == ("2011-01-01 22:00:00", 2, pytest.approx(0.1), 0.1, 1)
+    assert hourly[-1] == ("2011-01-02 02:00:00", 2, pytest.approx(1.7), 0.9, 2)
+
+    daily = query(
+        path,
+        "SELECT bucket, windows, drift_score_max, drifted_windows "
+        "FROM feature_drift_daily WHERE feature = 'temp' ORDER BY bucket",
+    )
+    assert daily == [
+        ("2011-01-01 00:00:00", 4, 0.15, 2),
+        ("2011-01-02 00:00:00", 6, 0.45, 3),
+    ]
+
+
+def test_backfilling_a_range_again_changes_nothing(tmp_path):
+    """
+    Tests that writing the same windows again, in new batches and with
+    repeated windows, stores and rolls up every window once.
+    """
+    path = tmp_path / "metrics.db"
+    rows = window_rows(10)
+    with get_drift_sink(f"sqlite:///{path}", "run-1", batch_size=4) as sink:
+        sink.prepare()
+        sink.write_many(rows[:6])
+    tables = (
+        "drift_metrics",
+        "feature_drift",
+        "drift_metrics_hourly",
+        "feature_drift_daily",
+    )
+    for backfill in range(2):
+        with get_drift_sink(f"sqlite:///{path}", "run-1", batch_size=3) as sink:
+            sink.prepare()
+            sink.write_many(rows + rows[-2:])
+        if backfill == 0:
+            once = {table: query(path, f"SELECT * FROM {table}") for table in tables}
+        else:
+            assert {
+                table: query(path, f"SELECT * FROM {table}") for table in tables
+            } == once
+
+    assert query(path, "SELECT COUNT(*) FROM drift_metrics") == [(10,)]
+    assert query(path, "SELECT SUM(windows) FROM drift_metrics_daily") == [(10,)]
+    assert query(
+        path,
+        "SELECT windows, prediction_drift_sum FROM drift_metrics_hourly "
+        "ORDER BY bucket DESC LIMIT 1",
+    ) == [(2, pytest.approx(1.7))]
+
+    with get_drift_sink(f"sqlite:///{path}", "run-2") as sink:
+        sink.write_many(rows[:2])
+    assert query(
+        path, "SELECT model_version, COUNT(*) FROM drift_metrics GROUP BY 1"
+    ) == [("run-1", 10), ("run-2", 2)]
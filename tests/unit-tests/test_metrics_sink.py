@@ -0,0 +1,91 @@
+"""
+test_metrics_sink.py
+This module contains tests for the buffered metrics sinks.
+"""
+
+import datetime
+import sqlite3
+
+import pytest
+
+from metrics_sink import SQLiteSink, get_sink
+
+
+def hourly_rows(count):
+    start = datetime.datetime(2011, 1, 1)
+    return [
+        (start + datetime.timedelta(hours=i), i / count, i % 12, 0.0)
+        for i in range(count)
+    ]
+
+
+def count_rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM dummy_metrics").fetchone()[0]
+
+
+def test_rows_are_written_in_batches(tmp_path):
+    """
+    Tests that rows stay buffered until a batch is full or the sink closes.
+    """
+    path = tmp_path / "metrics.db"
+    sink = get_sink(f"sqlite:///{path}", batch_size=100)
+    sink.prepare()
+
+    sink.write_many(hourly_rows(250))
+    assert count_rows(path) == 200
+
+    sink.close()
+    assert count_rows(path) == 250
+    assert sink.rows_written == 250
+
+
+def test_failed_batches_are_retried(tmp_path):
+    """
+    Tests that a transient write error is retried without losing rows.
+    """
+
+    class FlakySink(SQLiteSink):
+        """
+        Fails the first write of every batch.
+        """
+
+        failures = 0
+
+        def _write_batch(self, rows):
+            if self.failures < 2:
+                self.failures += 1
+                raise sqlite3.OperationalError("database is locked")
+            super()._write_batch(rows)
+
+    path = tmp_path / "metrics.db"
+    with FlakySink(path, batch_size=10, retry_delay=0) as sink:
+        sink.prepare()
+        sink.write_many(hourly_rows(10))
+
+    assert count_rows(path) == 10
+
+
+def test_retries_are_bounded(tmp_path):
+    """
+    Tests that a persistent error is raised after max_retries attempts and
+    that closing the sink closes its connection even when the flush fails.
+    """
+
+    class BrokenSink(SQLiteSink):
+        """
+        Never manages to write.
+        """
+
+        def _write_batch(self, rows):
+            raise sqlite3.OperationalError("disk I/O error")
+
+    sink = BrokenSink(tmp_path / "metrics.db", max_retries=2, retry_delay=0)
+    sink.write_many(hourly_rows(5))
+    with pytest.raises(sqlite3.OperationalError):
+        sink.flush()
+
+    with pytest.raises(sqlite3.OperationalError):
+        sink.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        sink.conn.execute("SELECT 1")
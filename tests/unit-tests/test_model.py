@@ -129,3 +129,27 @@ def test_lambda_handler():
     }
 
     assert actual_predictions == expected_predictions
+
+
+def test_lambda_handler_batches_records():
+    """
+    Tests that all records of an event are scored with one predict call.
+    """
+    calls = []
+
+    class RecordingModel(ModelMock):
+        # pylint: disable=too-few-public-methods
+        def predict(self, features):
+            calls.append(features.shape)
+            return super().predict(features)
+
+    model_service = model.ModelService(RecordingModel(7.0), "Test123")
+    base64_input = read_text("bike_data.b64")
+    event = {"Records": [{"kinesis": {"data": base64_input}}] * 3}
+
+    actual_predictions = model_service.lambda_handler(event)
+
+    assert calls == [(3, 11)]
+    assert [
+        p["prediction"]["prediction_result"] for p in actual_predictions["predictions"]
+    ] == [7.0, 7.0, 7.0]
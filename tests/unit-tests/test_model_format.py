@@ -0,0 +1,169 @@
+"""
+test_model_format.py
+This module contains tests for the memory-mappable model format.
+"""
+
+import numpy as np
+import pytest
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.tree import DecisionTreeRegressor
+
+import model_format
+
+
+@pytest.fixture(name="training_data")
+def fixture_training_data():
+    """
+    Builds a small random regression problem with the 11 model features.
+    """
+    rng = np.random.default_rng(0)
+    X = rng.random((200, 11))
+    y = X @ rng.random(11) * 100
+    return X, y
+
+
+def test_decision_tree_round_trip(tmp_path, training_data):
+    """
+    Tests that a memory-mapped tree predicts exactly like the sklearn tree.
+    """
+    X, y = training_data
+    model = DecisionTreeRegressor(random_state=0).fit(X, y)
+
+    path = model_format.save_model(model, tmp_path / "tree.bkm")
+    mapped = model_format.load_model(path)
+
+    assert isinstance(mapped, model_format.MappedTreeRegressor)
+    np.testing.assert_array_equal(mapped.predict(X), model.predict(X))
+
+
+def test_linear_round_trip(tmp_path, training_data):
+    """
+    Tests that a memory-mapped linear model matches LinearRegression.
+    """
+    X, y = training_data
+    model = LinearRegression().fit(X, y)
+
+    mapped = model_format.load_model(
+        model_format.save_model(model, tmp_path / "linear.bkm")
+    )
+
+    np.testing.assert_allclose(mapped.predict(X), model.predict(X))
+
+
+def test_gradient_boosting_round_trip(tmp_path, training_data):
+    """
+    Tests that memory-mapped boosted trees match HistGradientBoostingRegressor,
+    missing values included, for both link functions.
+    """
+    X, y = training_data
+    X_missing = X.copy()
+    X_missing[::4, 3] = np.nan
+    for loss in ("squared_error", "poisson"):
+        model = HistGradientBoostingRegressor(
+            loss=loss, max_iter=30, random_state=0
+        ).fit(X_missing, y)
+
+        mapped = model_format.load_model(
+            model_format.save_model(model, tmp_path / f"{loss}.bkm")
+        )
+
+        assert isinstance(mapped, model_format.MappedBoostingRegressor)
+        assert mapped.header["meta"]["n_trees"] == model.n_iter_
+        np.testing.assert_allclose(mapped.predict(X_missing), model.predict(X_missing))
+
+
+def test_arrays_are_aligned_views(tmp_path, training_data):
+    """
+    Tests that loaded arrays are read-only views at aligned offsets.
+    """
+    X, y = training_data
+    path = model_format.save_model(
+        DecisionTreeRegressor().fit(X, y), tmp_path / "tree.bkm"
+    )
+    mapped = model_format.load_model(path)
+
+    for name, spec in mapped.header["arrays"].items():
+        assert spec["offset"] % model_format.ALIGNMENT == 0
+        assert not mapped.arrays[name].flags.writeable
+        assert not mapped.arrays[name].flags.owndata
+
+
+def test_rejects_foreign_files(tmp_path):
+    """
+    Tests that files without the format's magic bytes are rejected.
+    """
+    path = tmp_path / "model.pkl"
+    path.write_bytes(b"\x80\x04not a model at all")
+
+    with pytest.raises(ValueError):
+        model_format.load_model(path)
+
+
+def test_decision_tree_routes_missing_values_like_sklearn(tmp_path, training_data):
+    """
+    Tests that a memory-mapped tree sends NaN features down the same branch
+    as the sklearn tree, including for features seen without NaN in training.
+    """
+    X, y = training_data
+    X_missing = X.copy()
+    X_missing[::3, 2] = np.nan
+    model = DecisionTreeRegressor(max_depth=6, random_state=0).fit(X_missing, y)
+    assert model.tree_.missing_go_to_left.any()
+
+    mapped = model_format.load_model(
+        model_format.save_model(model, tmp_path / "tree.bkm")
+    )
+
+    X_test = X.copy()
+    X_test[::2, 2] = np.nan
+    X_test[1::4, 0] = np.nan
+    np.testing.assert_array_equal(mapped.predict(X_test), model.predict(X_test))
+
+
+def test_mapped_model_requires_predict():
+    """
+    Tests that MappedModel is abstract and every mapped model implements
+    predict.
+    """
+    assert model_format.MappedModel.__abstractmethods__ == {"predict"}
+    for cls in (
+        model_format.MappedTreeRegressor,
+        model_format.MappedLinearRegressor,
+        model_format.MappedBoostingRegressor,
+    ):
+        assert not cls.__abstractmethods__
+
+
+def test_gradient_boosting_predicts_in_chunks(tmp_path, training_data, monkeypatch):
+    """
+    Tests that boosted trees predict large batches chunk by chunk, with the
+    same result as in one step.
+    """
+    X, y = training_data
+    model = HistGradientBoostingRegressor(max_iter=20, random_state=0).fit(X, y)
+    mapped = model_format.load_model(
+        model_format.save_model(model, tmp_path / "boosting.bkm")
+    )
+    expected = mapped.predict(X)
+
+    monkeypatch.setattr(model_format, "PREDICT_CHUNK_NODES", 7 * model.n_iter_)
+
+    np.testing.assert_array_equal(mapped.predict(X), expected)
+
+
+def test_gradient_boosting_internals_are_checked(tmp_path, training_data):
+    """
+    Tests that saving fails loudly when sklearn's private gradient boosting
+    attributes are missing or no longer predict like the stored copy.
+    """
+    X, y = training_data
+    model = HistGradientBoostingRegressor(max_iter=5, random_state=0).fit(X, y)
+    model.predict = lambda X: np.zeros(len(X))
+
+    with pytest.raises(TypeError, match="do not predict like"):
+        model_format.save_model(model, tmp_path / "boosting.bkm")
+
+    del model._baseline_prediction  # pylint: disable=protected-access
+    with pytest.raises(TypeError, match="_baseline_prediction"):
+        model_format.save_model(model, tmp_path / "boosting.bkm")
@@ -9,21 +9,6 @@ from sklearn.tree import DecisionTreeRegressor
 
 from src.experiment_tracking import main, train_and_log_model
 
-# Constants
-FEATURES = [
-    "season",
-    "holiday",
-    "workingday",
-    "weathersit",
-    "temp",
-    "atemp",
-    "hum",
-    "windspeed",
-    "hr",
-    "mnth",
-    "yr",
-]
-
 
 class TestModelTraining(unittest.TestCase):
 
@@ -0,0 +1,105 @@
+"""
+test_online_drift.py
+This module contains tests for the streaming drift monitor and its sketches.
+"""
+
+import datetime
+import json
+
+import numpy as np
+import pandas as pd
+
+from drift_engine import DriftEngine
+from online_drift import ColumnSketch, OnlineDriftMonitor, PaneSketch
+from reference_profile import ReferenceProfile
+
+COLUMNS = ["temp", "hr", "prediction"]
+
+
+def make_frame(seed, size, shift=0.0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "temp": rng.normal(0.5 + shift, 0.2, size).round(2),
+            "hr": rng.integers(0, 24, size),
+            "prediction": rng.gamma(2.0, 100.0 * (1 + shift), size),
+        }
+    )
+
+
+def test_sketch_merge_matches_single_sketch():
+    """
+    Tests that merging two sketches equals sketching all values at once.
+    """
+    values = make_frame(0, 4000)["temp"].to_numpy()
+    left, right, whole = ColumnSketch(), ColumnSketch(), ColumnSketch()
+    left.update(values[:1500])
+    right.update(values[1500:])
+    whole.update(values)
+
+    merged = left.merge(right)
+    assert merged.exact
+    np.testing.assert_array_equal(merged.values, whole.values)
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+
+
+def test_sketch_memory_is_bounded():
+    """
+    Tests that a continuous column collapses into at most max_bins buckets
+    while keeping its quantiles within the relative accuracy.
+    """
+    values = make_frame(0, 50000)["prediction"].to_numpy()
+    sketch = ColumnSketch(max_bins=256)
+    for chunk in np.array_split(values, 50):
+        sketch.update(chunk)
+
+    assert len(sketch.values) <= 256
+    assert sketch.count == len(values)
+    median = sketch.values[np.searchsorted(np.cumsum(sketch.counts), len(values) / 2)]
+    assert abs(median / np.median(values) - 1) < 0.05
+
+
+def test_pane_sketch_round_trips_through_json():
+    """
+    Tests that a serialized pane merges like the original.
+    """
+    records = make_frame(1, 300).to_dict("records")
+    records[0]["temp"] = None
+    pane = PaneSketch(COLUMNS)
+    pane.update(records)
+
+    restored = PaneSketch.from_dict(json.loads(json.dumps(pane.to_dict())))
+    assert restored.missing_cells == 1
+    assert restored.to_dict() == pane.to_dict()
+
+
+def test_monitor_emits_a_row_when_a_window_closes():
+    """
+    Tests that each closed window is scored like the batch engine scores
+    the same rows.
+    """
+    engine = DriftEngine(ReferenceProfile.build(make_frame(0, 5000), COLUMNS))
+    current = make_frame(2, 72, shift=0.2)
+    start = datetime.datetime(2024, 1, 1)
+    current["timestamp"] = [start + datetime.timedelta(hours=i) for i in range(72)]
+    emitted = []
+    monitor = OnlineDriftMonitor(
+        engine,
+        window=datetime.timedelta(hours=24),
+        step=datetime.timedelta(hours=12),
+        emit=emitted.append,
+    )
+
+    rows = monitor.update(current.to_dict("records"))
+
+    assert [row[0] for row in rows] == [
+        start + datetime.timedelta(hours=h) for h in (12, 24, 36, 48, 60)
+    ]
+    assert emitted == rows
+    assert len(monitor.panes) <= 3
+    window = current.iloc[36:60]
+    expected = engine.compute(window)
+    assert np.isclose(rows[-1][1], expected["score"][2])
+    assert rows[-1][2] == expected["drifted"].sum()
+    assert rows[-1][3] == 0.0
+    assert rows[-1].features["prediction"][1] == rows[-1][1]
@@ -0,0 +1,61 @@
+"""
+test_prediction_store.py
+This module contains tests for the memoized monitoring predictions.
+"""
+
+import numpy as np
+import pandas as pd
+
+from prediction_store import PredictionStore
+
+
+class CountingModel:
+    # pylint: disable=too-few-public-methods
+    """
+    Predicts twice the input and records how many rows it scored.
+    """
+
+    def __init__(self):
+        self.rows = 0
+
+    def predict(self, x):
+        self.rows += len(x)
+        return 2.0 * x[:, 0]
+
+
+def transform(df):
+    return df[["temp"]].to_numpy()
+
+
+def test_only_new_rows_are_scored(tmp_path):
+    """
+    Tests that stored predictions are reused and new instants are appended.
+    """
+    store, model = PredictionStore(tmp_path), CountingModel()
+    data = pd.DataFrame({"instant": np.arange(1, 101), "temp": np.linspace(0, 1, 100)})
+
+    first = store.predict(model, "digest", data.iloc[:60], transform)
+    second = store.predict(
+        model, "digest", data.sample(frac=1, random_state=0), transform
+    )
+
+    assert model.rows == 100
+    np.testing.assert_allclose(first, 2.0 * data["temp"][:60])
+    np.testing.assert_allclose(
+        second, 2.0 * data.sample(frac=1, random_state=0)["temp"]
+    )
+    assert len(store.load("digest")) == 100
+
+
+def test_predictions_are_kept_per_model(tmp_path):
+    """
+    Tests that another model file does not reuse the first one's predictions.
+    """
+    store, model = PredictionStore(tmp_path), CountingModel()
+    data = pd.DataFrame({"instant": [1, 2, 3], "temp": [0.1, 0.2, 0.3]})
+
+    store.predict(model, "model-a", data, transform)
+    store.predict(model, "model-b", data, transform)
+    store.predict(model, "model-a", data, transform)
+
+    assert model.rows == 6
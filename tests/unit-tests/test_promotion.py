@@ -0,0 +1,62 @@
+"""
+test_promotion.py
+This module contains tests for the latency-aware promotion gate.
+"""
+
+import numpy as np
+from sklearn.tree import DecisionTreeRegressor
+
+from promotion import BENCHMARK_METRICS, benchmark_model, check_promotion
+
+CANDIDATE = {
+    "mae": 40.0,
+    "latency_p99_ms": 1.0,
+    "model_size_mb": 2.0,
+}
+
+
+def test_benchmark_model_reports_all_metrics():
+    """
+    Tests that the benchmark measures latency, size and memory.
+    """
+    rng = np.random.default_rng(0)
+    X = rng.random((50, 11))
+    model = DecisionTreeRegressor().fit(X, rng.random(50))
+
+    metrics = benchmark_model(model, X)
+
+    assert set(metrics) == set(BENCHMARK_METRICS)
+    assert 0 < metrics["latency_p50_ms"] <= metrics["latency_p99_ms"]
+    assert metrics["model_size_mb"] > 0
+    assert metrics["model_memory_mb"] > 0
+
+
+def test_gate_passes_within_budgets():
+    """
+    Tests that a fast, small and equally accurate candidate is promoted.
+    """
+    passed, reasons = check_promotion(
+        CANDIDATE, {"mae": 40.0}, p99_budget_ms=5, size_budget_mb=10
+    )
+
+    assert passed
+    assert not reasons
+
+
+def test_gate_rejects_slow_large_or_less_accurate():
+    """
+    Tests that every failed budget is reported.
+    """
+    passed, reasons = check_promotion(
+        CANDIDATE, {"mae": 39.0}, p99_budget_ms=0.5, size_budget_mb=1
+    )
+
+    assert not passed
+    assert len(reasons) == 3
+
+
+def test_gate_without_production_model():
+    """
+    Tests that the first candidate only has to meet the budgets.
+    """
+    assert check_promotion(CANDIDATE, None, p99_budget_ms=5, size_budget_mb=10)[0]
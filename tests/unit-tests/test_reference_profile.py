@@ -0,0 +1,35 @@
+"""
+test_reference_profile.py
+This module contains tests for the precomputed reference profile.
+"""
+
+import numpy as np
+import pandas as pd
+from reference_profile import load_or_build_profile
+
+
+def make_frame(seed, size, shift=0.0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "temp": rng.normal(0.5 + shift, 0.2, size).round(2),
+            "holiday": rng.integers(0, 2, size),
+        }
+    )
+
+
+def test_profile_is_cached_and_memory_mapped(tmp_path):
+    """
+    Tests that the profile is built once per reference file and memory-mapped.
+    """
+    path = tmp_path / "reference.csv"
+    make_frame(0, 1000).to_csv(path, index=False)
+
+    first = load_or_build_profile(path, ["temp", "holiday"], tmp_path / "cache")
+    second = load_or_build_profile(path, ["temp", "holiday"], tmp_path / "cache")
+
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+    assert isinstance(second.arrays["temp"]["support"], np.memmap)
+    for name, array in first.arrays["temp"].items():
+        np.testing.assert_array_equal(array, second.arrays["temp"][name])
+    assert second.meta["holiday"]["distinct"] == 2
@@ -0,0 +1,161 @@
+"""
+test_request_profiler.py
+This module contains tests for the on-demand profiling of the prediction
+service.
+"""
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import pytest
+from flask import Flask, jsonify
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "..", "web_service"))
+
+# pylint: disable=wrong-import-position
+from request_profiler import install_profiler
+
+TOKEN = "secret"
+HEADERS = {"Authorization": f"Bearer {TOKEN}"}
+
+
+def busy_work():
+    time.sleep(0.01)
+    return [str(i) for i in range(1000)]
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route("/predict", methods=["POST"])
+    def predict():
+        return jsonify({"prediction": len(busy_work())})
+
+    return app
+
+
+@pytest.fixture(name="app")
+def fixture_app():
+    return make_app()
+
+
+def test_profiles_the_next_requests_only(app):
+    """
+    Tests that a deterministic session profiles the requested number of
+    requests, then restores the original view.
+    """
+    profiler = install_profiler(app, token=TOKEN)
+    view = app.view_functions["predict"]
+    client = app.test_client()
+
+    response = client.post(
+        "/admin/profile", json={"mode": "deterministic", "requests": 2}, headers=HEADERS
+    )
+    assert response.status_code == 202
+    assert app.view_functions["predict"] is not view
+    assert client.get("/admin/profile", headers=HEADERS).json["status"] == "running"
+
+    for _ in range(3):
+        assert client.post("/predict", json={}).status_code == 200
+
+    assert app.view_functions["predict"] is view
+    assert profiler.session is None
+    report = client.get("/admin/profile", headers=HEADERS).json
+    assert report["status"] == "finished"
+    assert report["requests"] == 2
+    assert "busy_work" in report["pstats"]
+
+
+@pytest.mark.parametrize("mode, key", [("sampling", "busy_work"), ("memory", "")])
+def test_sampling_and_memory_reports(app, mode, key):
+    """
+    Tests that sampling returns collapsed stacks of the request path and
+    memory mode returns allocation sites, as text too.
+    """
+    install_profiler(app, token=TOKEN)
+    client = app.test_client()
+    client.post(
+        "/admin/profile",
+        json={"mode": mode, "seconds": 30, "interval_ms": 1},
+        headers=HEADERS,
+    )
+    for _ in range(5):
+        client.post("/predict", json={})
+
+    report = client.delete("/admin/profile", headers=HEADERS).json
+    text = client.get("/admin/profile?format=text", headers=HEADERS).get_data(
+        as_text=True
+    )
+
+    assert report["requests"] == 5
+    if mode == "sampling":
+        assert report["samples"] > 0
+        assert key in report["collapsed"]
+        assert text == report["collapsed"]
+    else:
+        assert report["allocations"]
+        assert report["peak_kb"] > 0
+        assert text.startswith(report["allocations"][0]["site"])
+
+
+@pytest.mark.parametrize("mode", ["deterministic", "memory"])
+def test_sessions_end_safely_under_concurrent_requests(mode):
+    """
+    Tests that requests in flight when a session ends still succeed, that
+    tracing stops once the last of them returns and that deterministic
+    mode profiles one request at a time.
+    """
+    # Both requests and the test meet here once the requests are in flight
+    entered, release = threading.Barrier(3), threading.Event()
+    app = Flask(__name__)
+
+    @app.route("/predict", methods=["POST"])
+    def predict():
+        entered.wait(timeout=5)
+        release.wait(timeout=5)
+        return jsonify({"prediction": len(busy_work())})
+
+    install_profiler(app, token=TOKEN)
+    client = app.test_client()
+    client.post("/admin/profile", json={"mode": mode, "seconds": 30}, headers=HEADERS)
+    statuses = []
+
+    def post():
+        statuses.append(app.test_client().post("/predict", json={}).status_code)
+
+    threads = [threading.Thread(target=post) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    entered.wait(timeout=5)
+    report = client.delete("/admin/profile", headers=HEADERS).json
+    assert tracemalloc.is_tracing() == (mode == "memory")
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [200, 200]
+    assert not tracemalloc.is_tracing()
+    if mode == "deterministic":
+        assert report["requests"] == 1
+
+
+def test_requires_the_admin_token(app, monkeypatch):
+    """
+    Tests that the route needs the token and does not exist without one.
+    """
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert install_profiler(app) is None
+    assert app.test_client().get("/admin/profile").status_code == 404
+
+    app = make_app()
+    install_profiler(app, token=TOKEN)
+    client = app.test_client()
+    assert client.get("/admin/profile").status_code == 401
+    wrong = {"Authorization": "Bearer wrong"}
+    assert client.post("/admin/profile", json={}, headers=wrong).status_code == 401
+    assert client.get("/admin/profile", headers=HEADERS).status_code == 404
+    bad_mode = client.post("/admin/profile", json={"mode": "x"}, headers=HEADERS)
+    assert bad_mode.status_code == 400
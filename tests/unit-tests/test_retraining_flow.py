@@ -0,0 +1,100 @@
+"""
+test_retraining_flow.py
+This module contains tests for the drift-triggered retraining decision.
+"""
+
+import datetime
+
+import pytest
+
+from metrics_schema import (
+    WindowMetrics,
+    get_drift_sink,
+    last_retraining,
+    record_retraining,
+)
+from retraining_flow import RetrainPolicy, evaluate_drift
+
+START = datetime.datetime(2012, 6, 1)
+POLICY = RetrainPolicy(
+    prediction_drift=0.5,
+    drifted_columns=6,
+    windows=2,
+    cooldown=datetime.timedelta(hours=6),
+)
+
+
+def write_windows(sink, drifts, start=START):
+    sink.write_many(
+        WindowMetrics(
+            start + datetime.timedelta(days=i),
+            prediction_drift,
+            drifted_columns,
+            0.0,
+            {"temp": ("wasserstein", prediction_drift, prediction_drift > 0.1)},
+        )
+        for i, (prediction_drift, drifted_columns) in enumerate(drifts)
+    )
+    sink.flush()
+
+
+@pytest.fixture(name="sink")
+def fixture_sink(tmp_path):
+    with get_drift_sink(f"sqlite:///{tmp_path / 'metrics.db'}", "run-1") as sink:
+        sink.prepare()
+        yield sink
+
+
+def test_retrains_only_above_thresholds(sink):
+    """
+    Tests that the mean of the latest windows is compared with the
+    thresholds, and that no metrics means no retraining.
+    """
+    assert not evaluate_drift(sink, POLICY).retrain
+
+    # Old drift is outside the last two windows
+    write_windows(sink, [(0.9, 10), (0.2, 2), (0.3, 3)])
+    decision = evaluate_drift(sink, POLICY)
+    assert not decision.retrain
+    assert "below the thresholds" in decision.reason
+    assert decision.drift_timestamp == START + datetime.timedelta(days=2)
+
+    write_windows(sink, [(0.2, 9)], start=START + datetime.timedelta(days=3))
+    decision = evaluate_drift(sink, POLICY)
+    assert decision.retrain
+    assert decision.reason.startswith("drifted columns 6.0 >= 6")
+    assert decision.model_version == "run-1"
+    assert not evaluate_drift(sink, POLICY, model_version="run-2").retrain
+
+
+def test_cooldown_and_new_windows_gate_the_next_retraining(sink):
+    """
+    Tests that after a retraining the next one waits for new windows and
+    for the end of the cooldown.
+    """
+    write_windows(sink, [(0.7, 8), (0.8, 9)])
+    newest = START + datetime.timedelta(days=1)
+    triggered_at = datetime.datetime(2012, 6, 3, 12)
+    record_retraining(
+        sink,
+        triggered_at=triggered_at,
+        drift_timestamp=newest,
+        model_version="run-1",
+        status="promoted",
+        run_id="run-2",
+        registered_version="2",
+    )
+    assert last_retraining(sink)["drift_timestamp"] == newest
+
+    later = triggered_at + datetime.timedelta(days=1)
+    decision = evaluate_drift(sink, POLICY, now=later)
+    assert not decision.retrain
+    assert decision.reason.startswith("no windows after")
+
+    write_windows(sink, [(0.9, 9)], start=START + datetime.timedelta(days=2))
+    decision = evaluate_drift(
+        sink, POLICY, now=triggered_at + datetime.timedelta(hours=1)
+    )
+    assert not decision.retrain
+    assert "cooldown" in decision.reason
+    assert evaluate_drift(sink, POLICY, now=later).retrain
@@ -0,0 +1,77 @@
+"""
+test_sampled_drift.py
+This module contains tests for the sampled approximation of the drift engine.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from drift_engine import DriftEngine
+from reference_profile import ReferenceProfile
+from sampled_drift import SampledDriftEngine
+
+COLUMNS = ["temp", "holiday", "hr"]
+
+
+def make_frame(seed, size, shift=0.0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "temp": rng.normal(0.5 + shift, 0.2, size).round(2),
+            "holiday": rng.integers(0, 2, size),
+            "hr": rng.integers(0, 24, size),
+            "season": rng.integers(1, 5, size),
+        }
+    )
+
+
+@pytest.fixture(name="engine")
+def fixture_engine():
+    return DriftEngine(ReferenceProfile.build(make_frame(0, 5000), COLUMNS))
+
+
+def test_clear_verdicts_from_first_sample(engine):
+    """
+    Tests that columns far from the threshold are decided on the first
+    sample with the exact verdicts, and that small windows are scored
+    exactly.
+    """
+    for shift in (0.0, 0.1):
+        current = make_frame(1, 300_000, shift)
+        exact = engine.compute(current)
+        sampled = SampledDriftEngine(engine).compute(current)
+        assert sampled["sample_rows"] == 2000
+        assert not sampled["undecided"].any()
+        assert list(sampled["drifted"]) == list(exact["drifted"])
+    # Sampling hr and season as strata reproduces their shares exactly
+    assert sampled["score"][2] == pytest.approx(exact["score"][2])
+
+    current = make_frame(1, 20_000, 0.1)
+    sampled = SampledDriftEngine(engine).compute(current)
+    assert sampled["sample_rows"] == 20_000
+    np.testing.assert_array_equal(sampled["score"], engine.compute(current)["score"])
+
+
+def test_sample_grows_only_near_threshold(engine):
+    """
+    Tests that the sample grows while a verdict is uncertain, up to
+    max_rows, and that an affordable window is then scored exactly.
+    """
+    current = make_frame(1, 300_000, 0.02)
+    exact = engine.compute(current)
+    assert exact["score"][0] == pytest.approx(engine.threshold, abs=0.005)
+
+    capped = SampledDriftEngine(
+        engine, initial_rows=1000, max_rows=8000, bootstrap=20
+    ).compute(current)
+    assert capped["sample_rows"] == 8000
+    assert list(capped["undecided"]) == [True, False, False]
+    assert capped["score_low"][0] < engine.threshold <= capped["score_high"][0]
+
+    # Growing further would cost more than the exact scores
+    grown = SampledDriftEngine(
+        engine, initial_rows=1000, max_rows=20_000, bootstrap=20
+    ).compute(current)
+    assert grown["sample_rows"] == len(current)
+    assert list(grown["drifted"]) == list(exact["drifted"])
@@ -0,0 +1,158 @@
+"""
+test_snapshot_store.py
+This module contains tests for the compact store of Evidently snapshots.
+"""
+
+import datetime
+import glob
+import json
+import os
+import shutil
+
+import pytest
+
+from snapshot_store import (
+    apply_retention,
+    compact,
+    flatten_snapshot,
+    ingest,
+    load_index,
+    prune_reports,
+    query_metrics,
+)
+
+ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+SNAPSHOTS = sorted(
+    glob.glob(os.path.join(ROOT, "*", "workspace", "*", "snapshots", "*.json"))
+)
+PROJECT = "bike-project"
+
+
+@pytest.fixture(name="workspace")
+def fixture_workspace(tmp_path):
+    directory = tmp_path / "workspace" / PROJECT / "snapshots"
+    directory.mkdir(parents=True)
+    # The repository's snapshots, two in August and two in September
+    for day, path in enumerate(SNAPSHOTS):
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        snapshot["id"] = f"snapshot-{day}"
+        snapshot["timestamp"] = f"2024-{8 + day // 2:02d}-{10 + day:02d}T12:00:00"
+        with open(directory / f"snapshot-{day}.json", "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+    return tmp_path / "workspace"
+
+
+def test_queries_read_only_overlapping_parts(workspace, tmp_path):
+    """
+    Tests that ingested values can be queried by time range and metric, that
+    ingesting again adds nothing and that compaction keeps the values.
+    """
+    store = str(tmp_path / "store")
+    assert ingest([str(workspace)], store) == 4
+    assert ingest([str(workspace)], store) == 0
+    index = load_index(store)
+    assert len(index["snapshots"]) == 4
+    assert [part["start"][:7] for part in index["parts"]] == ["2024-08", "2024-09"]
+
+    rows = query_metrics(
+        store,
+        start="2024-08-11",
+        end="2024-09-13",
+        metric_id="DatasetSummaryMetric",
+        field_path="current.number_of_rows",
+    )
+    assert rows["snapshot_id"].tolist() == ["snapshot-1", "snapshot-2"]
+    assert rows["value"].tolist() == [5214.0, 5214.0]
+    assert set(query_metrics(store)["metric_id"]) >= {
+        "ColumnSummaryMetric",
+        "DatasetSummaryMetric",
+    }
+    assert query_metrics(store, start="2025-01-01").empty
+
+    # A second ingest in August adds a part file, which compaction merges
+    more = tmp_path / "more" / PROJECT / "snapshots"
+    shutil.copytree(workspace / PROJECT / "snapshots", more)
+    for path in list(more.iterdir()):
+        snapshot = json.loads(path.read_text(encoding="utf-8"))
+        snapshot["id"] = f"late-{snapshot['id']}"
+        snapshot["timestamp"] = snapshot["timestamp"].replace("2024-09", "2024-08")
+        (more / f"{snapshot['id']}.json").write_text(json.dumps(snapshot))
+        path.unlink()
+    assert ingest([str(tmp_path / "more")], store) == 4
+    before = query_metrics(store)
+    compact(store)
+    assert len(load_index(store)["parts"]) == 2
+    assert len(glob.glob(os.path.join(store, PROJECT, "*", "*.parquet"))) == 2
+    compacted = query_metrics(store)
+    assert (
+        len(compacted) == len(before) == 4 * len(query_metrics(store, end="2024-08-11"))
+    )
+
+
+def test_retention_keeps_recent_and_last_snapshots(workspace, tmp_path):
+    """
+    Tests that only ingested snapshots outside the retention policy are
+    deleted, and that HTML reports follow the same policy.
+    """
+    store = str(tmp_path / "store")
+    directory = workspace / PROJECT / "snapshots"
+    ingest([str(workspace)], store)
+    (directory / "not-ingested.json").write_text("{}")
+
+    now = datetime.datetime(2024, 9, 20)
+    deleted = apply_retention(store, keep_days=10, keep_last=1, now=now)
+    assert sorted(os.path.basename(path) for path in deleted) == [
+        "snapshot-0.json",
+        "snapshot-1.json",
+    ]
+    assert sorted(path.name for path in directory.iterdir()) == [
+        "not-ingested.json",
+        "snapshot-2.json",
+        "snapshot-3.json",
+    ]
+    assert apply_retention(store, keep_days=0, keep_last=1, now=now)[0].endswith(
+        "snapshot-2.json"
+    )
+    # The values of deleted snapshots stay queryable
+    assert query_metrics(store)["snapshot_id"].nunique() == 4
+
+    reports = tmp_path / "reports"
+    reports.mkdir()
+    for day in range(3):
+        path = reports / f"report-{day}.html"
+        path.write_text("<html></html>")
+        stamp = datetime.datetime(2024, 9, 1 + day).timestamp()
+        os.utime(path, (stamp, stamp))
+    deleted = prune_reports(str(reports), keep_days=18, keep_last=1, now=now)
+    assert [os.path.basename(path) for path in deleted] == ["report-0.html"]
+
+
+def test_only_numeric_scalars_are_stored():
+    """
+    Tests that NaNs, booleans, strings and lists are not stored as values.
+    """
+    snapshot = {
+        "id": "snapshot-0",
+        "timestamp": "2024-08-10T12:00:00",
+        "suite": {
+            "metrics": [{"type": "metrics.ColumnDriftMetric", "column_name": "temp"}],
+            "metric_results": [
+                {
+                    "type": "ColumnDriftMetricResult",
+                    "drift_score": 0.25,
+                    "number_of_rows": 24,
+                    "drift_detected": True,
+                    "stattest_name": "Wasserstein distance (normed)",
+                    "current": {"mean": float("nan"), "counts": [1, 2]},
+                }
+            ],
+        },
+    }
+
+    rows = flatten_snapshot(snapshot)
+
+    assert list(zip(rows["field_path"], rows["value"])) == [
+        ("drift_score", 0.25),
+        ("number_of_rows", 24.0),
+    ]
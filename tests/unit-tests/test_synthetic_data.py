@@ -0,0 +1,63 @@
+"""
+test_synthetic_data.py
+This module contains tests for the synthetic bike demand generator.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset_partitions import HOUR_DTYPES, SOURCE_PATH
+from synthetic_data import fit_profile, generate_chunks, write_synthetic
+
+
+@pytest.fixture(name="profile", scope="module")
+def fixture_profile():
+    return fit_profile()
+
+
+def test_output_does_not_depend_on_chunk_size(profile):
+    """
+    Tests that small chunks produce the same rows, with the schema of
+    hour.csv, as one large chunk.
+    """
+    chunks = list(generate_chunks(profile, years=1, stations=3, chunk_rows=1000))
+    small = pd.concat(chunks, ignore_index=True)
+    large = pd.concat(
+        generate_chunks(profile, years=1, stations=3, chunk_rows=10**6),
+        ignore_index=True,
+    )
+
+    assert len(chunks) > 1
+    pd.testing.assert_series_equal(
+        small.dtypes, pd.read_csv(SOURCE_PATH, dtype=HOUR_DTYPES, nrows=1).dtypes
+    )
+    assert len(small) == 365 * 24 * 3
+    assert small["instant"].tolist() == list(range(1, len(small) + 1))
+    pd.testing.assert_frame_equal(small, large)
+
+
+def test_keeps_seasonality_and_correlations(tmp_path):
+    """
+    Tests that the generated data keeps the calendar, seasonality and
+    correlations of hour.csv.
+    """
+    real = pd.read_csv(SOURCE_PATH)
+    path = tmp_path / "hour.csv"
+    assert write_synthetic(str(path), years=2) == 2 * 366 * 24 - 24
+    synthetic = pd.read_csv(path)
+
+    days = synthetic.drop_duplicates("dteday").set_index("dteday")
+    real_days = real.drop_duplicates("dteday").set_index("dteday")
+    calendar = ["season", "holiday", "weekday", "workingday"]
+    pd.testing.assert_frame_equal(days[calendar], real_days[calendar])
+
+    for column in ["temp", "cnt"]:
+        by_month = synthetic.groupby("mnth")[column].mean()
+        assert np.corrcoef(by_month, real.groupby("mnth")[column].mean())[0, 1] > 0.9
+    by_hour = synthetic.groupby("hr")["cnt"].mean()
+    assert np.corrcoef(by_hour, real.groupby("hr")["cnt"].mean())[0, 1] > 0.95
+
+    columns = ["temp", "atemp", "hum", "windspeed", "cnt"]
+    difference = synthetic[columns].corr() - real[columns].corr()
+    assert difference.abs().to_numpy().max() < 0.1
@@ -0,0 +1,119 @@
+"""
+test_task_profiling.py
+This module contains tests for the task profiling decorator.
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import task_profiling
+
+
+def test_profile_task_records_run():
+    """
+    Tests that a decorated call records timings and input/output sizes.
+    """
+    task_profiling.clear_task_profiles()
+
+    @task_profiling.profile_task
+    def double(values):
+        return values * 2
+
+    result = double(np.ones(1000))
+
+    assert result.sum() == 2000
+    records = task_profiling.get_task_profiles()
+    assert len(records) == 1
+    record = records[0]
+    assert record["task"] == "double"
+    assert record["wall_s"] >= 0
+    assert record["cpu_s"] >= 0
+    assert record["peak_rss_mb"] > 0
+    assert record["input_bytes"] == 8000
+    assert record["output_bytes"] == 8000
+    assert record["pstats_path"] is None
+
+
+def test_slow_tasks_keep_cprofile_dump(tmp_path, monkeypatch):
+    """
+    Tests that a cProfile dump is kept only for tasks above the threshold.
+    """
+    task_profiling.clear_task_profiles()
+    monkeypatch.setattr(task_profiling, "PROFILE_DIR", str(tmp_path))
+
+    @task_profiling.profile_task(slow_threshold=0.0)
+    def slow():
+        return sum(range(10000))
+
+    @task_profiling.profile_task(slow_threshold=3600.0)
+    def fast():
+        return 1
+
+    slow()
+    fast()
+
+    records = task_profiling.get_task_profiles()
+    assert len(records) == 2
+    slow_record, fast_record = records[0], records[1]
+    assert slow_record["pstats_path"].startswith(str(tmp_path))
+    assert fast_record["pstats_path"] is None
+
+    with open(task_profiling.write_task_profiles(), encoding="utf-8") as f:
+        profile = json.load(f)
+    assert [r["task"] for r in profile["tasks"]] == ["slow", "fast"]
+
+
+def test_peak_rss_is_measured_per_task_run():
+    """
+    Tests that a task run after a memory-hungry one reports its own peak
+    RSS, not the peak of the process so far.
+    """
+    task_profiling.clear_task_profiles()
+
+    @task_profiling.profile_task
+    def large():
+        return float(np.ones(200 * 1024 * 1024 // 8).sum())
+
+    @task_profiling.profile_task
+    def small():
+        return 1
+
+    large()
+    small()
+
+    records = task_profiling.get_task_profiles()
+    assert len(records) == 2
+    large_record, small_record = records[0], records[1]
+    if task_profiling.psutil is None and not os.path.exists("/proc/self/statm"):
+        pytest.skip("RSS can only be sampled with psutil or /proc")
+    assert large_record["peak_rss_mb"] - small_record["peak_rss_mb"] > 100
+
+
+def test_cpu_time_includes_worker_threads():
+    """
+    Tests that the CPU time of a task counts the threads it waits for.
+    """
+    task_profiling.clear_task_profiles()
+
+    def spin(seconds):
+        end = time.process_time() + seconds
+        while time.process_time() < end:
+            pass
+
+    @task_profiling.profile_task
+    def threaded():
+        worker = threading.Thread(target=spin, args=(0.2,))
+        worker.start()
+        worker.join()
+
+    threaded()
+
+    records = task_profiling.get_task_profiles()
+    assert len(records) == 1
+    record = records[0]
+    assert record["cpu_s"] >= 0.2
@@ -0,0 +1,99 @@
+"""
+test_trainers.py
+This module contains tests for the trainer backends and multi-output models.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import HistGradientBoostingRegressor
+
+import model_format
+import trainers
+from dataset_partitions import SOURCE_PATH
+from features import DEFAULT_TRANSFORMER, TARGETS
+
+
+@pytest.fixture(name="hours", scope="module")
+def fixture_hours():
+    df = pd.read_csv(SOURCE_PATH, nrows=5000)
+    return DEFAULT_TRANSFORMER.transform(df), df["cnt"].to_numpy()
+
+
+def test_prebinned_boosting_matches_sklearn_binning(hours, tmp_path):
+    """
+    Tests that boosting on cached bin codes predicts like sklearn's own
+    binning, and that the memory-mapped copy takes raw features.
+    """
+    X, y = hours
+    model, stats = trainers.train(X, y, "hist_gradient_boosting", threads=1)
+    reference = HistGradientBoostingRegressor(**trainers.BOOSTING_PARAMS).fit(X, y)
+
+    assert stats["trainer"] == "hist_gradient_boosting"
+    assert stats["threads"] == 1
+    assert model.estimator_.n_iter_ == reference.n_iter_ < 1000
+    np.testing.assert_allclose(model.predict(X), reference.predict(X))
+
+    mapped = model_format.load_model(
+        model_format.save_model(model, tmp_path / "boosting.bkm")
+    )
+    np.testing.assert_allclose(mapped.predict(X[:100]), model.predict(X[:100]))
+
+
+def test_bins_are_cached_by_fingerprint(hours, tmp_path):
+    """
+    Tests that the bins of a matrix are computed once, that code <= k means
+    value <= edges[k], and that other data gets other bins.
+    """
+    X, _ = hours
+    edges, codes = trainers.load_or_bin(X, cache_dir=str(tmp_path))
+    assert codes.dtype == np.uint8
+    assert len(list(tmp_path.iterdir())) == 1
+    for j, column_edges in enumerate(edges):
+        # A constant column has one bin and no edge
+        for k in {0, len(column_edges) - 1} if len(column_edges) else ():
+            np.testing.assert_array_equal(codes[:, j] <= k, X[:, j] <= column_edges[k])
+
+    cached_edges, cached_codes = trainers.load_or_bin(X, cache_dir=str(tmp_path))
+    np.testing.assert_array_equal(cached_codes, codes)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    trainers.load_or_bin(X[:100], cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 2
+    with pytest.raises(ValueError, match="Unknown trainer"):
+        trainers.train(X, X[:, 0], "xgboost")
+
+
+def test_multi_output_tree_predicts_every_target(tmp_path):
+    """
+    Tests that one decision tree predicts cnt, casual and registered, that
+    its memory-mapped copy names its outputs, and that the boosting backend
+    refuses several targets.
+    """
+    df = pd.read_csv(SOURCE_PATH, nrows=2000)
+    X, y = DEFAULT_TRANSFORMER.transform(df), df[TARGETS]
+    model, _ = trainers.train(X, y, "decision_tree")
+    assert model.predict(X).shape == (len(X), 3)
+
+    mapped = model_format.load_model(
+        model_format.save_model(model, tmp_path / "multi.bkm", TARGETS)
+    )
+    outputs = model_format.split_outputs(mapped, mapped.predict(X))
+    assert list(outputs) == TARGETS
+    for i, target in enumerate(TARGETS):
+        np.testing.assert_array_equal(outputs[target], model.predict(X)[:, i])
+    # The unpruned tree fits the training rows, where cnt = casual + registered
+    np.testing.assert_array_equal(
+        outputs["cnt"], outputs["casual"] + outputs["registered"]
+    )
+
+    single = model_format.load_model(
+        model_format.save_model(
+            trainers.train(X, y["casual"])[0], tmp_path / "casual.bkm", ["casual"]
+        )
+    )
+    assert list(model_format.split_outputs(single, single.predict(X))) == ["casual"]
+    with pytest.raises(ValueError, match="output names"):
+        model_format.save_model(model, tmp_path / "bad.bkm", ["cnt"])
+    with pytest.raises(ValueError, match="fits one target"):
+        trainers.train(X, y, "hist_gradient_boosting", threads=1)
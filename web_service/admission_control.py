@@ -0,0 +1,269 @@
+"""
+admission_control.py
+Admission control and deadline-aware load shedding for the prediction
+service.
+
+At most ``max_concurrent`` requests to the controlled endpoints run at once;
+up to ``max_queued`` more wait for a slot, for at most ``max_wait_ms``. A
+request that finds the queue full is rejected with 429, one that cannot get
+a slot in time with 503, both with a ``Retry-After`` header.
+
+Clients may send ``X-Request-Deadline``, the Unix time (in seconds) after
+which nobody waits for the answer. A request past its deadline, or one that
+would finish after it given the recent service time, is rejected with 503
+when it arrives or as soon as waiting longer would make it late. The
+service time estimate decays while no request completes, so a single slow
+request (the first one, which loads the model) sheds requests for a few
+seconds at most. Requests
+are admitted in a ``before_request`` hook, so rejected ones are never
+parsed, validated or predicted.
+
+``GET /metrics`` returns the counters in the Prometheus text format, for
+the autoscaler: requests admitted and shed (by reason), requests running
+and queued, and a histogram of the time spent in the queue.
+
+Settings default to the environment: MAX_CONCURRENT_PREDICTIONS (the CPU
+count), MAX_QUEUED_PREDICTIONS (4 per slot) and MAX_QUEUE_WAIT_MS (1000).
+"""
+
+import math
+import os
+import threading
+import time
+
+from flask import Response, g, jsonify, request
+
+DEADLINE_HEADER = "X-Request-Deadline"
+MAX_WAIT_MS = 1000
+QUEUE_PER_SLOT = 4
+# Upper bounds of the queue time histogram, in seconds
+QUEUE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Weight of the latest request in the moving average of the service time
+SERVICE_TIME_ALPHA = 0.1
+# The estimate halves every this many seconds without an admitted request,
+# so one slow request cannot shed every later request with a deadline
+SERVICE_TIME_HALF_LIFE = 1.0
+SHED_REASONS = (
+    "deadline_exceeded",
+    "deadline_unreachable",
+    "queue_full",
+    "queue_timeout",
+)
+# Rejections and their status codes; a full queue asks the client to slow down
+SHED_STATUS = {"queue_full": 429}
+
+
+class Shed(Exception):
+    """Raised when a request is rejected instead of admitted."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# Limits, counters and the service time estimate all change under the one
+# condition, so they stay together on the controller
+class AdmissionController:  # pylint: disable=too-many-instance-attributes
+    """Bounded concurrency with a bounded, deadline-aware wait queue."""
+
+    def __init__(
+        self,
+        max_concurrent=None,
+        max_queued=None,
+        max_wait_ms=None,
+        half_life=SERVICE_TIME_HALF_LIFE,
+    ):
+        """
+        Args:
+            max_concurrent: Requests running at once.
+            max_queued: Requests waiting for a slot.
+            max_wait_ms: Longest wait for a slot.
+            half_life: Seconds for the service time estimate to halve when
+                no request completes.
+        """
+        self.max_concurrent = max_concurrent or int(
+            os.environ.get("MAX_CONCURRENT_PREDICTIONS", os.cpu_count() or 1)
+        )
+        self.max_queued = (
+            max_queued
+            if max_queued is not None
+            else int(
+                os.environ.get(
+                    "MAX_QUEUED_PREDICTIONS", QUEUE_PER_SLOT * self.max_concurrent
+                )
+            )
+        )
+        self.max_wait = (
+            max_wait_ms
+            if max_wait_ms is not None
+            else float(os.environ.get("MAX_QUEUE_WAIT_MS", MAX_WAIT_MS))
+        ) / 1000
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = dict.fromkeys(SHED_REASONS, 0)
+        self.service_time = 0.0
+        self.half_life = half_life
+        self._estimated_at = time.monotonic()
+        self.queue_counts = [0] * (len(QUEUE_BUCKETS) + 1)
+        self.queue_seconds = 0.0
+        self._condition = threading.Condition()
+
+    def expected_service_time(self):
+        """The moving average of the service time, decayed since its update."""
+        age = time.monotonic() - self._estimated_at
+        return self.service_time * 0.5 ** (age / self.half_life)
+
+    def _reject(self, reason):
+        self.shed[reason] += 1
+        # Time for the requests ahead to drain, at the recent service time
+        backlog = (self.running + self.queued) / self.max_concurrent
+        raise Shed(reason, max(1, round(backlog * self.expected_service_time())))
+
+    def _observe_wait(self, seconds):
+        self.queue_seconds += seconds
+        bucket = next(
+            (i for i, bound in enumerate(QUEUE_BUCKETS) if seconds <= bound),
+            len(QUEUE_BUCKETS),
+        )
+        self.queue_counts[bucket] += 1
+
+    def acquire(self, deadline=None):
+        """Wait for a slot; raise Shed if the request is rejected.
+
+        Args:
+            deadline: Unix time after which the answer is useless.
+
+        Returns:
+            Seconds spent waiting for the slot.
+        """
+        start = time.monotonic()
+        with self._condition:
+            # Seconds left before the deadline
+            budget = None if deadline is None else deadline - time.time()
+            service_time = self.expected_service_time()
+            if budget is not None and budget <= 0:
+                self._reject("deadline_exceeded")
+            if budget is not None and budget < service_time:
+                self._reject("deadline_unreachable")
+            if self.running >= self.max_concurrent or self.queued:
+                if self.queued >= self.max_queued:
+                    self._reject("queue_full")
+                wait = self.max_wait
+                if budget is not None:
+                    # Stop waiting once the answer could no longer be on time
+                    wait = min(wait, budget - service_time)
+                self.queued += 1
+                try:
+                    available = self._condition.wait_for(
+                        lambda: self.running < self.max_concurrent, timeout=wait
+                    )
+                finally:
+                    self.queued -= 1
+                if not available:
+                    self._reject("queue_timeout")
+            self.running += 1
+            self.admitted += 1
+            waited = time.monotonic() - start
+            self._observe_wait(waited)
+            return waited
+
+    def release(self, seconds):
+        """Free a slot held for ``seconds`` of service."""
+        with self._condition:
+            self.running -= 1
+            estimate = self.expected_service_time()
+            self.service_time = estimate + SERVICE_TIME_ALPHA * (seconds - estimate)
+            self._estimated_at = time.monotonic()
+            self._condition.notify()
+
+    def metrics(self):
+        """The counters in the Prometheus text exposition format."""
+        with self._condition:
+            lines = [
+                "# TYPE predict_admitted_total counter",
+                f"predict_admitted_total {self.admitted}",
+                "# TYPE predict_shed_total counter",
+                *(
+                    f'predict_shed_total{{reason="{reason}"}} {count}'
+                    for reason, count in self.shed.items()
+                ),
+                "# TYPE predict_running gauge",
+                f"predict_running {self.running}",
+                "# TYPE predict_queued gauge",
+                f"predict_queued {self.queued}",
+                "# TYPE predict_concurrency_limit gauge",
+                f"predict_concurrency_limit {self.max_concurrent}",
+                "# TYPE predict_service_seconds gauge",
+                f"predict_service_seconds {self.expected_service_time():.6f}",
+                "# TYPE predict_queue_seconds histogram",
+            ]
+            cumulative = 0
+            for bound, count in zip(QUEUE_BUCKETS, self.queue_counts):
+                cumulative += count
+                lines.append(
+                    f'predict_queue_seconds_bucket{{le="{bound}"}} {cumulative}'
+                )
+            lines += [
+                f'predict_queue_seconds_bucket{{le="+Inf"}} {self.admitted}',
+                f"predict_queue_seconds_sum {self.queue_seconds:.6f}",
+                f"predict_queue_seconds_count {self.admitted}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def _deadline():
+    """The request's deadline, None if absent; raise ValueError if invalid."""
+    value = request.headers.get(DEADLINE_HEADER)
+    if value is None:
+        return None
+    deadline = float(value)
+    if not math.isfinite(deadline):
+        raise ValueError(value)
+    return deadline
+
+
+def install_admission_control(app, endpoints=("predict",), controller=None):
+    """Admit the requests of ``endpoints`` through an AdmissionController.
+
+    Args:
+        app: The Flask app.
+        endpoints: Endpoints whose requests are controlled.
+        controller: AdmissionController; one configured from the
+            environment by default.
+
+    Returns:
+        The AdmissionController.
+    """
+    controller = controller or AdmissionController()
+
+    @app.before_request
+    def admit():
+        if request.endpoint not in endpoints:
+            return None
+        try:
+            deadline = _deadline()
+        except ValueError:
+            return jsonify({"error": f"Invalid {DEADLINE_HEADER} header."}), 400
+        try:
+            controller.acquire(deadline)
+        except Shed as shed:
+            response = jsonify({"error": "Request shed.", "reason": shed.reason})
+            response.headers["Retry-After"] = str(shed.retry_after)
+            return response, SHED_STATUS.get(shed.reason, 503)
+        g.admitted_at = time.monotonic()
+        return None
+
+    @app.teardown_request
+    def release(_exception):
+        admitted_at = g.pop("admitted_at", None)
+        if admitted_at is not None:
+            controller.release(time.monotonic() - admitted_at)
+
+    app.add_url_rule(
+        "/metrics",
+        "metrics",
+        lambda: Response(controller.metrics(), mimetype="text/plain; version=0.0.4"),
+    )
+    return controller
@@ -1,15 +1,30 @@
+import datetime
+import json
+import logging
 import os
 import sys
+import threading
 import time
 
-import mlflow
-import pandas as pd
 import requests
 from flask import Flask, jsonify, request
 
-from constants import FEATURES  # Ensure this file exists and defines FEATURES
-
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+# pylint: disable=wrong-import-position
+from admission_control import install_admission_control
+from request_profiler import install_profiler
+
+from artifact_cache import fetch_artifact
+from features import (
+    DEFAULT_TRANSFORMER,
+    FEATURE_SPEC_FILENAME,
+    FeatureTransformer,
+    MissingFeaturesError,
+    NonNumericFeatureError,
+)
+from model_format import MODEL_EXTENSION, load_model, split_outputs
 
 
 def wait_for_mlflow_server(url, max_retries=30, delay=10):
@@ -34,29 +49,97 @@ def wait_for_mlflow_server(url, max_retries=30, delay=10):
 
 # Set the tracking URI from environment variable
 mlflow_uri = os.environ.get("MLFLOW_TRACKING_URI", "http://127.0.0.1:5000")
-mlflow.set_tracking_uri(mlflow_uri)
-
-print(f"Waiting for MLflow server at {mlflow_uri}")
-if not wait_for_mlflow_server(mlflow_uri):
-    raise Exception("MLflow server is not available. Exiting.")
-
-try:
-    # Load the model from MLflow
-    model_name = "DecisionTreeRegressor_registered"
-    # Get the latest model version
-    client = mlflow.tracking.MlflowClient()
-    latest_version = client.get_latest_versions(model_name, stages=["Production"])[
-        0
-    ].version
-    model_uri = f"models:/{model_name}/{latest_version}"
-
-    # Load the model
-    model = mlflow.sklearn.load_model(model_uri)
-    print(f"Successfully loaded model {model_name} version {latest_version}")
-
-except mlflow.exceptions.MlflowException as e:
-    print(f"Error loading model: {e}")
-    raise
+model_name = "DecisionTreeRegressor_registered"
+
+# Loaded by load_serving_model(), on startup or by the first request
+model = None
+transformer = None
+prediction_log = None
+# Concurrent first requests wait for one load instead of loading twice
+_model_lock = threading.Lock()
+
+
+def load_serving_model():
+    """Load the model, its feature transformer and the prediction log once.
+
+    Nothing is loaded at import: waiting for the MLflow server and fetching
+    artifacts happen here, so importing the module stays fast and offline.
+    """
+    if model is not None:
+        return model, transformer
+    with _model_lock:
+        if model is None:
+            _load_serving_model()
+    return model, transformer
+
+
+def _load_serving_model():
+    # pylint: disable=global-statement,import-outside-toplevel
+    global model, transformer, prediction_log
+    import mlflow
+    import mlflow.sklearn
+
+    mlflow.set_tracking_uri(mlflow_uri)
+
+    # Pinning the run skips the registry lookup; cached artifacts then need no network
+    model_run_id = os.environ.get("MODEL_RUN_ID")
+
+    if not model_run_id:
+        print(f"Waiting for MLflow server at {mlflow_uri}")
+        if not wait_for_mlflow_server(mlflow_uri):
+            raise Exception("MLflow server is not available. Exiting.")
+
+    try:
+        # Load the model from MLflow
+        if model_run_id:
+            latest_version = f"run {model_run_id}"
+            model_uri = f"runs:/{model_run_id}/model"
+        else:
+            # Get the latest model version
+            client = mlflow.tracking.MlflowClient()
+            production_version = client.get_latest_versions(
+                model_name, stages=["Production"]
+            )[0]
+            model_run_id = production_version.run_id
+            latest_version = production_version.version
+            model_uri = f"models:/{model_name}/{latest_version}"
+
+        # Prefer the memory-mapped artifact from the local cache, fall back to the
+        # MLflow sklearn flavour
+        try:
+            mapped_path = fetch_artifact(
+                model_run_id, f"models/DecisionTreeRegressor{MODEL_EXTENSION}"
+            )
+            loaded = load_model(mapped_path)
+        except (mlflow.exceptions.MlflowException, OSError, ValueError) as e:
+            print(f"Memory-mapped model unavailable ({e}), loading {model_uri}")
+            loaded = mlflow.sklearn.load_model(model_uri)
+
+        # Use the feature transformer the model was trained with
+        try:
+            transformer = FeatureTransformer.load(
+                fetch_artifact(model_run_id, f"models/{FEATURE_SPEC_FILENAME}")
+            )
+        except (mlflow.exceptions.MlflowException, OSError, ValueError) as e:
+            print(f"Feature spec unavailable ({e}), using the default features")
+            transformer = DEFAULT_TRANSFORMER
+        print(f"Successfully loaded model {model_name} version {latest_version}")
+
+    except mlflow.exceptions.MlflowException as e:
+        print(f"Error loading model: {e}")
+        raise
+
+    # Served records are appended as JSON lines for monitoring/online_drift.py
+    if os.environ.get("PREDICTION_LOG"):
+        prediction_log = logging.getLogger("predictions")
+        prediction_log.propagate = False
+        prediction_log.setLevel(logging.INFO)
+        log_handler = logging.FileHandler(os.environ["PREDICTION_LOG"])
+        log_handler.setFormatter(logging.Formatter("%(message)s"))
+        prediction_log.addHandler(log_handler)
+
+    model = loaded
+
 
 # Create a Flask app
 app = Flask(__name__)
@@ -71,37 +154,46 @@ def index():
 # Define a route for predictions
 @app.route("/predict", methods=["POST"])
 def predict():
-    """Handle prediction requests."""
+    """Handle prediction requests for one record or a list of records."""
     data = request.json  # Expecting JSON input
 
-    # Check if input data is present and is a dictionary
-    if not data or not isinstance(data, dict):
-        return jsonify({"error": "Invalid input. Expected a JSON object."}), 400
-
-    # Create a DataFrame from the input data
-    input_data = pd.DataFrame([data])
-
-    # Ensure all required features are present
-    missing_features = [
-        feature for feature in FEATURES if feature not in input_data.columns
-    ]
-    if missing_features:
+    # Check if input data is present and is a dictionary or a list of them
+    records = data if isinstance(data, list) else [data]
+    if not data or not all(isinstance(record, dict) for record in records):
         return (
-            jsonify({"error": f'Missing features: {", ".join(missing_features)}'}),
+            jsonify(
+                {"error": "Invalid input. Expected a JSON object or a list of them."}
+            ),
             400,
         )
 
-    # Select only the required features in the correct order
-    input_data = input_data[FEATURES]
+    served_model, feature_transformer = load_serving_model()
 
-    # Validate data types for each feature
-    for feature in FEATURES:
-        if not pd.api.types.is_numeric_dtype(input_data[feature]):
-            return jsonify({"error": f"Feature '{feature}' must be numeric."}), 400
+    # Build the feature matrix; this also checks presence and types of features
+    try:
+        input_data = feature_transformer.transform(data)
+    except (MissingFeaturesError, NonNumericFeatureError) as error:
+        return jsonify({"error": str(error)}), 400
 
     try:
-        prediction = model.predict(input_data)
-        return jsonify({"prediction": prediction.tolist()})
+        # One pass predicts every target of a multi-output model
+        outputs = split_outputs(served_model, served_model.predict(input_data))
+        prediction = next(iter(outputs.values()))
+        if prediction_log:
+            timestamp = datetime.datetime.now().isoformat()
+            for record, value in zip(records, prediction):
+                logged = {
+                    "timestamp": timestamp,
+                    **feature_transformer.select(record),
+                    "prediction": float(value),
+                }
+                prediction_log.info(json.dumps(logged))
+        response = {"prediction": prediction.tolist()}
+        if len(outputs) > 1:
+            response["predictions"] = {
+                target: values.tolist() for target, values in outputs.items()
+            }
+        return jsonify(response)
     except Exception as exception:
         return jsonify({"error": f"Prediction error: {str(exception)}"}), 500
 
@@ -115,10 +207,18 @@ def favicon():
 @app.route("/health", methods=["GET"])
 def health():
     """Health check endpoint."""
-    model_status = "loaded" if "model" in locals() else "not loaded"
+    model_status = "loaded" if model is not None else "not loaded"
     return jsonify({"status": "healthy", "model_status": model_status}), 200
 
 
+# Bounded concurrency and queue for /predict, shed counters on /metrics
+admission = install_admission_control(app)
+
+# Admin-only /admin/profile route, when ADMIN_TOKEN is set
+install_profiler(app)
+
+
 if __name__ == "__main__":
+    load_serving_model()
     port = int(os.environ.get("PORT", 8080))
     app.run(host="0.0.0.0", port=port)
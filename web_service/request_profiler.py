@@ -0,0 +1,426 @@
+"""
+request_profiler.py
+On-demand profiling of the prediction service.
+
+An admin starts a session with ``POST /admin/profile``; the next
+``requests`` requests to the profiled endpoints, or the requests of the next
+``seconds`` seconds, are profiled. ``GET /admin/profile`` returns the
+aggregated profile once the session is over and ``DELETE /admin/profile``
+ends it early. Add ``?format=text`` for the raw profile.
+
+Modes:
+    deterministic  every request under cProfile, merged into one pstats
+                   report
+    sampling       the stacks of the threads serving profiled requests,
+                   sampled every ``interval_ms`` by a background thread and
+                   returned as collapsed stacks (flamegraph.pl, speedscope);
+                   the overhead does not grow with the number of calls
+    memory         tracemalloc snapshots before and after every request: the
+                   call paths that allocated the most, and the peak
+
+The route only exists when ADMIN_TOKEN is set and requires the header
+``Authorization: Bearer <ADMIN_TOKEN>``. Profiling costs nothing when off:
+the profiled views are only wrapped while a session runs.
+"""
+
+import collections
+import cProfile
+import functools
+import hmac
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+from flask import Response, jsonify, request
+
+ADMIN_TOKEN_ENV = "ADMIN_TOKEN"
+MODES = ("deterministic", "sampling", "memory")
+DEFAULT_REQUESTS = 100
+MAX_SECONDS = 600
+DEFAULT_INTERVAL_MS = 5
+TRACEMALLOC_FRAMES = 25
+TOP = 50
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def collapse(frame):
+    """Stack of ``frame`` as ``outer;...;inner``, the collapsed stack format."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+# The report of each mode is accumulated in the session's own attributes
+class ProfilingSession:  # pylint: disable=too-many-instance-attributes
+    """Profiles requests until ``requests`` were seen or ``seconds`` passed."""
+
+    def __init__(
+        self,
+        mode,
+        requests=None,
+        seconds=None,
+        interval_ms=DEFAULT_INTERVAL_MS,
+        top=TOP,
+    ):
+        """
+        Args:
+            mode: One of MODES.
+            requests: Number of requests to profile.
+            seconds: Duration of the session.
+            interval_ms: Sampling interval of the sampling mode.
+            top: Entries kept in the pstats and memory reports.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode!r}, expected one of {MODES}.")
+        self.mode = mode
+        self.max_requests = requests
+        self.seconds = seconds
+        self.interval = interval_ms / 1000
+        self.top = top
+        self.started = time.time()
+        self.requests = 0
+        self._deadline = time.monotonic() + seconds if seconds else None
+        self._lock = threading.Lock()
+        self._stats = None
+        self._stacks = collections.Counter()
+        self._samples = 0
+        self._threads = collections.Counter()
+        self._allocations = collections.defaultdict(lambda: [0, 0])
+        self._peak = 0
+        self._stop = threading.Event()
+        self._sampler = None
+        self._started_tracemalloc = False
+        # Profiled requests in flight; tracing stops once none is left
+        self._active = 0
+        # Python 3.12+ refuses a second cProfile.Profile enabled at once
+        self._profiling = threading.Lock()
+
+        if mode == "sampling":
+            self._sampler = threading.Thread(
+                target=self._sample, name="request-profiler", daemon=True
+            )
+            self._sampler.start()
+        elif mode == "memory" and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+
+    def expired(self):
+        if self.max_requests is not None and self.requests >= self.max_requests:
+            return True
+        return self._deadline is not None and time.monotonic() >= self._deadline
+
+    def admit(self):
+        """Count a request; False once the session has enough of them."""
+        with self._lock:
+            if self.expired():
+                return False
+            self.requests += 1
+            return True
+
+    def run(self, view, *args, **kwargs):
+        """Call the view, profiled according to the mode.
+
+        A failure of the profiler is logged; the response is the view's.
+        """
+        with self._lock:
+            self._active += 1
+        try:
+            if self.mode == "deterministic":
+                return self._run_profiled(view, *args, **kwargs)
+            if self.mode == "sampling":
+                thread = threading.get_ident()
+                with self._lock:
+                    self._threads[thread] += 1
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    with self._lock:
+                        self._threads[thread] -= 1
+            return self._run_traced(view, *args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+                idle = self._active == 0
+            if idle and self._stop.is_set():
+                self._stop_tracing()
+
+    def _run_profiled(self, view, *args, **kwargs):
+        # A with block cannot skip the view when the lock is taken; the lock is
+        # released in the finally clause below
+        if not self._profiling.acquire(  # pylint: disable=consider-using-with
+            blocking=False
+        ):
+            # Another request is being profiled; this one is not counted
+            with self._lock:
+                self.requests -= 1
+            return view(*args, **kwargs)
+        try:
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(view, *args, **kwargs)
+            finally:
+                try:
+                    with self._lock:
+                        if self._stats is None:
+                            self._stats = pstats.Stats(profiler)
+                        else:
+                            self._stats.add(profiler)
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Could not record the request's profile.")
+        finally:
+            self._profiling.release()
+
+    def _run_traced(self, view, *args, **kwargs):
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        try:
+            before = tracemalloc.take_snapshot().filter_traces(ignore)
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+        except RuntimeError:  # the session has just been stopped
+            return view(*args, **kwargs)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            try:
+                self._record_allocations(before, start, ignore)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Could not record the request's allocations.")
+
+    def _record_allocations(self, before, start, ignore):
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+        differences = after.compare_to(before, "traceback")
+        with self._lock:
+            self._peak = max(self._peak, peak - start)
+            for difference in differences:
+                site = ";".join(
+                    f"{os.path.basename(frame.filename)}:{frame.lineno}"
+                    for frame in difference.traceback
+                )
+                allocation = self._allocations[site]
+                allocation[0] += difference.size_diff
+                allocation[1] += difference.count_diff
+
+    def _sample(self):
+        while not self._stop.wait(self.interval) and not self.expired():
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            with self._lock:
+                threads = [thread for thread, count in self._threads.items() if count]
+            for thread in threads:
+                frame = frames.get(thread)
+                if frame is not None:
+                    self._stacks[collapse(frame)] += 1
+                    self._samples += 1
+
+    def stop(self):
+        self._stop.set()
+        if (
+            self._sampler is not None
+            and self._sampler is not threading.current_thread()
+        ):
+            self._sampler.join()
+        with self._lock:
+            idle = self._active == 0
+        if idle:
+            self._stop_tracing()
+
+    def _stop_tracing(self):
+        """Stop tracemalloc if the session started it; run once idle."""
+        with self._lock:
+            started, self._started_tracemalloc = self._started_tracemalloc, False
+            if started:
+                tracemalloc.stop()
+
+    def status(self):
+        return {
+            "mode": self.mode,
+            "started": self.started,
+            "requests": self.requests,
+            "max_requests": self.max_requests,
+            "seconds": self.seconds,
+        }
+
+    def report(self):
+        """The aggregated profile, as JSON-serialisable values."""
+        report = dict(self.status(), elapsed=time.time() - self.started)
+        with self._lock:
+            if self.mode == "deterministic":
+                stream = io.StringIO()
+                if self._stats is not None:
+                    self._stats.stream = stream
+                    self._stats.sort_stats("cumulative").print_stats(self.top)
+                report["pstats"] = stream.getvalue()
+            elif self.mode == "sampling":
+                report["samples"] = self._samples
+                report["collapsed"] = "".join(
+                    f"{stack} {count}\n" for stack, count in self._stacks.most_common()
+                )
+            else:
+                allocations = sorted(
+                    self._allocations.items(), key=lambda item: -item[1][0]
+                )
+                report["peak_kb"] = self._peak / 1024
+                report["allocations"] = [
+                    {"site": site, "size_kb": size / 1024, "count": count}
+                    for site, (size, count) in allocations[: self.top]
+                ]
+        return report
+
+
+def report_text(report):
+    """The profile of a report in its native text format."""
+    if "pstats" in report:
+        return report["pstats"]
+    if "collapsed" in report:
+        return report["collapsed"]
+    return "".join(
+        f"{allocation['site']} {allocation['size_kb']:.1f}KiB {allocation['count']}\n"
+        for allocation in report["allocations"]
+    )
+
+
+class RequestProfiler:
+    """Wraps the views of ``endpoints`` while a profiling session runs."""
+
+    def __init__(self, app, endpoints=("predict",)):
+        self.app = app
+        self.endpoints = tuple(endpoints)
+        self.session = None
+        self.last_report = None
+        self._originals = {}
+        self._lock = threading.Lock()
+
+    def start(self, session):
+        """Start profiling; False if a session is already running."""
+        with self._lock:
+            if self.session is not None:
+                return False
+            self.session = session
+            for endpoint in self.endpoints:
+                view = self.app.view_functions[endpoint]
+                self._originals[endpoint] = view
+                self.app.view_functions[endpoint] = self._wrap(view, session)
+        return True
+
+    def _wrap(self, view, session):
+        @functools.wraps(view)
+        def profiled(*args, **kwargs):
+            if not session.admit():
+                self.finish(session)
+                return view(*args, **kwargs)
+            try:
+                return session.run(view, *args, **kwargs)
+            finally:
+                if session.expired():
+                    self.finish(session)
+
+        return profiled
+
+    def finish(self, session=None):
+        """End the running session (if it is ``session``) and keep its report."""
+        with self._lock:
+            if self.session is None or session not in (None, self.session):
+                return self.last_report
+            session, self.session = self.session, None
+            self.app.view_functions.update(self._originals)
+            self._originals = {}
+        session.stop()
+        self.last_report = session.report()
+        return self.last_report
+
+    def poll(self):
+        """The running session's status, or the report of the last one."""
+        session = self.session
+        if session is not None and session.expired():
+            return "finished", self.finish(session)
+        if session is not None:
+            return "running", session.status()
+        return "finished", self.last_report
+
+
+def _authorized(token):
+    header = request.headers.get("Authorization", "")
+    return header.startswith("Bearer ") and hmac.compare_digest(
+        header[len("Bearer ") :].encode(), token.encode()
+    )
+
+
+def _start_session(profiler):
+    options = request.get_json(silent=True) or {}
+    try:
+        requests_ = options.get("requests")
+        seconds = options.get("seconds")
+        if requests_ is None and seconds is None:
+            requests_ = DEFAULT_REQUESTS
+        if requests_ is not None and int(requests_) < 1:
+            raise ValueError("requests must be positive.")
+        if seconds is not None and not 0 < float(seconds) <= MAX_SECONDS:
+            raise ValueError(f"seconds must be in (0, {MAX_SECONDS}].")
+        session = ProfilingSession(
+            options.get("mode", "sampling"),
+            requests=None if requests_ is None else int(requests_),
+            seconds=None if seconds is None else float(seconds),
+            interval_ms=float(options.get("interval_ms", DEFAULT_INTERVAL_MS)),
+            top=int(options.get("top", TOP)),
+        )
+    except (TypeError, ValueError) as error:
+        return jsonify({"error": str(error)}), 400
+    if not profiler.start(session):
+        session.stop()
+        return jsonify({"error": "A profiling session is already running."}), 409
+    return jsonify({"status": "running", **session.status()}), 202
+
+
+def _respond(status, report):
+    if report is None:
+        return jsonify({"error": "No profiling session."}), 404
+    if status == "finished" and request.args.get("format") == "text":
+        return Response(report_text(report), mimetype="text/plain")
+    return jsonify({"status": status, **report}), 200
+
+
+def install_profiler(app, endpoints=("predict",), token=None):
+    """Add the /admin/profile route to ``app`` if an admin token is set.
+
+    Args:
+        app: The Flask app.
+        endpoints: Endpoints whose requests are profiled.
+        token: Admin token; defaults to the ADMIN_TOKEN environment variable.
+
+    Returns:
+        The RequestProfiler, or None when no token is set.
+    """
+    token = token or os.environ.get(ADMIN_TOKEN_ENV)
+    if not token:
+        return None
+    profiler = RequestProfiler(app, endpoints)
+
+    def admin_profile():
+        if not _authorized(token):
+            return jsonify({"error": "Unauthorized."}), 401
+        if request.method == "POST":
+            return _start_session(profiler)
+        if request.method == "DELETE":
+            return _respond("finished", profiler.finish())
+        return _respond(*profiler.poll())
+
+    app.add_url_rule(
+        "/admin/profile",
+        "admin_profile",
+        admin_profile,
+        methods=["GET", "POST", "DELETE"],
+    )
+    return profiler